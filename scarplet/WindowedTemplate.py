@@ -4,11 +4,292 @@
 import numexpr
 import numpy as np
 
+from functools import lru_cache
 from scipy.special import erf, erfinv
 
 np.seterr(divide='ignore', invalid='ignore')
 
 
+@lru_cache(maxsize=8)
+def get_grid(nx, ny, de):
+    """Return centered coordinate grids for template arrays
+
+    Grids are cached by shape and spacing and shared between templates, so
+    they are returned as read-only arrays.
+
+    Parameters
+    ----------
+    nx : int
+        Number of columns in template array
+    ny : int
+        Number of rows in template array
+    de : float
+        Spacing of template grid cells in data projection units
+
+    Returns
+    -------
+    x : numpy array
+        2-D array of x coordinates
+    y : numpy array
+        2-D array of y coordinates
+    """
+
+    x, y = get_axes(nx, ny, de)
+
+    x, y = np.meshgrid(x, y)
+    x.flags.writeable = False
+    y.flags.writeable = False
+
+    return x, y
+
+
+@lru_cache(maxsize=8)
+def get_axes(nx, ny, de):
+    """Return centered 1-D coordinates of template grid columns and rows
+
+    Returns
+    -------
+    x : numpy array
+        1-D array of x coordinates
+    y : numpy array
+        1-D array of y coordinates
+    """
+
+    x = de * np.linspace(1, nx, num=nx)
+    y = de * np.linspace(1, ny, num=ny)
+    x = x - np.mean(x)
+    y = y - np.mean(y)
+
+    x.flags.writeable = False
+    y.flags.writeable = False
+
+    return x, y
+
+
+@lru_cache(maxsize=1024)
+def window_bounds(nx, ny, de, an_x, an_y):
+    """Return numbers of rows and columns within border of template grid
+
+    Parameters
+    ----------
+    nx : int
+        Number of columns in template array
+    ny : int
+        Number of rows in template array
+    de : float
+        Spacing of template grid cells in dat projection units
+    an_x : float
+        Width of border in x direction in data projection units
+    an_y : float
+        Width of border in y direction in data projection units
+
+    Returns
+    -------
+    bounds : tuple
+        Numbers of (top, bottom, left, right) rows and columns in border
+    """
+
+    x, y = get_axes(nx, ny, de)
+    top = int(np.searchsorted(y, y[0] + an_y, side='left'))
+    bottom = ny - int(np.searchsorted(y, y[-1] - an_y, side='right'))
+    left = int(np.searchsorted(x, x[0] + an_x, side='left'))
+    right = nx - int(np.searchsorted(x, x[-1] - an_x, side='right'))
+
+    return top, bottom, left, right
+
+
+@lru_cache(maxsize=1024)
+def half_plane_bounds(nx, ny, de, alpha, sign=1):
+    """Return per-row column ranges of half plane in rotated coordinates
+
+    Gives the cells where sign * xr <= 0, with xr = x cos(alpha) + y
+    sin(alpha). As xr is monotonic along each row, the cells in each row form
+    a contiguous range.
+
+    Parameters
+    ----------
+    nx : int
+        Number of columns in template array
+    ny : int
+        Number of rows in template array
+    de : float
+        Spacing of template grid cells in dat projection units
+    alpha : float
+        Orientation of rotated coordinates in radians
+    sign : int, optional
+        Sign of rotated coordinate, default 1
+
+    Returns
+    -------
+    start : numpy array
+        First column of range in each row
+    stop : numpy array
+        Column after last column of range in each row
+    """
+
+    x, y = get_axes(nx, ny, de)
+
+    # A rounded sum a + b is <= 0 exactly when a <= -b, so comparing the
+    # rounded products gives the same cells as evaluating xr on the grid
+    a = sign * (x * np.cos(alpha))
+    b = -sign * (y * np.sin(alpha))
+
+    if a[-1] >= a[0]:
+        start = np.zeros(ny, dtype=int)
+        stop = np.searchsorted(a, b, side='right')
+    else:
+        start = nx - np.searchsorted(a[::-1], b, side='right')
+        stop = np.full(ny, nx, dtype=int)
+
+    start.flags.writeable = False
+    stop.flags.writeable = False
+
+    return start, stop
+
+
+def bounds_to_mask(bounds, nx, ny):
+    """Convert window border widths to mask array
+
+    Parameters
+    ----------
+    bounds : tuple
+        Numbers of (top, bottom, left, right) rows and columns in border
+    nx : int
+        Number of columns in template array
+    ny : int
+        Number of rows in template array
+
+    Returns
+    -------
+    mask : numpy array
+        Mask array for window edges
+    """
+
+    mask = np.zeros((ny, nx), dtype=bool)
+    return mask_window(mask, bounds, value=True)
+
+
+def ranges_to_mask(start, stop, nx):
+    """Convert per-row column ranges to mask array
+
+    Parameters
+    ----------
+    start : numpy array
+        First column of range in each row
+    stop : numpy array
+        Column after last column of range in each row
+    nx : int
+        Number of columns in template array
+
+    Returns
+    -------
+    mask : numpy array
+        Mask array with dimensions of (len(start), nx)
+    """
+
+    cols = np.arange(nx)
+    return (cols >= start[:, np.newaxis]) & (cols < stop[:, np.newaxis])
+
+
+def mask_window(array, bounds, value=0):
+    """Set values within window border in place
+
+    Cost scales with the number of border cells rather than the grid size.
+
+    Parameters
+    ----------
+    array : numpy array
+        Array with grid in last two dimensions
+    bounds : tuple
+        Numbers of (top, bottom, left, right) rows and columns in border, as
+        returned by window_bounds()
+    value : float, optional
+        Value to set, default 0
+
+    Returns
+    -------
+    array : numpy array
+        Masked array
+    """
+
+    top, bottom, left, right = bounds
+    ny, nx = array.shape[-2:]
+
+    array[..., :top, :] = value
+    array[..., max(ny - bottom, 0):, :] = value
+    array[..., :, :left] = value
+    array[..., :, max(nx - right, 0):] = value
+
+    return array
+
+
+def mask_ranges(array, start, stop, value=0):
+    """Set values within per-row column ranges in place
+
+    Parameters
+    ----------
+    array : numpy array
+        2-D array
+    start : numpy array
+        First column of range in each row
+    stop : numpy array
+        Column after last column of range in each row
+    value : float, optional
+        Value to set, default 0
+
+    Returns
+    -------
+    array : numpy array
+        Masked array
+    """
+
+    mask = ranges_to_mask(np.asarray(start), np.asarray(stop), array.shape[1])
+    array[mask] = value
+
+    return array
+
+
+def phase_ramp(nx, ny, dx, dy):
+    """Return stack of phase ramps that shift a grid by vectors of offsets
+
+    Multiplying the 2-D Fourier transform of a grid by a phase ramp shifts
+    the grid circularly by (dx, dy) cells. Offsets may be fractional.
+
+    Parameters
+    ----------
+    nx : int
+        Number of columns in grid
+    ny : int
+        Number of rows in grid
+    dx : float or numpy array
+        X offsets in cells
+    dy : float or numpy array
+        Y offsets in cells
+
+    Returns
+    -------
+    ramp : numpy array
+        Stack of complex phase ramps. Dimensions of (n, ny, nx).
+    """
+
+    dx, dy = _broadcast_parameters(dx, dy)
+    dx = dx[:, np.newaxis, np.newaxis]
+    dy = dy[:, np.newaxis, np.newaxis]
+    kx = np.fft.fftfreq(nx)[np.newaxis, :]
+    ky = np.fft.fftfreq(ny)[:, np.newaxis]
+
+    pi = np.pi
+    phase = numexpr.evaluate("-2 * pi * (kx * dx + ky * dy)")
+    return numexpr.evaluate("complex(cos(phase), sin(phase))")
+
+
+def _broadcast_parameters(*params):
+    """Broadcast template parameters to 1-D arrays of equal length"""
+
+    params = np.broadcast_arrays(*[np.atleast_1d(p) for p in params])
+    return [np.ravel(p).astype(float) for p in params]
+
+
 class WindowedTemplate(object):
     """Base class for windowed template function
 
@@ -26,6 +307,17 @@ class WindowedTemplate(object):
         Number of rows in template array
     de : float
         Spacing of template grid cells in dat projection units
+    symmetry_period : float
+        Smallest rotation in radians that leaves the template unchanged.
+        Zero for rotationally invariant templates, which are constructed
+        without an orientation argument.
+    antisymmetric : bool
+        True if rotating the template by half its symmetry period negates
+        it. Matching the rotated template gives the same SNR and an amplitude
+        of opposite sign.
+    template_sign : int
+        Sign of template relative to the template function it shares with
+        related variants (e.g. left- and right-facing scarps)
 
     Methods
     -------
@@ -33,10 +325,26 @@ class WindowedTemplate(object):
         Get arrays of coordinates for template grid points
     get_mask():
         Get mask array giving curvature extent of template window
+    get_window_bounds():
+        Get numbers of rows and columns in window border
     get_window_limits():
         Get mask array giving window extent
+    get_extent():
+        Get distance from center bounding template support and window border
+    template_stack(d, kt, alpha, nx, ny, de):
+        Get stack of template arrays for vectors of parameters
+    window_limits_stack(d, kt, alpha, nx, ny, de):
+        Get stack of window extent masks for vectors of parameters
+    window_bounds_stack(d, kt, alpha, nx, ny, de):
+        Get window border widths for vectors of parameters
+    err_mask_stack(d, kt, alpha, nx, ny, de):
+        Get stack of error masks for vectors of parameters
     """
 
+    symmetry_period = 2 * np.pi
+    antisymmetric = False
+    template_sign = 1
+
     def __init__(self):
 
         self.d = None
@@ -46,13 +354,95 @@ class WindowedTemplate(object):
         self.c = self.nx / 2. 
         self.de = None
 
-    def get_coordinates(self):
-        x = self.de * np.linspace(1, self.nx, num=self.nx)
-        y = self.de * np.linspace(1, self.ny, num=self.ny)
-        x = x - np.mean(x)
-        y = y - np.mean(y)
+    @classmethod
+    def _stack_instances(cls, method, d, kt, alpha, nx, ny, de, **kwargs):
+        """Stack output of a method over template instances for vectors of
+        parameters"""
+
+        params = zip(*_broadcast_parameters(d, kt, alpha))
+        if cls.symmetry_period == 0:
+            params = (p[:2] for p in params)
+
+        return np.stack([getattr(cls(*p, nx, ny, de, **kwargs), method)()
+                         for p in params])
+
+    @classmethod
+    def template_stack(cls, d, kt, alpha, nx, ny, de, **kwargs):
+        """Return stack of template functions for vectors of parameters
+
+        Parameters are broadcast against each other, so any of d, kt and
+        alpha may be scalars.
+
+        Parameters
+        ----------
+        d : float or numpy array
+            Scale of windowed template function in data projection units
+        kt : float or numpy array
+            Morphologic age (or other shape parameter) of template
+        alpha : float or numpy array
+            Orientation of windowed template function in radians
+        nx : int
+            Number of columns in template array
+        ny : int
+            Number of rows in template array
+        de : float
+            Spacing of template grid cells in dat projection units
 
-        x, y = np.meshgrid(x, y)
+        Returns
+        -------
+        W : numpy array
+            Stack of windowed template functions. Dimensions of (n, ny, nx).
+        """
+
+        return cls._stack_instances('template', d, kt, alpha, nx, ny, de,
+                                    **kwargs)
+
+    @classmethod
+    def window_limits_stack(cls, d, kt, alpha, nx, ny, de, **kwargs):
+        """Return stack of window extent masks for vectors of parameters
+
+        Returns
+        -------
+        mask : numpy array
+            Stack of window masks. Dimensions of (n, ny, nx).
+        """
+
+        return cls._stack_instances('get_window_limits', d, kt, alpha, nx, ny,
+                                    de, **kwargs)
+
+    @classmethod
+    def window_bounds_stack(cls, d, kt, alpha, nx, ny, de, **kwargs):
+        """Return window border widths for vectors of parameters
+
+        Returns
+        -------
+        bounds : numpy array
+            Numbers of (top, bottom, left, right) rows and columns in border
+            of each window. Dimensions of (n, 4).
+        """
+
+        return cls._stack_instances('get_window_bounds', d, kt, alpha, nx, ny,
+                                    de, **kwargs)
+
+    @classmethod
+    def err_mask_stack(cls, d, kt, alpha, nx, ny, de, **kwargs):
+        """Return stack of error masks for vectors of parameters
+
+        Returns
+        -------
+        mask : numpy array
+            Stack of error masks with dimensions of (n, ny, nx), or None if
+            template has no error mask.
+        """
+
+        if not hasattr(cls, 'get_err_mask'):
+            return None
+
+        return cls._stack_instances('get_err_mask', d, kt, alpha, nx, ny, de,
+                                    **kwargs)
+
+    def get_coordinates(self):
+        x, y = get_grid(self.nx, self.ny, self.de)
         xr = x * np.cos(self.alpha) + y * np.sin(self.alpha)
         yr = -x * np.sin(self.alpha) + y * np.cos(self.alpha)
 
@@ -63,7 +453,14 @@ class WindowedTemplate(object):
         mask = (abs(xr) < self.c) & (abs(yr) < self.d)
         return mask
 
-    def get_window_limits(self):
+    def get_window_bounds(self):
+        """Return numbers of rows and columns within window border
+
+        Returns
+        -------
+        bounds : tuple
+            Numbers of (top, bottom, left, right) rows and columns in border
+        """
 
         x4 = self.d*np.cos(self.alpha - np.pi/2)
         y4 = self.d*np.sin(self.alpha - np.pi/2)
@@ -72,16 +469,23 @@ class WindowedTemplate(object):
         an_y = abs((x4 - x1) + 2 * self.c * np.cos(self.alpha - np.pi/2))
         an_x = abs((y1 - y4) + 2 * self.c * np.sin(self.alpha - np.pi/2))
 
-        x = self.de*np.linspace(1, self.nx, num=self.nx)
-        y = self.de*np.linspace(1, self.ny, num=self.ny)
-        x = x - np.mean(x)
-        y = y - np.mean(y)
+        return window_bounds(self.nx, self.ny, self.de, float(an_x),
+                             float(an_y))
 
-        X, Y = np.meshgrid(x, y)
-        mask = ((X < (min(x) + an_x)) | (X > (max(x) - an_x))
-                | (Y < (min(y) + an_y)) | (Y > (max(y) - an_y)))
+    def get_window_limits(self):
+        return bounds_to_mask(self.get_window_bounds(), self.nx, self.ny)
 
-        return mask
+    def get_extent(self):
+        """Return distance from template center that bounds both the support
+        of the template and the width of its window border
+
+        Returns
+        -------
+        extent : float
+            Extent of template in data projection units
+        """
+
+        return np.sqrt(2) * self.d + 2 * self.c
 
 
 class Scarp(WindowedTemplate):
@@ -127,6 +531,8 @@ class Scarp(WindowedTemplate):
     and many references therein.
     """
 
+    antisymmetric = True
+
     def __init__(self, d, kt, alpha, nx, ny, de):
         """Constructor method for scarp template
 
@@ -165,19 +571,12 @@ class Scarp(WindowedTemplate):
             Windowed template function
         """
 
-        x = self.de * np.linspace(1, self.nx, num=self.nx)
-        y = self.de * np.linspace(1, self.ny, num=self.ny)
-        x = x - np.mean(x)
-        y = y - np.mean(y)
-
-        x, y = np.meshgrid(x, y)
-        xr = x * np.cos(self.alpha) + y * np.sin(self.alpha)
-        yr = -x * np.sin(self.alpha) + y * np.cos(self.alpha)
+        xr, yr = self.get_coordinates()
 
         W = (-xr / (2. * self.kt ** (3 / 2.) * np.sqrt(np.pi))) \
             * np.exp(-xr ** 2. / (4. * self.kt))
 
-        mask = self.get_mask()
+        mask = (abs(xr) < self.c) & (abs(yr) < self.d)
         W = W * mask
 
         return W
@@ -196,12 +595,7 @@ class Scarp(WindowedTemplate):
         c = self.c
         d = self.d
 
-        x = self.de * np.linspace(1, self.nx, num=self.nx)
-        y = self.de * np.linspace(1, self.ny, num=self.ny)
-        x = x - np.mean(x)
-        y = y - np.mean(y)
-
-        x, y = np.meshgrid(x, y)
+        x, y = get_grid(self.nx, self.ny, self.de)
         xr = numexpr.evaluate("x * cos(alpha) + y * sin(alpha)")
         yr = numexpr.evaluate("-x * sin(alpha) + y * cos(alpha)")
 
@@ -214,6 +608,109 @@ class Scarp(WindowedTemplate):
 
         return W
 
+    @classmethod
+    def template_stack(cls, d, kt, alpha, nx, ny, de):
+        """Return stack of template functions for vectors of parameters
+
+        Templates for all parameter combinations are evaluated in a single
+        broadcasted numexpr expression over a cached coordinate grid.
+
+        Parameters
+        ----------
+        d : float or numpy array
+            Scale of windowed template function in data projection units
+        kt : float or numpy array
+            Morphologic age of template in m2
+        alpha : float or numpy array
+            Orientation of windowed template function in radians
+        nx : int
+            Number of columns in template array
+        ny : int
+            Number of rows in template array
+        de : float
+            Spacing of template grid cells in dat projection units
+
+        Returns
+        -------
+        W : numpy array
+            Stack of windowed template functions. Dimensions of (n, ny, nx).
+        """
+
+        x, y = get_grid(nx, ny, de)
+        d, kt, alpha = _broadcast_parameters(d, kt, alpha)
+
+        frac = 0.9
+        c = abs(2 * np.sqrt(kt) * erfinv(frac))
+
+        d, kt, c = [p[:, np.newaxis, np.newaxis] for p in (d, kt, c)]
+        ca = np.cos(-alpha)[:, np.newaxis, np.newaxis]
+        sa = np.sin(-alpha)[:, np.newaxis, np.newaxis]
+
+        pi = np.pi
+        W = numexpr.evaluate("where((abs(x * ca + y * sa) < c) \
+                             & (abs(-x * sa + y * ca) < d), \
+                             (-(x * ca + y * sa) / (2 * kt ** 1.5 * sqrt(pi))) \
+                             * exp(-(x * ca + y * sa) ** 2 / (4 * kt)), 0)")
+
+        return W
+
+    @classmethod
+    def window_limits_stack(cls, d, kt, alpha, nx, ny, de):
+        """Return stack of window extent masks for vectors of parameters
+
+        Returns
+        -------
+        mask : numpy array
+            Stack of window masks. Dimensions of (n, ny, nx).
+        """
+
+        bounds = cls.window_bounds_stack(d, kt, alpha, nx, ny, de)
+        mask = np.zeros((len(bounds), ny, nx), dtype=bool)
+        for this_mask, these_bounds in zip(mask, bounds):
+            mask_window(this_mask, these_bounds, value=True)
+
+        return mask
+
+    @classmethod
+    def window_bounds_stack(cls, d, kt, alpha, nx, ny, de):
+        """Return window border widths for vectors of parameters
+
+        Returns
+        -------
+        bounds : numpy array
+            Numbers of (top, bottom, left, right) rows and columns in border
+            of each window. Dimensions of (n, 4).
+        """
+
+        d, kt, alpha = _broadcast_parameters(d, kt, alpha)
+
+        frac = 0.9
+        c = abs(2 * np.sqrt(kt) * erfinv(frac))
+        alpha = -alpha
+
+        x4 = d * np.cos(alpha - np.pi/2)
+        y4 = d * np.sin(alpha - np.pi/2)
+        x1 = d * np.cos(alpha)
+        y1 = d * np.sin(alpha)
+        an_y = abs((x4 - x1) + 2 * c * np.cos(alpha - np.pi/2))
+        an_x = abs((y1 - y4) + 2 * c * np.sin(alpha - np.pi/2))
+
+        return np.array([window_bounds(nx, ny, de, float(this_an_x),
+                                       float(this_an_y))
+                         for this_an_x, this_an_y in zip(an_x, an_y)],
+                        dtype=int).reshape(-1, 4)
+
+    @classmethod
+    def _rotated_x_stack(cls, alpha, nx, ny, de):
+        """Return stack of rotated x coordinates for vector of orientations"""
+
+        x, y = get_grid(nx, ny, de)
+        alpha, = _broadcast_parameters(alpha)
+        ca = np.cos(-alpha)[:, np.newaxis, np.newaxis]
+        sa = np.sin(-alpha)[:, np.newaxis, np.newaxis]
+
+        return numexpr.evaluate("x * ca + y * sa")
+
 
 class RightFacingUpperBreakScarp(Scarp):
     """Template for upper slope break of vertical scarp (right-facting)
@@ -239,10 +736,15 @@ class RightFacingUpperBreakScarp(Scarp):
     -------
     get_error_mask():
         Return mask array that masks the lower slope break of scarp
+    get_err_bounds():
+        Return row ranges that mask the lower slope break of scarp
     template():
         Returns array of windowed template function
     """
 
+    antisymmetric = False
+    template_sign = -1
+
     def template(self):
         """Return template function (uses numexpr where possible)
 
@@ -262,9 +764,47 @@ class RightFacingUpperBreakScarp(Scarp):
         mask : numpy array
             Mask array for lower half of scarp
         """
-        xr, _ = self.get_coordinates()
-        mask = xr <= 0
-        return mask
+        start, stop = self.get_err_bounds()
+        return ranges_to_mask(start, stop, self.nx)
+
+    def get_err_bounds(self):
+        """Return per-row column ranges masking the lower half of scarp
+
+        Returns
+        -------
+        start : numpy array
+            First masked column in each row
+        stop : numpy array
+            Column after last masked column in each row
+        """
+        return half_plane_bounds(self.nx, self.ny, self.de, self.alpha, 1)
+
+    @classmethod
+    def template_stack(cls, d, kt, alpha, nx, ny, de):
+        """Return stack of template functions for vectors of parameters
+
+        Returns
+        -------
+        W : numpy array
+            Stack of windowed template functions. Dimensions of (n, ny, nx).
+        """
+
+        W = super().template_stack(d, kt, alpha, nx, ny, de)
+        return numexpr.evaluate("-W")
+
+    @classmethod
+    def err_mask_stack(cls, d, kt, alpha, nx, ny, de):
+        """Return stack of masks masking the lower half of scarp
+
+        Returns
+        -------
+        mask : numpy array
+            Stack of error masks. Dimensions of (n, ny, nx).
+        """
+
+        _, _, alpha = _broadcast_parameters(d, kt, alpha)
+        xr = cls._rotated_x_stack(alpha, nx, ny, de)
+        return numexpr.evaluate("xr <= 0")
 
 
 class LeftFacingUpperBreakScarp(Scarp):
@@ -289,8 +829,12 @@ class LeftFacingUpperBreakScarp(Scarp):
     -------
     get_error_mask():
         Return mask array that masks the lower slope break of scarp
+    get_err_bounds():
+        Return row ranges that mask the lower slope break of scarp
     """
 
+    antisymmetric = False
+
     def get_err_mask(self):
         """Return mask array masking the lower half of scarp
 
@@ -299,9 +843,34 @@ class LeftFacingUpperBreakScarp(Scarp):
         mask : numpy array
             Mask array for lower hald of scarp
         """
-        xr, _ = self.get_coordinates()
-        mask = xr >= 0
-        return mask
+        start, stop = self.get_err_bounds()
+        return ranges_to_mask(start, stop, self.nx)
+
+    def get_err_bounds(self):
+        """Return per-row column ranges masking the lower half of scarp
+
+        Returns
+        -------
+        start : numpy array
+            First masked column in each row
+        stop : numpy array
+            Column after last masked column in each row
+        """
+        return half_plane_bounds(self.nx, self.ny, self.de, self.alpha, -1)
+
+    @classmethod
+    def err_mask_stack(cls, d, kt, alpha, nx, ny, de):
+        """Return stack of masks masking the lower half of scarp
+
+        Returns
+        -------
+        mask : numpy array
+            Stack of error masks. Dimensions of (n, ny, nx).
+        """
+
+        _, _, alpha = _broadcast_parameters(d, kt, alpha)
+        xr = cls._rotated_x_stack(alpha, nx, ny, de)
+        return numexpr.evaluate("xr >= 0")
 
 
 class ShiftedTemplateMixin(WindowedTemplate):
@@ -334,6 +903,8 @@ class ShiftedTemplateMixin(WindowedTemplate):
         Set offset attrivutes t odx and dy
     shift_template(W, dx, dy):
         Shift template array W by dx and dy
+    offset_template_stack(dx, dy):
+        Returns stack of templates shifted by vectors of offsets
     template():
         Returns array of windowed template function
     """
@@ -351,6 +922,45 @@ class ShiftedTemplateMixin(WindowedTemplate):
         super().__init__(*args)
         self.set_offset(kwargs['dx'], kwargs['dy'])
 
+    @classmethod
+    def template_stack(cls, d, kt, alpha, nx, ny, de, **kwargs):
+        """Return stack of shifted template functions for vectors of parameters
+
+        Other Parameters
+        ----------------
+        dx : float
+            X Offset of template center in data projection units
+        dy : float
+            Y Offset of template center data projection units
+        """
+
+        return cls._stack_instances('template', d, kt, alpha, nx, ny, de,
+                                    **kwargs)
+
+    @classmethod
+    def window_limits_stack(cls, d, kt, alpha, nx, ny, de, **kwargs):
+        """Return stack of window extent masks for vectors of parameters"""
+
+        return cls._stack_instances('get_window_limits', d, kt, alpha, nx, ny,
+                                    de, **kwargs)
+
+    @classmethod
+    def window_bounds_stack(cls, d, kt, alpha, nx, ny, de, **kwargs):
+        """Return window border widths for vectors of parameters"""
+
+        return cls._stack_instances('get_window_bounds', d, kt, alpha, nx, ny,
+                                    de, **kwargs)
+
+    @classmethod
+    def err_mask_stack(cls, d, kt, alpha, nx, ny, de, **kwargs):
+        """Return stack of error masks for vectors of parameters"""
+
+        if not hasattr(cls, 'get_err_mask'):
+            return None
+
+        return cls._stack_instances('get_err_mask', d, kt, alpha, nx, ny, de,
+                                    **kwargs)
+
     def set_offset(self, dx, dy):
         """Set offset values
 
@@ -396,17 +1006,29 @@ class ShiftedTemplateMixin(WindowedTemplate):
             W = np.hstack([W, right])
 
         if dy > 0:
-            bottom = np.zeros((dy, nx))
+            top = np.zeros((dy, nx))
             W = W[0:-dy, :]
-            W = np.vstack([W, bottom])
+            W = np.vstack([top, W])
         else:
             dy = abs(dy)
-            top = np.zeros((dy, nx))
+            bottom = np.zeros((dy, nx))
             W = W[dy:, :]
-            W = np.vstack([top, W])
+            W = np.vstack([W, bottom])
 
         return W
 
+    def get_extent(self):
+        """Return distance from window center that bounds both the support
+        of the shifted template and the width of its window border
+
+        Returns
+        -------
+        extent : float
+            Extent of template in data projection units
+        """
+
+        return super().get_extent() + np.hypot(self.dx, self.dy) * self.de
+
     def template(self):
         """Template function for shifted template
 
@@ -420,6 +1042,34 @@ class ShiftedTemplateMixin(WindowedTemplate):
         W = self.shift_template(W, self.dx, self.dy)
         return W
 
+    def offset_template_stack(self, dx, dy):
+        """Return stack of templates shifted by vectors of offsets
+
+        The spectrum of the unshifted template is computed once and each
+        offset is applied as a phase ramp, so offsets may be fractional.
+        Shifts are circular: cells shifted past one edge of the grid wrap
+        around to the opposite edge rather than being discarded.
+
+        Parameters
+        ----------
+        dx : float or numpy array
+            X offsets of template center in cells
+        dy : float or numpy array
+            Y offsets of template center in cells
+
+        Returns
+        -------
+        W : numpy array
+            Stack of shifted windowed template functions. Dimensions of
+            (n, ny, nx).
+        """
+
+        ft = np.fft.fft2(super().template())
+        ramp = phase_ramp(self.nx, self.ny, dx, dy)
+        W = np.fft.ifft2(numexpr.evaluate("ft * ramp"), axes=(-2, -1))
+
+        return np.real(W)
+
 
 class ShiftedLeftFacingUpperBreakScarp(ShiftedTemplateMixin,
                                        LeftFacingUpperBreakScarp):
@@ -465,6 +1115,8 @@ class Ricker(WindowedTemplate):
     https://doi.org/10.1029/2007GL031140
     """
 
+    symmetry_period = np.pi
+
     def __init__(self, d, f, alpha, nx, ny, de):
         """Constructor method for Ricker template
 
@@ -492,8 +1144,20 @@ class Ricker(WindowedTemplate):
         self.c = nx
         self.de = de
 
-    def get_window_limits(self):
-        return np.zeros((self.ny, self.nx), dtype=bool)
+    def get_window_bounds(self):
+        return 0, 0, 0, 0
+
+    def get_extent(self):
+        """Return extent of template, which spans the template grid along
+        its orientation
+
+        Returns
+        -------
+        extent : float
+            Infinite, as the support is not bounded by the template scale
+        """
+
+        return np.inf
 
     def template(self):
         """Template function for windowed Ricker wavelet 
@@ -540,8 +1204,21 @@ class Crater(WindowedTemplate):
         Number of rows in template array
     de : float
         Spacing of template grid cells in dat projection units
+
+    Methods
+    -------
+    get_window_bounds():
+        Returns numbers of rows and columns in window border
+    get_extent():
+        Returns distance bounding template support and window border
+    template():
+        Returns array of windowed template function
+    template_loop():
+        Returns array of windowed template function (reference loop)
     """
 
+    symmetry_period = 0
+
     def __init__(self, r, kt, nx, ny, de):
         """Constructor methodfor radially symmetric crater
 
@@ -565,21 +1242,127 @@ class Crater(WindowedTemplate):
         self.ny = ny
         self.de = de
 
+    def get_window_bounds(self):
+        """Return numbers of rows and columns within window border
+
+        The border contains cells closer to the grid edge than the outer edge
+        of the rim segment windows.
+
+        Returns
+        -------
+        bounds : tuple
+            Numbers of (top, bottom, left, right) rows and columns in border
+        """
+
+        extent = self.get_extent()
+
+        return window_bounds(self.nx, self.ny, self.de, float(extent),
+                             float(extent))
+
+    def get_extent(self):
+        """Return distance from template center that bounds both the support
+        of the template and the width of its window border
+
+        This is the distance to the outer corners of the rim segment windows.
+
+        Returns
+        -------
+        extent : float
+            Extent of template in data projection units
+        """
+
+        half_length = 5 / self.de
+
+        return np.sqrt((self.r + 1) ** 2 + half_length ** 2)
+
     def template(self):
         """Template function for radially symmetric crater
 
+        Vectorized equivalent of template_loop(). Only cells near the crater
+        rim can fall inside a rim segment's window, so each of these cells is
+        evaluated for the few segment azimuths close to its own azimuth.
+
         Returns
         -------
         W : numpy array
             Windowed template function
         """
 
-        x = self.de * np.linspace(1, self.nx, num=self.nx)
-        y = self.de * np.linspace(1, self.ny, num=self.ny)
-        x = x - np.mean(x)
-        y = y - np.mean(y)
+        x, y = get_grid(self.nx, self.ny, self.de)
+
+        W = np.zeros_like(x)
+
+        thetas = np.linspace(0, 2 * np.pi, num=359, endpoint=False)
+        num_thetas = len(thetas)
+        step = 2 * np.pi / num_thetas
+        half_length = 5 / self.de
+
+        # Rim segment parameters are tabulated with the scalar operations
+        # used in template_loop(), so that both methods agree exactly
+        cos_alpha = np.array([np.cos(-theta) for theta in thetas])
+        sin_alpha = np.array([np.sin(-theta) for theta in thetas])
+        seg_dx = np.array([self.r * np.cos(theta) for theta in thetas])
+        seg_dy = np.array([self.r * np.sin(theta) for theta in thetas])
+        sign = np.where((thetas > np.pi / 2) & (thetas < 3 * np.pi / 2), -1, 1)
+
+        # Segment windows only reach cells at radial distances between r - 1
+        # and sqrt((r + 1)^2 + half_length^2). One cell of margin is added.
+        rho = np.hypot(x, y)
+        rho_max = np.sqrt((self.r + 1) ** 2 + half_length ** 2) + 1
+        idx = np.nonzero((rho > self.r - 2) & (rho < rho_max))
+        xc = x[idx]
+        yc = y[idx]
+        rho = rho[idx]
+
+        # Segment at azimuth theta covers a cell at azimuth phi only if
+        # |theta - phi| < arcsin(half_length / rho), given r >= 1
+        phi = np.mod(np.arctan2(-yc, xc), 2 * np.pi)
+        nearest = np.round(phi / step).astype(int) % num_thetas
+        if self.r >= 1:
+            max_offset = np.arcsin(np.minimum(1, half_length / rho))
+            num_offsets = np.ceil(max_offset / step + 0.5).astype(int) + 1
+            num_offsets = np.minimum(num_offsets, num_thetas // 2)
+        else:
+            num_offsets = np.full(len(rho), num_thetas // 2)
+
+        Wc = np.zeros_like(rho)
+        max_offset = num_offsets.max() if len(rho) > 0 else -1
+        for offset in range(-max_offset, max_offset + 1):
+            sel = np.nonzero(num_offsets >= abs(offset))[0]
+            j = (nearest[sel] + offset) % num_thetas
+            ca = cos_alpha[j]
+            sa = sin_alpha[j]
+            dx = seg_dx[j]
+            dy = seg_dy[j]
+            xs = xc[sel]
+            ys = yc[sel]
+
+            xr = (xs - dx) * ca + (ys + dy) * sa
+            yr = -(xs - dx) * sa + (ys + dy) * ca
+            this_W = (-xr / (2. * self.kt ** (3 / 2.) * np.sqrt(np.pi))) \
+                * np.exp(-xr ** 2. / (4. * self.kt))
+
+            mask = (abs(xr) < 1) & (abs(yr) < 5 / self.de)
+
+            Wc[sel] += this_W * mask * sign[j]
+
+        W[idx] = Wc
+
+        return W
+
+    def template_loop(self):
+        """Template function for radially symmetric crater
+
+        Reference implementation summing rotated scarp segments around the
+        crater rim over the full grid.
+
+        Returns
+        -------
+        W : numpy array
+            Windowed template function
+        """
 
-        x, y = np.meshgrid(x, y)
+        x, y = get_grid(self.nx, self.ny, self.de)
 
         W = np.zeros_like(x)
 
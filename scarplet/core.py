@@ -16,12 +16,21 @@ from functools import partial
 
 from scarplet import WindowedTemplate
 from scarplet.dem import DEMGrid
+from scarplet.results import PointTable
 
 
 np.seterr(divide='ignore', invalid='ignore')
 
 pyfftw.interfaces.cache.enable()
 
+# Minimum number of cells across a template's diffusion width at a pyramid
+# level
+PYRAMID_CELLS_PER_WIDTH = 4
+
+# Number of ages whose templates are stacked at once when matching all ages
+# at an orientation
+TEMPLATE_STACK_CHUNK = 8
+
 
 def calculate_amplitude(dem, Template, scale, age, angle):
     """Calculate amplitude and SNR of features using a template
@@ -52,12 +61,12 @@ def calculate_amplitude(dem, Template, scale, age, angle):
     t = Template(scale, age, angle, nx, ny, de)
     template = t.template()
 
-    curv = dem._calculate_directional_laplacian(angle)
+    curv = calculate_curvature(dem, Template, angle)
 
-    amp, age, angle, snr = match_template(curv, template)
-    mask = t.get_window_limits()
-    amp[mask] = 0
-    snr[mask] = 0
+    fc = fft2(curv)
+    fc2 = fft2(numexpr.evaluate("curv**2"))
+    amp, snr = calculate_amplitude_snr(fc, fc2, template)
+    _mask_window(t, amp, snr)
 
     return amp, snr
 
@@ -86,8 +95,8 @@ def calculate_best_fit_parameters_serial(dem,
     ang_min : float, optional
         Minimum orietnation of template, default -pi / 2
     kwargs : optional
-        Any additional keyword arguments that may be passed to the template()
-        method of the Template class
+        Any additional keyword arguments that may be passed to the
+        template_stack() method of the Template class
 
     Returns
     -------
@@ -101,9 +110,7 @@ def calculate_best_fit_parameters_serial(dem,
         2-D array of maximum signal-to-noise ratios for each DEM pixel
     """
 
-    ang_stepsize = 1
-    num_angles = int((180 / np.pi) * (ang_max - ang_min) / ang_stepsize + 1)
-    orientations = np.linspace(ang_min, ang_max, num_angles)
+    orientations = get_orientations(Template, ang_min, ang_max)
     ages = 10 ** np.arange(0, 3.5, 0.1)
 
     ny, nx = dem._griddata.shape
@@ -113,25 +120,10 @@ def calculate_best_fit_parameters_serial(dem,
     best_snr = np.zeros((ny, nx))
 
     for this_angle in orientations:
-        for this_age in ages:
-            this_amp, this_age, this_angle, this_snr = match_template(dem,
-                                                                    Template,
-                                                                    scale,
-                                                                    this_age,
-                                                                    this_angle,
-                                                                    **kwargs)
-
-            best_amp = numexpr.evaluate("(best_snr > this_snr)*best_amp + \
-                                        (best_snr < this_snr)*this_amp")
-
-            best_angle = numexpr.evaluate("(best_snr > this_snr)*best_angle + \
-                                          (best_snr < this_snr)*this_angle")
-
-            best_age = numexpr.evaluate("(best_snr > this_snr)*best_age + \
-                                        (best_snr < this_snr)*this_age")
-
-            best_snr = numexpr.evaluate("(best_snr > this_snr)*best_snr + \
-                                        (best_snr < this_snr)*this_snr")
+        result = match_template_stack(dem, Template, scale, ages, this_angle,
+                                      **kwargs)
+        best_amp, best_age, best_angle, best_snr = _update_best(
+            [best_amp, best_age, best_angle, best_snr], result)
 
     return best_amp, best_age, best_angle, best_snr
 
@@ -142,6 +134,7 @@ def calculate_best_fit_parameters(dem,
                                   age,
                                   ang_max=np.pi / 2,
                                   ang_min=-np.pi / 2,
+                                  k=None,
                                   **kwargs):
     """Calculate best-fitting parameters using a template with parallel search
 
@@ -149,12 +142,15 @@ def calculate_best_fit_parameters(dem,
     ----------
     dem : DEMGrid
         Grid object of elevation data
-    Template : WindowedTemplate
-        Class representing template function
+    Template : WindowedTemplate or list
+        Class representing template function, or list of template variants
+        to be matched together by match_template_variants()
     scale : float
         Scale of template function in DEM cell units
-    age : float
-        Age parameter for template function
+    age : float or np.array
+        Age parameter for template function. If a vector of ages is given,
+        each task matches all ages at one orientation with
+        match_template_stack().
 
     Other Parameters
     ----------------
@@ -162,39 +158,79 @@ def calculate_best_fit_parameters(dem,
         Maximum orietnation of template, default pi / 2
     ang_min : float, optional
         Minimum orietnation of template, default -pi / 2
+    k : int, optional
+        Number of best fits to keep for each pixel. If None (default), only
+        the single best fit is kept.
 
     Returns
     -------
     results : np.array
         Array of best amplitudes, ages, orientations, and  signal-to-noise
-        ratios for each DEM pixel. Dimensions of (4, height, width).
+        ratios for each DEM pixel. Dimensions of (4, height, width), or
+        (4, k, height, width) if k is given. If a list of template variants
+        is given, a list of arrays is returned with one array per variant.
     """
 
-    ang_stepsize = 1
-    num_angles = int((180 / np.pi) * (ang_max - ang_min) / ang_stepsize + 1)
-    orientations = np.linspace(ang_min, ang_max, num_angles)
+    variants = isinstance(Template, (list, tuple))
+    if variants:
+        orientations = max((get_orientations(T, ang_min, ang_max)
+                            for T in Template), key=len)
+        match_func = match_template_variants
+    elif np.ndim(age) > 0:
+        orientations = get_orientations(Template, ang_min, ang_max)
+        match_func = partial(match_template_stack, k=k)
+    else:
+        orientations = get_orientations(Template, ang_min, ang_max)
+        match_func = match_template
     orientations = (angle for angle in orientations)
 
     ny, nx = dem._griddata.shape
 
+    # Derivative grids are cached before workers start so that each worker
+    # receives them with its copy of the DEM, rather than once per task
+    for name in ('d2z_dx2', 'd2z_dxdy', 'd2z_dy2'):
+        dem._get_derivative(name)
+
     nprocs = mp.cpu_count()
-    pool = mp.Pool(processes=nprocs)
-    wrapper = partial(match_template, dem, Template, scale, age)
+    pool = mp.Pool(processes=nprocs, initializer=_init_worker,
+                   initargs=(dem,))
+    wrapper = partial(_match_worker, match_func, Template, scale, age)
     results = pool.imap(wrapper, orientations, chunksize=1)
 
-    best_amp, best_age, best_angle, best_snr = compare(results, ny, nx)
+    if variants:
+        best = compare_variants(results, ny, nx, k)
+    elif k is None:
+        best = compare(results, ny, nx)
+    else:
+        best = compare_top_k(results, ny, nx, k)
 
     pool.close()
     pool.join()
 
-    results = np.stack([best_amp,
-                        best_age,
-                        best_angle,
-                        best_snr])
+    if variants:
+        return [np.stack(b) for b in best]
+
+    results = np.stack(best)
 
     return results
 
 
+_worker_data = None
+
+
+def _init_worker(data):
+    """Store DEM shared by tasks in a worker process"""
+
+    global _worker_data
+    _worker_data = data
+
+
+def _match_worker(match_func, Template, scale, age, angle):
+    """Match template to DEM stored in a worker process"""
+
+    return match_func(_worker_data, Template, scale, age, angle)
+
+
 def compare(results, ny, nx):
     """Compare template matching results from asynchronous tasks
 
@@ -219,30 +255,250 @@ def compare(results, ny, nx):
         2-D array of maximum signal-to-noise ratios
     """
 
-    best_amp = np.zeros((ny, nx))
-    best_age = np.zeros((ny, nx))
-    best_angle = np.zeros((ny, nx))
-    best_snr = np.zeros((ny, nx))
+    best = [np.zeros((ny, nx)) for i in range(4)]
 
     for r in results:
-        this_amp, this_age, this_angle, this_snr = r
+        best = _update_best(best, r)
+        del r
+
+    best_amp, best_age, best_angle, best_snr = best
+
+    return best_amp, best_age, best_angle, best_snr
+
+
+def _update_best(best, result):
+    """Update best-fitting parameters with a template matching result"""
+
+    best_amp, best_age, best_angle, best_snr = best
+    this_amp, this_age, this_angle, this_snr = result
+
+    best_amp = numexpr.evaluate("(best_snr > this_snr)*best_amp + \
+                                (best_snr < this_snr)*this_amp")
+
+    best_age = numexpr.evaluate("(best_snr > this_snr)*best_age + \
+                                (best_snr < this_snr)*this_age")
+
+    best_angle = numexpr.evaluate("(best_snr > this_snr)*best_angle + \
+                                  (best_snr < this_snr)*this_angle")
+
+    best_snr = numexpr.evaluate("(best_snr > this_snr)*best_snr + \
+                                (best_snr < this_snr)*this_snr")
+
+    return [best_amp, best_age, best_angle, best_snr]
+
+
+def compare_top_k(results, ny, nx, k=3):
+    """Compare template matching results, keeping the k best fits per pixel
+
+    Results are reduced in a single streaming pass, so that runner-up fits
+    are available without repeating the parameter search.
 
-        best_amp = numexpr.evaluate("(best_snr > this_snr)*best_amp + \
-                                    (best_snr < this_snr)*this_amp")
+    Parameters
+    ----------
+    results : iterable
+        Iterable containing outputs of a template matching method. Each
+        output may hold 2-D arrays for a single fit, or 3-D arrays of
+        dimensions (m, ny, nx) from a previous call to compare_top_k()
+    ny : int
+        Number of rows in output
+    nx : int
+        Number of columns in output
+    k : int, optional
+        Number of best fits to keep for each pixel, default 3
+
+    Returns
+    -------
+    best_amp : np.array
+        3-D array of best-fitting amplitudes
+    best_age : np.array
+        3-D array of best-fitting morphologic ages
+    best_angle : np.array
+        3-D array of best-fitting orientations
+    best_snr : np.array
+        3-D array of maximum signal-to-noise ratios
+
+    All arrays have dimensions of (k, ny, nx) and are ordered by decreasing
+    signal-to-noise ratio along the first axis.
+    """
 
-        best_age = numexpr.evaluate("(best_snr > this_snr)*best_age + \
-                                    (best_snr < this_snr)*this_age")
+    best = [np.zeros((k, ny, nx)) for i in range(4)]
 
-        best_angle = numexpr.evaluate("(best_snr > this_snr)*best_angle + \
-                                      (best_snr < this_snr)*this_angle")
+    for r in results:
+        _insert_top_k(best, r)
+        del r
 
-        best_snr = numexpr.evaluate("(best_snr > this_snr)*best_snr + \
-                                    (best_snr < this_snr)*this_snr")
-        del this_amp, this_snr, r
+    best_amp, best_age, best_angle, best_snr = best
 
     return best_amp, best_age, best_angle, best_snr
 
 
+def _insert_top_k(best, result):
+    """Insert template matching result into stacks of k best fits in place"""
+
+    best_amp, best_age, best_angle, best_snr = best
+    this_amp, this_age, this_angle, this_snr = result
+    k = len(best_snr)
+
+    if np.ndim(this_snr) == 2:
+        layers = [(this_amp, this_age, this_angle, this_snr)]
+    else:
+        layers = zip(this_amp, this_age, this_angle, this_snr)
+
+    for layer_amp, layer_age, layer_angle, layer_snr in layers:
+        # Insertion into sorted stack: displaced fits move down one rank
+        for i in range(k):
+            this_best_snr = best_snr[i]
+            swap = numexpr.evaluate("layer_snr > this_best_snr")
+
+            displaced_amp = np.where(swap, best_amp[i], layer_amp)
+            displaced_age = np.where(swap, best_age[i], layer_age)
+            displaced_angle = np.where(swap, best_angle[i], layer_angle)
+            displaced_snr = np.where(swap, best_snr[i], layer_snr)
+
+            best_amp[i] = np.where(swap, layer_amp, best_amp[i])
+            best_age[i] = np.where(swap, layer_age, best_age[i])
+            best_angle[i] = np.where(swap, layer_angle, best_angle[i])
+            best_snr[i] = np.where(swap, layer_snr, best_snr[i])
+
+            layer_amp = displaced_amp
+            layer_age = displaced_age
+            layer_angle = displaced_angle
+            layer_snr = displaced_snr
+
+
+def compare_variants(results, ny, nx, k=None):
+    """Compare results of matching several template variants together
+
+    Parameters
+    ----------
+    results : iterable
+        Iterable containing outputs of match_template_variants() or similar
+        function, i.e. lists with one result per template variant
+    ny : int
+        Number of rows in output
+    nx : int
+        Number of columns in output
+    k : int, optional
+        Number of best fits to keep for each pixel. If None (default), only
+        the single best fit is kept.
+
+    Returns
+    -------
+    best : list
+        List with one tuple of best amplitudes, ages, orientations and
+        signal-to-noise ratios per template variant, as returned by
+        compare() or compare_top_k()
+    """
+
+    best = None
+
+    for r in results:
+        if best is None:
+            shape = (ny, nx) if k is None else (k, ny, nx)
+            best = [[np.zeros(shape) for i in range(4)] for variant in r]
+
+        for i, this in enumerate(r):
+            if k is None:
+                best[i] = _update_best(best[i], this)
+            else:
+                _insert_top_k(best[i], this)
+        del r
+
+    return [tuple(b) for b in best]
+
+
+def calculate_curvature(data, Template, angle):
+    """Calculate curvature of DEM used to match a template
+
+    Parameters
+    ----------
+    data : DEMGrid
+        Grid object of elevation data
+    Template : WindowedTemplate
+        Class representing template function
+    angle : float
+        Orientation of template in radians
+
+    Returns
+    -------
+    curv : np.array
+        2-D array of directional curvature, or of isotropic curvature for
+        rotationally invariant templates. Cells with no data are set to
+        zero so that they do not propagate through convolutions.
+    """
+
+    if Template.symmetry_period == 0:
+        curv = data._calculate_isotropic_laplacian()
+    else:
+        curv = data._calculate_directional_laplacian(angle)
+
+    return numexpr.evaluate("where(curv != curv, 0, curv)", out=curv)
+
+
+def get_orientations(Template, ang_min=-np.pi / 2, ang_max=np.pi / 2,
+                     ang_stepsize=1):
+    """Get distinct template orientations to search
+
+    Orientations that differ by a multiple of the template's symmetry period
+    produce identical templates, so only the first of each is kept.
+    Rotationally invariant templates are matched at a single orientation.
+
+    For antisymmetric templates, orientations half a period apart give the
+    same SNR and amplitudes of opposite sign. Only the first of each pair
+    is kept, so best-fitting orientations stay within the first half period
+    of the search range and facing direction is given by amplitude sign.
+    The maximum orientation is kept unless it is equivalent to a kept
+    orientation modulo the full period, so the default -pi / 2 to pi / 2
+    sweep is unchanged.
+
+    Parameters
+    ----------
+    Template : WindowedTemplate
+        Class representing template function
+    ang_min : float, optional
+        Minimum orietnation of template, default -pi / 2
+    ang_max : float, optional
+        Maximum orietnation of template, default pi / 2
+    ang_stepsize : float, optional
+        Spacing of orientations in degrees, default 1
+
+    Returns
+    -------
+    orientations : np.array
+        Array of orientations in radians
+    """
+
+    period = Template.symmetry_period
+    if period == 0:
+        return np.zeros(1)
+
+    num_angles = int((180 / np.pi) * (ang_max - ang_min) / ang_stepsize + 1)
+    orientations = np.linspace(ang_min, ang_max, num_angles)
+
+    if not Template.antisymmetric:
+        return orientations[_distinct_orientations(orientations, period)]
+
+    idx = _distinct_orientations(orientations, period / 2)
+
+    # Maximum orientation is kept if it is distinct modulo the full period
+    candidates = np.append(idx, len(orientations) - 1)
+    distinct = _distinct_orientations(orientations[candidates], period)
+    if candidates[-1] not in idx and len(distinct) == len(candidates):
+        idx = candidates
+
+    return orientations[idx]
+
+
+def _distinct_orientations(orientations, period):
+    """Return sorted indices of first orientations distinct modulo period"""
+
+    classes = np.mod(orientations - orientations[0], period)
+    classes[np.isclose(classes, period)] = 0
+    _, first = np.unique(np.round(classes, decimals=9), return_index=True)
+
+    return np.sort(first)
+
+
 def load(filename):
     """Load DEM from file
 
@@ -270,111 +526,1334 @@ def match(data, Template, **kwargs):
     ----------
     data : DEMGrid
         DEMGrid object containing input data
-    Template : WindowedTemplate
-        Class of template function to use
+    Template : WindowedTemplate or list
+        Class of template function to use, or list of template variants to
+        be matched together by match_template_variants()
+
+    Other Parameters
+    ----------------
+    k : int, optional
+        Number of best fits to keep for each pixel. If None (default), only
+        the single best fit is kept.
+    snr_threshold : float, optional
+        If given, return a sparse PointTable of pixels with signal-to-noise
+        ratios above this threshold instead of dense arrays. Unless
+        tile_size is given, the table is built from dense results for the
+        whole grid, so peak memory is that of dense output.
+    tile_size : int, optional
+        If given with snr_threshold, match the grid in tiles of this size in
+        cells, each padded by a halo as in match_roi(), and append points
+        above the threshold to the table as each tile is matched. Dense
+        results are then only held for one tile at a time. Results equal
+        those for the whole grid away from the grid edges, and templates
+        without bounded support raise a ValueError.
+    pyramid : bool, optional
+        If True, match each age at the coarsest level of a resolution pyramid
+        that resolves the template's diffusion width and scale, as chosen by
+        get_pyramid_factor(), and upsample results to the native grid. Use
+        calculate_pyramid_error() to check the error against full
+        resolution. Default False.
+    bbox : tuple, optional
+        Region of interest (xmin, ymin, xmax, ymax) in data projection
+        units. If given, only the region and a halo around it are matched,
+        as in match_roi(), and results are cropped to the region's bounding
+        box. Use match_roi() to also get a DEMGrid of the region.
+    roi : np.array, optional
+        2-D boolean array of pixels in region of interest, matched as in
+        match_roi()
+    kwargs : optional
+        Any additional keyword arguments that may be passed to
+        calculate_best_fit_parameters()
 
     Returns
     -------
     results : np.array
         Array of best amplitudes, ages, orientations, and  signal-to-noise
-        ratios for each DEM pixel. Dimensions of (4, height, width).
+        ratios for each DEM pixel. Dimensions of (4, height, width), or
+        (4, k, height, width) if k is given. If snr_threshold is given, a
+        PointTable of results is returned instead. If a list of template
+        variants is given, a list of results is returned with one entry per
+        variant. If bbox or roi is given, results cover the bounding box of
+        the region of interest only, and PointTable rows and columns index
+        the full grid.
     """
-    
+
+    snr_threshold = kwargs.pop('snr_threshold', None)
+    if snr_threshold is not None and kwargs.get('k') is not None:
+        raise ValueError("snr_threshold cannot be combined with k")
+
+    tile_size = kwargs.pop('tile_size', None)
+    bbox = kwargs.pop('bbox', None)
+    roi = kwargs.pop('roi', None)
+    if tile_size is not None:
+        if snr_threshold is None:
+            raise ValueError("tile_size requires snr_threshold")
+        if bbox is not None or roi is not None:
+            raise ValueError("tile_size cannot be combined with bbox or roi")
+        return _match_tiles(data, Template, snr_threshold, tile_size,
+                            **kwargs)
+
+    if bbox is not None or roi is not None:
+        results, region = match_roi(data, Template, bbox=bbox, roi=roi,
+                                    snr_threshold=snr_threshold, **kwargs)
+        return results
+
+    pyramid = kwargs.pop('pyramid', False)
+    de = data._georef_info.dx
+    scale = kwargs.get('scale')
+
     if 'age' in kwargs:
-        results = calculate_best_fit_parameters(data, Template, **kwargs)
+        age = kwargs.pop('age')
+        factor = get_pyramid_factor(age, de, scale) if pyramid else 1
+        results = _match_pyramid_level(data, Template, age, factor, **kwargs)
+    elif not pyramid and not isinstance(Template, (list, tuple)):
+        # All ages are matched at each orientation from shared curvature
+        # spectra
+        ages = 10 ** np.arange(0, 3.5, 0.1)
+        results = calculate_best_fit_parameters(data, Template, age=ages,
+                                                **kwargs)
     else:
         ages = 10 ** np.arange(0, 3.5, 0.1)
+        factors = [get_pyramid_factor(age, de, scale) if pyramid else 1
+                   for age in ages]
         ny, nx = data._griddata.shape
-        results = [calculate_best_fit_parameters(data,
-                                                 Template,
-                                                 age=age, 
-                                                 **kwargs) for age in ages]
-        results = compare(results, ny, nx)
+        results = [_match_pyramid_level(data,
+                                        Template,
+                                        age,
+                                        factor,
+                                        **kwargs)
+                   for age, factor in zip(ages, factors)]
+        k = kwargs.get('k')
+        if isinstance(Template, (list, tuple)):
+            results = compare_variants(results, ny, nx, k)
+        elif k is None:
+            results = compare(results, ny, nx)
+        else:
+            results = compare_top_k(results, ny, nx, k)
+
+    if snr_threshold is not None:
+        if isinstance(Template, (list, tuple)):
+            return [_to_point_table(r, data, snr_threshold) for r in results]
+        return _to_point_table(results, data, snr_threshold)
 
     return results
 
 
-def match_template(data, Template, scale, age, angle, **kwargs):
-    """Match template function to curvature using convolution
+def _to_point_table(results, data, snr_threshold, row_offset=0,
+                    col_offset=0):
+    """Return PointTable of results above an SNR threshold"""
+
+    table = PointTable(snr_threshold)
+    table.append(results, data._georef_info, row_offset, col_offset)
+
+    return table
+
+
+def _match_tiles(data, Template, snr_threshold, tile_size, scale, **kwargs):
+    """Build PointTables of results above an SNR threshold tile by tile"""
+
+    variants = isinstance(Template, (list, tuple))
+    tables = [PointTable(snr_threshold)
+              for T in (Template if variants else [Template])]
+
+    ny, nx = data._georef_info.ny, data._georef_info.nx
+    for i0 in range(0, ny, tile_size):
+        for j0 in range(0, nx, tile_size):
+            i1 = min(i0 + tile_size, ny)
+            j1 = min(j0 + tile_size, nx)
+            results, _ = _match_window(data, Template, scale, i0, i1, j0, j1,
+                                       **kwargs)
+            for table, r in zip(tables, results):
+                table.append(r, data._georef_info, i0, j0)
+            del results
+
+    return tables if variants else tables[0]
+
+
+def match_roi(data, Template, scale, bbox=None, roi=None, **kwargs):
+    """Match template only in a region of interest
+
+    The bounding box of the region is padded by a halo of width get_halo()
+    with the same parity of rows and columns as the full grid. Only this
+    window is read from lazy grids and matched, so cost is proportional to
+    the area of the region.
+
+    Away from the grid edges, results equal those of match(), as in
+    match_cascade(). Templates without bounded support (e.g. Ricker
+    wavelets) raise a ValueError.
 
     Parameters
     ----------
     data : DEMGrid
-        Grid object of elevation data
-    Template : WindowedTemplate
-        Class representing template function
+        DEMGrid object containing input data
+    Template : WindowedTemplate or list
+        Class of template function to use, or list of template variants to
+        be matched together by match_template_variants()
     scale : float
         Scale of template function in DEM cell units
-    age : float
-        Age parameter for template function
-    angle : float
-        Orientation of template in radians
+    bbox : tuple, optional
+        Region of interest (xmin, ymin, xmax, ymax) in data projection
+        units. Pixels containing any part of the region are matched.
+    roi : np.array, optional
+        2-D boolean array of pixels in region of interest, with the shape of
+        the grid. Results outside it have zero amplitude and SNR.
 
     Other Parameters
     ----------------
     kwargs : optional
-        Any additional keyword arguments that may be passed to the template()
-        method of the Template class
+        Any additional keyword arguments that may be passed to match()
 
     Returns
     -------
-    amp : np.array
-        2-D array of amplitudes for each DEM pixel
-    age : np.array
-        template age in m2
-    angle : np.array 
-        template orientation in radians 
-    snr : np.array
-        2-D array of signal-to-noise ratios for each DEM pixel
+    results : np.array
+        Results of match() for pixels in the bounding box of the region of
+        interest. If snr_threshold is given, a PointTable whose rows and
+        columns index the full grid.
+    region : DEMGrid
+        Grid of elevation data in the bounding box of the region of
+        interest, with its georeferencing
+    """
 
-    References
+    if bbox is None and roi is None:
+        raise ValueError("Either bbox or roi must be given")
+
+    snr_threshold = kwargs.pop('snr_threshold', None)
+    if snr_threshold is not None and kwargs.get('k') is not None:
+        raise ValueError("snr_threshold cannot be combined with k")
+
+    i0, i1, j0, j1 = _get_roi_bounds(data, bbox, roi)
+    results, region = _match_window(data, Template, scale, i0, i1, j0, j1,
+                                    **kwargs)
+
+    if roi is not None:
+        outside = ~roi[i0:i1, j0:j1]
+        for r in results:
+            r[..., outside] = 0
+
+    if snr_threshold is not None:
+        results = [_to_point_table(r, data, snr_threshold, i0, j0)
+                   for r in results]
+
+    if not isinstance(Template, (list, tuple)):
+        results = results[0]
+
+    return results, region
+
+
+def _get_roi_bounds(data, bbox, roi):
+    """Return row and column bounds of region of interest in grid"""
+
+    ny, nx = data._georef_info.ny, data._georef_info.nx
+    i0, i1, j0, j1 = 0, ny, 0, nx
+
+    if bbox is not None:
+        xmin, ymin, xmax, ymax = bbox
+        rows, cols = data._georef_info.xy_to_pixel([xmin, xmin, xmax, xmax],
+                                                   [ymin, ymax, ymin, ymax])
+        i0, i1 = max(rows.min(), 0), min(rows.max() + 1, ny)
+        j0, j1 = max(cols.min(), 0), min(cols.max() + 1, nx)
+
+    if roi is not None:
+        roi = np.asarray(roi, dtype=bool)
+        if roi.shape != (ny, nx):
+            raise ValueError("Region of interest mask must have shape of "
+                             "grid")
+        rows, cols = np.nonzero(roi[i0:i1, j0:j1])
+        if len(rows) > 0:
+            i0, i1 = i0 + rows.min(), i0 + rows.max() + 1
+            j0, j1 = j0 + cols.min(), j0 + cols.max() + 1
+        else:
+            i1, j1 = i0, j0
+
+    if i1 <= i0 or j1 <= j0:
+        raise ValueError("Region of interest does not intersect grid")
+
+    return i0, i1, j0, j1
+
+
+def _match_window(data, Template, scale, i0, i1, j0, j1, **kwargs):
+    """Match template in a block of the grid padded by a halo
+
+    Returns a list of results cropped to the block, with one entry per
+    template variant, and a DEMGrid of the block.
+    """
+
+    Templates = Template if isinstance(Template, (list, tuple)) \
+        else [Template]
+    ages = kwargs.get('age', 10 ** np.arange(0, 3.5, 0.1))
+    de = data._georef_info.dx
+    halo = max(get_halo(T, scale, ages, de) for T in Templates)
+
+    ny, nx = data._georef_info.ny, data._georef_info.nx
+    r0, r1 = _pad_with_parity(i0, i1, halo, ny)
+    c0, c1 = _pad_with_parity(j0, j1, halo, nx)
+    window = data.get_window(r0, c0, r1 - r0, c1 - c0)
+    region = window.get_window(i0 - r0, j0 - c0, i1 - i0, j1 - j0)
+
+    results = match(window, Template, scale=scale, **kwargs)
+    if not isinstance(Template, (list, tuple)):
+        results = [results]
+
+    results = [np.asarray(r)[..., i0 - r0:i1 - r0, j0 - c0:j1 - c0].copy()
+               for r in results]
+
+    return results, region
+
+
+def match_cascade(data, Template, screen='curvature', candidates=None,
+                  block_size=64, **kwargs):
+    """Match template only in candidate regions found by a screening pass
+
+    Candidate pixels are grouped into blocks, which are covered by windows
+    padded by a halo of width get_halo(). Full matching is run on each window
+    and results are kept for candidate blocks. All other pixels have zero
+    amplitude and SNR.
+
+    Within candidate blocks away from the grid edges, results equal those of
+    match(), as the halo covers the template support and window border.
+    Near grid edges, full-grid results include template support wrapped
+    around to the opposite edge, which windows do not. Templates without
+    bounded support (e.g. Ricker wavelets) raise a ValueError.
+
+    Parameters
     ----------
-    Modifies method described in 
+    data : DEMGrid
+        DEMGrid object containing input data
+    Template : WindowedTemplate or list
+        Class of template function to use, or list of template variants to
+        be matched together by match_template_variants()
+    screen : str, optional
+        Screening method used if candidates are not given: 'curvature'
+        (default) for screen_curvature() or 'sweep' for screen_sweep()
+    candidates : np.array, optional
+        2-D boolean array of candidate pixels
+    block_size : int, optional
+        Size of candidate blocks in cells, default 64
 
-    Hilley, G.E., DeLong, S., Prentice, C., Blisniuk, K. and Arrowsmith, 
-    J.R., 2010. Morphologic dating of fault scarps using airborne 
-    laser swath mapping (ALSM) data. Geophysical Research Letters, 37(4).
-    https://dx.doi.org/10.1029/2009GL042044
+    Other Parameters
+    ----------------
+    kwargs : optional
+        Any additional keyword arguments that may be passed to match(),
+        including scale
+
+    Returns
+    -------
+    results : np.array
+        Array of best amplitudes, ages, orientations, and  signal-to-noise
+        ratios for each DEM pixel, as returned by match()
     """
 
-    eps = np.spacing(1)
-    curv = data._calculate_directional_laplacian(angle)
-    ny, nx = curv.shape
+    snr_threshold = kwargs.pop('snr_threshold', None)
+    if snr_threshold is not None and kwargs.get('k') is not None:
+        raise ValueError("snr_threshold cannot be combined with k")
+
+    if 'scale' not in kwargs:
+        raise TypeError("match_cascade() missing required keyword argument: "
+                        "'scale'")
+    scale = kwargs['scale']
+    variants = isinstance(Template, (list, tuple))
+    Templates = Template if variants else [Template]
+
+    if candidates is None:
+        if screen == 'curvature':
+            candidates = screen_curvature(data, Templates[0], scale)
+        elif screen == 'sweep':
+            candidates = screen_sweep(data, Templates[0], scale)
+        else:
+            raise ValueError("Unknown screening method: {}".format(screen))
+
+    ages = kwargs.get('age', 10 ** np.arange(0, 3.5, 0.1))
     de = data._georef_info.dx
+    halo = max(get_halo(T, scale, ages, de) for T in Templates)
+    windows, mask = get_candidate_windows(candidates, halo, block_size)
 
-    template_obj = Template(scale, age, angle, nx, ny, de, **kwargs)
-    template = template_obj.template()
+    ny, nx = data._griddata.shape
+    k = kwargs.get('k')
+    shape = (4, ny, nx) if k is None else (4, k, ny, nx)
+    results = [np.zeros(shape) for T in Templates]
 
-    M = numexpr.evaluate("template != 0")
-    fm2 = fft2(M)
-    n = np.sum(M) + eps
-    del M
+    for (r0, r1, c0, c1), (i0, i1, j0, j1) in windows:
+        window = data.get_window(r0, c0, r1 - r0, c1 - c0)
+        window_results = match(window, Template, **kwargs)
+        if not variants:
+            window_results = [window_results]
 
-    fc = fft2(curv)
-    ft = fft2(template)
-    fc2 = fft2(numexpr.evaluate("curv**2"))
-    template_sum = np.sum(numexpr.evaluate("template**2"))
-    del curv, template
+        for out, this in zip(results, window_results):
+            this = np.asarray(this)
+            out[..., i0:i1, j0:j1] = this[..., i0 - r0:i1 - r0,
+                                          j0 - c0:j1 - c0]
 
-    xcorr = np.real(fftshift(ifft2(numexpr.evaluate("ft*fc"))))
-    amp = numexpr.evaluate("xcorr/template_sum")
+    for out in results:
+        out[..., ~mask] = 0
 
-    T1 = numexpr.evaluate("template_sum*(amp**2)")
-    T3 = fftshift(ifft2(numexpr.evaluate("fc2*fm2")))
+    if snr_threshold is not None:
+        results = [_to_point_table(r, data, snr_threshold) for r in results]
 
-    # XXX: Epsilon factor is added to avoid small-magnitude dvision
-    error = (1/n)*numexpr.evaluate("real(T1 - 2*amp*xcorr + T3)") + eps
-    snr = numexpr.evaluate("abs(T1/error)")
+    return results if variants else results[0]
 
-    if hasattr(template_obj, 'get_err_mask'):
-        mask = template_obj.get_err_mask()
-        snr[mask] = 0
 
-    mask = template_obj.get_window_limits()
-    amp[mask] = 0
-    snr[mask] = 0
+def screen_curvature(data, Template, scale, num_angles=8, quantile=0.9,
+                     threshold=None):
+    """Screen DEM for candidate features by local curvature energy
 
-    return amp, age, angle, snr
+    Energy is the mean squared curvature over a window the size of the
+    template scale, maximized over a few orientations.
+
+    Parameters
+    ----------
+    data : DEMGrid
+        Grid object of elevation data
+    Template : WindowedTemplate
+        Class representing template function
+    scale : float
+        Scale of template function in DEM cell units
+    num_angles : int, optional
+        Number of orientations, default 8
+    quantile : float, optional
+        Quantile of energy above which pixels are candidates, default 0.9
+    threshold : float, optional
+        Energy above which pixels are candidates. Overrides quantile.
+
+    Returns
+    -------
+    candidates : np.array
+        2-D boolean array of candidate pixels
+    """
+
+    from scipy import ndimage
+
+    size = max(int(round(scale / abs(data._georef_info.dx))), 1)
+    period = Template.symmetry_period if Template.symmetry_period else np.pi
+    orientations = get_orientations(Template, -period / 2, period / 2,
+                                    ang_stepsize=180 / num_angles)
+
+    energy = None
+    for angle in orientations:
+        curv = calculate_curvature(data, Template, angle)
+        this_energy = ndimage.uniform_filter(numexpr.evaluate("curv**2"),
+                                             size)
+        energy = this_energy if energy is None \
+            else np.maximum(energy, this_energy, out=energy)
+
+    if threshold is None:
+        threshold = np.quantile(energy, quantile)
+
+    return energy > threshold
+
+
+def screen_sweep(data, Template, scale, num_angles=8,
+                 ages=10 ** np.array([0.5, 1.5, 2.5]), quantile=0.9,
+                 threshold=None, **kwargs):
+    """Screen DEM for candidate features with a coarse parameter sweep
+
+    Parameters
+    ----------
+    data : DEMGrid
+        Grid object of elevation data
+    Template : WindowedTemplate
+        Class representing template function
+    scale : float
+        Scale of template function in DEM cell units
+    num_angles : int, optional
+        Number of orientations, default 8
+    ages : np.array, optional
+        Template ages, default 10 ** 0.5, 10 ** 1.5 and 10 ** 2.5
+    quantile : float, optional
+        Quantile of maximum SNR above which pixels are candidates, default
+        0.9
+    threshold : float, optional
+        SNR above which pixels are candidates. Overrides quantile.
+
+    Other Parameters
+    ----------------
+    kwargs : optional
+        Any additional keyword arguments that may be passed to the template
+        constructor
+
+    Returns
+    -------
+    candidates : np.array
+        2-D boolean array of candidate pixels
+    """
+
+    period = Template.symmetry_period if Template.symmetry_period else np.pi
+    orientations = get_orientations(Template, -period / 2, period / 2,
+                                    ang_stepsize=180 / num_angles)
+
+    best_snr = None
+    for angle in orientations:
+        for age in ages:
+            _, _, _, snr = match_template(data, Template, scale, age, angle,
+                                          **kwargs)
+            best_snr = snr if best_snr is None \
+                else np.maximum(best_snr, snr, out=best_snr)
+
+    if threshold is None:
+        threshold = np.quantile(best_snr[best_snr > 0], quantile) \
+            if np.any(best_snr > 0) else 0
+
+    return best_snr > threshold
+
+
+def get_halo(Template, scale, age, de, **kwargs):
+    """Get width of border needed to match a template within a window
+
+    The halo covers the template's extent from get_extent(), which bounds
+    both its support and window border, plus one cell for curvature stencils
+    at window edges.
+
+    Parameters
+    ----------
+    Template : WindowedTemplate
+        Class representing template function
+    scale : float
+        Scale of template function in DEM cell units
+    age : float or np.array
+        Age parameter for template function, or array of ages of which the
+        largest is used
+    de : float
+        Grid spacing
+
+    Returns
+    -------
+    halo : int
+        Width of halo in cells
+    """
+
+    template_obj = _create_template(Template, scale, np.max(age), 0, 1, 1, de,
+                                    **kwargs)
+    extent = template_obj.get_extent()
+    if not np.isfinite(extent):
+        raise ValueError("{} template does not have bounded support"
+                         .format(Template.__name__))
+
+    return int(np.ceil(extent / abs(de))) + 1
+
+
+def get_candidate_windows(candidates, halo, block_size=64,
+                          window_size=None):
+    """Group candidate pixels into windows padded by a halo
+
+    Candidate pixels are grouped into blocks, and candidate blocks within
+    each tile of a coarser grid are covered by one window, so that halo
+    cells are shared between neighbouring blocks. Windows have the same
+    parity of rows and columns as the full grid, so that templates are
+    sampled at the same positions.
+
+    Parameters
+    ----------
+    candidates : np.array
+        2-D boolean array of candidate pixels
+    halo : int
+        Width of halo in cells
+    block_size : int, optional
+        Size of candidate blocks in cells, default 64
+    window_size : int, optional
+        Size of tiles grouping blocks into windows in cells. Default is
+        four times the halo or 256 cells, whichever is larger.
+
+    Returns
+    -------
+    windows : list
+        List of ((row0, row1, col0, col1), (row0, row1, col0, col1)) tuples
+        giving the extent of each window and its interior, excluding halo
+    mask : np.array
+        2-D boolean array of pixels in candidate blocks
+    """
+
+    if window_size is None:
+        window_size = max(4 * halo, 256)
+    group = max(int(round(window_size / block_size)), 1)
+
+    ny, nx = candidates.shape
+    nby = -(-ny // block_size)
+    nbx = -(-nx // block_size)
+
+    padded = np.zeros((nby * block_size, nbx * block_size), dtype=bool)
+    padded[:ny, :nx] = candidates
+    blocks = padded.reshape(nby, block_size, nbx, block_size).any(axis=(1, 3))
+
+    mask = np.repeat(np.repeat(blocks, block_size, axis=0), block_size,
+                     axis=1)[:ny, :nx]
+
+    windows = []
+    for gi in range(0, nby, group):
+        for gj in range(0, nbx, group):
+            rows, cols = np.nonzero(blocks[gi:gi + group, gj:gj + group])
+            if len(rows) == 0:
+                continue
+
+            i0 = (gi + rows.min()) * block_size
+            i1 = min((gi + rows.max() + 1) * block_size, ny)
+            j0 = (gj + cols.min()) * block_size
+            j1 = min((gj + cols.max() + 1) * block_size, nx)
+            r0, r1 = _pad_with_parity(i0, i1, halo, ny)
+            c0, c1 = _pad_with_parity(j0, j1, halo, nx)
+            windows.append(((r0, r1, c0, c1), (i0, i1, j0, j1)))
+
+    return windows, mask
+
+
+def _pad_with_parity(start, stop, halo, n):
+    """Pad range by halo within [0, n), keeping length parity of n"""
+
+    start = max(start - halo, 0)
+    stop = min(stop + halo, n)
+    if (stop - start) % 2 != n % 2:
+        if stop < n:
+            stop += 1
+        else:
+            start -= 1
+
+    return start, stop
+
+
+def match_template(data, Template, scale, age, angle, **kwargs):
+    """Match template function to curvature using convolution
+
+    Parameters
+    ----------
+    data : DEMGrid
+        Grid object of elevation data
+    Template : WindowedTemplate
+        Class representing template function
+    scale : float
+        Scale of template function in DEM cell units
+    age : float
+        Age parameter for template function
+    angle : float
+        Orientation of template in radians
+
+    Other Parameters
+    ----------------
+    kwargs : optional
+        Any additional keyword arguments that may be passed to the template()
+        method of the Template class
+
+    Returns
+    -------
+    amp : np.array
+        2-D array of amplitudes for each DEM pixel
+    age : np.array
+        template age in m2
+    angle : np.array 
+        template orientation in radians 
+    snr : np.array
+        2-D array of signal-to-noise ratios for each DEM pixel
+
+    References
+    ----------
+    Modifies method described in 
+
+    Hilley, G.E., DeLong, S., Prentice, C., Blisniuk, K. and Arrowsmith, 
+    J.R., 2010. Morphologic dating of fault scarps using airborne 
+    laser swath mapping (ALSM) data. Geophysical Research Letters, 37(4).
+    https://dx.doi.org/10.1029/2009GL042044
+    """
+
+    curv = calculate_curvature(data, Template, angle)
+    ny, nx = curv.shape
+    de = data._georef_info.dx
+
+    template_obj = _create_template(Template, scale, age, angle, nx, ny, de,
+                                    **kwargs)
+    template = template_obj.template()
+
+    fc = fft2(curv)
+    fc2 = fft2(numexpr.evaluate("curv**2"))
+    del curv
+
+    amp, snr = calculate_amplitude_snr(fc, fc2, template)
+    del template
+
+    _mask_err(template_obj, snr)
+    _mask_window(template_obj, amp, snr)
+
+    return amp, age, angle, snr
+
+
+def match_template_stack(data, Template, scale, age, angle, k=None,
+                         chunk_size=TEMPLATE_STACK_CHUNK, **kwargs):
+    """Match templates for a vector of ages at one orientation
+
+    The curvature spectra are computed once, and templates are built with
+    Template.template_stack() in chunks of ages, so at most chunk_size
+    template grids are held in memory at once. Results are reduced over ages
+    as they are computed.
+
+    Parameters
+    ----------
+    data : DEMGrid
+        Grid object of elevation data
+    Template : WindowedTemplate
+        Class representing template function
+    scale : float
+        Scale of template function in DEM cell units
+    age : np.array
+        Age parameters for template function
+    angle : float
+        Orientation of template in radians
+    k : int, optional
+        Number of best fits to keep for each pixel. If None (default), only
+        the single best fit is kept.
+    chunk_size : int, optional
+        Number of ages whose templates are stacked at once
+
+    Other Parameters
+    ----------------
+    kwargs : optional
+        Any additional keyword arguments that may be passed to the
+        template_stack() method of the Template class
+
+    Returns
+    -------
+    results : tuple
+        Best amplitudes, ages, orientations, and signal-to-noise ratios over
+        all ages, as returned by compare(), or by compare_top_k() if k is
+        given
+    """
+
+    curv = calculate_curvature(data, Template, angle)
+    ny, nx = curv.shape
+
+    fc = fft2(curv)
+    fc2 = fft2(numexpr.evaluate("curv**2"))
+    del curv
+
+    results = _match_stack_chunks(fc, fc2, Template, scale,
+                                  np.atleast_1d(age), angle,
+                                  data._georef_info.dx, chunk_size, **kwargs)
+    if k is None:
+        return compare(results, ny, nx)
+
+    return compare_top_k(results, ny, nx, k)
+
+
+def _match_stack_chunks(fc, fc2, Template, scale, ages, angle, de,
+                        chunk_size, **kwargs):
+    """Yield matching results for each age from chunked template stacks"""
+
+    ny, nx = fc.shape
+    template_obj = _create_template(Template, scale, ages[0], angle, nx, ny,
+                                    de, **kwargs)
+
+    for i in range(0, len(ages), chunk_size):
+        chunk = ages[i:i + chunk_size]
+        templates = Template.template_stack(scale, chunk, angle, nx, ny, de,
+                                            **kwargs)
+        window_bounds = Template.window_bounds_stack(scale, chunk, angle,
+                                                     nx, ny, de, **kwargs)
+
+        for this_age, template, bounds in zip(chunk, templates,
+                                              window_bounds):
+            amp, snr = calculate_amplitude_snr(fc, fc2, template)
+
+            _mask_err(template_obj, snr)
+            WindowedTemplate.mask_window(amp, bounds)
+            WindowedTemplate.mask_window(snr, bounds)
+
+            yield amp, this_age, angle, snr
+
+        del templates
+
+
+def match_template_variants(data, Templates, scale, age, angle, **kwargs):
+    """Match several template variants to curvature using shared convolutions
+
+    Variants must share the same template function up to sign, differing
+    only in their template_sign and error masks (e.g.
+    LeftFacingUpperBreakScarp and RightFacingUpperBreakScarp). The
+    cross-correlation and local energy terms are computed once and each
+    variant's sign and masks are applied at the end.
+
+    Parameters
+    ----------
+    data : DEMGrid
+        Grid object of elevation data
+    Templates : list
+        List of classes representing template variants
+    scale : float
+        Scale of template function in DEM cell units
+    age : float
+        Age parameter for template function
+    angle : float
+        Orientation of template in radians
+
+    Other Parameters
+    ----------------
+    kwargs : optional
+        Any additional keyword arguments that may be passed to the template
+        constructors
+
+    Returns
+    -------
+    results : list
+        List of (amp, age, angle, snr) results, one per template variant, as
+        returned by match_template()
+    """
+
+    curv = calculate_curvature(data, Templates[0], angle)
+    ny, nx = curv.shape
+    de = data._georef_info.dx
+
+    template_objs = [_create_template(Template, scale, age, angle, nx, ny, de,
+                                      **kwargs) for Template in Templates]
+    template = template_objs[0].template_sign * template_objs[0].template()
+
+    fc = fft2(curv)
+    fc2 = fft2(numexpr.evaluate("curv**2"))
+    del curv
+
+    amp, snr = calculate_amplitude_snr(fc, fc2, template)
+    del template, fc, fc2
+
+    results = []
+    for template_obj in template_objs:
+        this_amp = template_obj.template_sign * amp
+        this_snr = snr.copy()
+
+        _mask_err(template_obj, this_snr)
+        _mask_window(template_obj, this_amp, this_snr)
+
+        results.append((this_amp, age, angle, this_snr))
+
+    return results
+
+
+def match_template_offsets(data, Template, scale, age, angle, dx, dy,
+                           **kwargs):
+    """Match template function shifted by vectors of offsets to curvature
+
+    The template and curvature spectra are computed once and each offset is
+    applied as a phase ramp, with all offsets evaluated by a single batched
+    inverse FFT. Offsets may be fractional. Shifts are circular, so for
+    integer offsets they match ShiftedTemplateMixin.shift_template() only
+    where the shifted template does not reach the grid edge.
+
+    Parameters
+    ----------
+    data : DEMGrid
+        Grid object of elevation data
+    Template : WindowedTemplate
+        Class representing template function. For subclasses of
+        ShiftedTemplateMixin, the unshifted template is used.
+    scale : float
+        Scale of template function in DEM cell units
+    age : float
+        Age parameter for template function
+    angle : float
+        Orientation of template in radians
+    dx : float or np.array
+        X offsets of template center in cells
+    dy : float or np.array
+        Y offsets of template center in cells
+
+    Other Parameters
+    ----------------
+    kwargs : optional
+        Any additional keyword arguments that may be passed to the template
+        constructor
+
+    Returns
+    -------
+    results : list
+        List of (amp, age, angle, snr) results, one per offset, as returned
+        by match_template()
+    """
+
+    curv = calculate_curvature(data, Template, angle)
+    ny, nx = curv.shape
+    de = data._georef_info.dx
+
+    if issubclass(Template, WindowedTemplate.ShiftedTemplateMixin):
+        kwargs.update(dx=0, dy=0)
+
+    template_obj = _create_template(Template, scale, age, angle, nx, ny, de,
+                                    **kwargs)
+    template = template_obj.template()
+    ramp = WindowedTemplate.phase_ramp(nx, ny, dx, dy)
+
+    fc = fft2(curv)
+    fc2 = fft2(numexpr.evaluate("curv**2"))
+    del curv
+
+    amp, snr = calculate_amplitude_snr(fc, fc2, template, ramp=ramp)
+    del template, ramp, fc, fc2
+
+    results = []
+    for this_amp, this_snr in zip(amp, snr):
+        _mask_err(template_obj, this_snr)
+        _mask_window(template_obj, this_amp, this_snr)
+
+        results.append((this_amp, age, angle, this_snr))
+
+    return results
+
+
+def match_points(data, Template, scale, x, y, age=None, ang_max=np.pi / 2,
+                 ang_min=-np.pi / 2, **kwargs):
+    """Find best-fit template parameters at selected points
+
+    Amplitudes and SNRs are evaluated only at the points, by direct products
+    of templates with the curvature around each point, so no full-grid
+    Fourier transforms are computed. Results are consistent with match().
+    Templates without bounded support (e.g. Ricker wavelets) raise a
+    ValueError.
+
+    Parameters
+    ----------
+    data : DEMGrid
+        Grid object of elevation data
+    Template : WindowedTemplate
+        Class representing template function
+    scale : float
+        Scale of template function in DEM cell units
+    x : np.array
+        x coordinates of points in data projection units
+    y : np.array
+        y coordinates of points in data projection units
+    age : float or np.array, optional
+        Age parameters to search. Default is the age range searched by
+        match().
+
+    Other Parameters
+    ----------------
+    ang_max : float, optional
+        Maximum orietnation of template, default pi / 2
+    ang_min : float, optional
+        Minimum orietnation of template, default -pi / 2
+    kwargs : optional
+        Any additional keyword arguments that may be passed to the template
+        constructor
+
+    Returns
+    -------
+    results : np.array
+        Array of best amplitudes, ages, orientations, and signal-to-noise
+        ratios at each point. Dimensions of (4, number of points).
+    """
+
+    rows, cols = data._georef_info.xy_to_pixel(np.ravel(x), np.ravel(y))
+    ny, nx = data._griddata.shape
+    outside = (rows < 0) | (rows >= ny) | (cols < 0) | (cols >= nx)
+    if np.any(outside):
+        raise ValueError("{:d} points are outside grid".format(outside.sum()))
+
+    if age is None:
+        age = 10 ** np.arange(0, 3.5, 0.1)
+    ages = np.atleast_1d(age).astype(float)
+
+    best = np.zeros((4, len(rows)))
+    for angle in get_orientations(Template, ang_min, ang_max):
+        amp, snr = match_template_points(data, Template, scale, ages, angle,
+                                         rows, cols, **kwargs)
+
+        idx = np.argmax(snr, axis=0)
+        points = np.arange(len(rows))
+        this_snr = snr[idx, points]
+        better = this_snr > best[3]
+
+        best[0, better] = amp[idx, points][better]
+        best[1, better] = ages[idx][better]
+        best[2, better] = angle
+        best[3, better] = this_snr[better]
+
+    return best
+
+
+def match_template_points(data, Template, scale, age, angle, rows, cols,
+                          max_elements=2 ** 22, **kwargs):
+    """Match template function to curvature at selected pixels
+
+    Evaluates the terms of calculate_amplitude_snr() at each pixel as
+    products of template values with curvature values gathered around the
+    pixel, with the same circular indexing as the Fourier transforms. Work
+    is batched over pixels and over a vector of ages.
+
+    Templates are sampled on the smallest grid containing their extent (see
+    get_halo()) with the same row and column parity as the DEM, so results
+    equal those of match_template(). Templates without bounded support
+    (e.g. Ricker wavelets) raise a ValueError.
+
+    Parameters
+    ----------
+    data : DEMGrid
+        Grid object of elevation data
+    Template : WindowedTemplate
+        Class representing template function
+    scale : float
+        Scale of template function in DEM cell units
+    age : float or np.array
+        Age parameter for template function, or vector of ages
+    angle : float
+        Orientation of template in radians
+    rows : np.array
+        Row indices of pixels
+    cols : np.array
+        Column indices of pixels
+    max_elements : int, optional
+        Maximum number of curvature values gathered at once
+
+    Other Parameters
+    ----------------
+    kwargs : optional
+        Any additional keyword arguments that may be passed to the template
+        constructor
+
+    Returns
+    -------
+    amp : np.array
+        Amplitudes at each pixel. Dimensions of (number of ages, number of
+        pixels), or (number of pixels,) if a single age is given.
+    snr : np.array
+        Signal-to-noise ratios at each pixel, with the same dimensions as amp
+    """
+
+    eps = np.spacing(1)
+
+    ages = np.atleast_1d(age).astype(float)
+    rows = np.asarray(rows, dtype=int).ravel()
+    cols = np.asarray(cols, dtype=int).ravel()
+    ny, nx = data._griddata.shape
+    de = data._georef_info.dx
+
+    halo = get_halo(Template, scale, ages, de, **kwargs)
+    my = _support_grid_size(halo, ny)
+    mx = _support_grid_size(halo, nx)
+
+    templates = Template.template_stack(scale, ages, angle, mx, my, de,
+                                        **kwargs)
+    su, sv = np.nonzero(np.any(templates != 0, axis=0))
+    t_vals = templates[:, su, sv]
+    del templates
+
+    M = (t_vals != 0).astype(float)
+    n = np.sum(M, axis=1) + eps
+    template_sum = np.sum(t_vals ** 2, axis=1)
+
+    # Curvature cells paired with each template cell by fftshift(ifft2(...))
+    # in calculate_amplitude_snr()
+    offset_r = ny % 2 - (su - my // 2)
+    offset_c = nx % 2 - (sv - mx // 2)
+    alpha = None if Template.symmetry_period == 0 else angle
+
+    xcorr = np.empty((len(rows), len(ages)))
+    T3 = np.empty((len(rows), len(ages)))
+    chunk = max(max_elements // max(len(su), 1), 1)
+    for i in range(0, len(rows), chunk):
+        gather_r = (rows[i:i + chunk, np.newaxis] + offset_r) % ny
+        gather_c = (cols[i:i + chunk, np.newaxis] + offset_c) % nx
+        curv = data._calculate_laplacian_at(alpha, gather_r, gather_c)
+        numexpr.evaluate("where(curv != curv, 0, curv)", out=curv)
+
+        xcorr[i:i + chunk] = curv.dot(t_vals.T)
+        T3[i:i + chunk] = numexpr.evaluate("curv**2").dot(M.T)
+        del curv
+
+    xcorr = xcorr.T
+    T3 = T3.T
+    template_sum = template_sum[:, np.newaxis]
+    n = n[:, np.newaxis]
+
+    amp = numexpr.evaluate("xcorr/template_sum")
+    T1 = numexpr.evaluate("template_sum*(amp**2)")
+    error = (1/n)*numexpr.evaluate("T1 - 2*amp*xcorr + T3") + eps
+    snr = numexpr.evaluate("abs(T1/error)")
+
+    bounds = Template.window_bounds_stack(scale, ages, angle, nx, ny, de,
+                                          **kwargs)
+    top, bottom, left, right = [b[:, np.newaxis] for b in bounds.T]
+    border = (rows < top) | (rows >= np.maximum(ny - bottom, 0)) \
+        | (cols < left) | (cols >= np.maximum(nx - right, 0))
+    amp[border] = 0
+    snr[border] = 0
+
+    template_obj = _create_template(Template, scale, ages[0], angle, nx, ny,
+                                    de, **kwargs)
+    if hasattr(template_obj, 'get_err_bounds'):
+        start, stop = template_obj.get_err_bounds()
+        snr[:, (cols >= start[rows]) & (cols < stop[rows])] = 0
+    elif hasattr(template_obj, 'get_err_mask'):
+        snr[:, template_obj.get_err_mask()[rows, cols]] = 0
+
+    if np.ndim(age) == 0:
+        return amp[0], snr[0]
+
+    return amp, snr
+
+
+def _support_grid_size(halo, n):
+    """Return size of grid containing template support, with parity of n"""
+
+    m = 2 * halo + 1
+    if m % 2 != n % 2:
+        m += 1
+
+    return min(m, n)
+
+
+def get_pyramid_factor(age, de, scale=None,
+                       cells_per_width=PYRAMID_CELLS_PER_WIDTH):
+    """Get coarsest pyramid level that resolves a template's diffusion width
+
+    Parameters
+    ----------
+    age : float
+        Age parameter for template function
+    de : float
+        Native grid spacing
+    scale : float, optional
+        Scale of template function. If given, the level must also resolve
+        the template's scale.
+    cells_per_width : float, optional
+        Minimum number of cells across the diffusion width sqrt(age), and
+        across the scale if given
+
+    Returns
+    -------
+    factor : int
+        Decimation factor, a power of two so that levels are shared between
+        ages
+    """
+
+    width = np.sqrt(age) if scale is None else min(np.sqrt(age), scale)
+    cells = width / (cells_per_width * abs(de))
+    if cells < 2:
+        return 1
+
+    return int(2 ** np.floor(np.log2(cells)))
+
+
+def match_template_pyramid(data, Template, scale, age, angle, factor=None,
+                           **kwargs):
+    """Match template function at a coarser level of a resolution pyramid
+
+    The DEM is smoothed and decimated by DEMGrid.get_pyramid_level(), and
+    the template age is increased by the diffusion age of the smoothing.
+    Results are upsampled to the native grid by nearest neighbour
+    interpolation. SNRs are not rescaled, as smoothing reduces the curvature
+    noise by about as much as the smaller number of cells reduces the
+    template energy.
+
+    Parameters
+    ----------
+    data : DEMGrid
+        Grid object of elevation data
+    Template : WindowedTemplate
+        Class representing template function
+    scale : float
+        Scale of template function in DEM cell units
+    age : float
+        Age parameter for template function
+    angle : float
+        Orientation of template in radians
+    factor : int, optional
+        Decimation factor. Default is chosen by get_pyramid_factor().
+
+    Other Parameters
+    ----------------
+    kwargs : optional
+        Any additional keyword arguments that may be passed to the template()
+        method of the Template class
+
+    Returns
+    -------
+    amp : np.array
+        2-D array of amplitudes for each DEM pixel
+    age : np.array
+        template age in m2
+    angle : np.array
+        template orientation in radians
+    snr : np.array
+        2-D array of signal-to-noise ratios for each DEM pixel
+    """
+
+    if factor is None:
+        factor = get_pyramid_factor(age, data._georef_info.dx, scale)
+    if factor == 1:
+        return match_template(data, Template, scale, age, angle, **kwargs)
+
+    level = data.get_pyramid_level(factor)
+    amp, _, _, snr = match_template(level, Template, scale,
+                                    age + level.smoothing_age, angle,
+                                    **kwargs)
+    amp, snr = _from_pyramid_level(np.stack([amp, snr]), factor,
+                                   data._griddata.shape)
+
+    return amp, age, angle, snr
+
+
+def calculate_pyramid_error(data, Template, scale, age, angle, factor=None,
+                            **kwargs):
+    """Compare template matching at a pyramid level with full resolution
+
+    Parameters
+    ----------
+    data : DEMGrid
+        Grid object of elevation data
+    Template : WindowedTemplate
+        Class representing template function
+    scale : float
+        Scale of template function in DEM cell units
+    age : float
+        Age parameter for template function
+    angle : float
+        Orientation of template in radians
+    factor : int, optional
+        Decimation factor. Default is chosen by get_pyramid_factor().
+
+    Returns
+    -------
+    amp_error : float
+        Median absolute amplitude error, relative to median absolute
+        amplitude at full resolution
+    snr_error : float
+        Median absolute SNR error, relative to median SNR at full resolution
+    """
+
+    amp, _, _, snr = match_template(data, Template, scale, age, angle,
+                                    **kwargs)
+    amp_level, _, _, snr_level = match_template_pyramid(data, Template, scale,
+                                                        age, angle, factor,
+                                                        **kwargs)
+
+    # Compare cells away from window borders at both resolutions
+    valid = (snr > 0) & (snr_level > 0)
+    if not valid.any():
+        return np.nan, np.nan
+
+    amp_error = np.median(np.abs(amp_level[valid] - amp[valid])) \
+        / np.median(np.abs(amp[valid]))
+    snr_error = np.median(np.abs(snr_level[valid] - snr[valid])) \
+        / np.median(snr[valid])
+
+    return amp_error, snr_error
+
+
+def _match_pyramid_level(data, Template, age, factor, **kwargs):
+    """Find best-fit parameters at a pyramid level and upsample them"""
+
+    if factor == 1:
+        return calculate_best_fit_parameters(data, Template, age=age, **kwargs)
+
+    level = data.get_pyramid_level(factor)
+    results = calculate_best_fit_parameters(level, Template,
+                                            age=age + level.smoothing_age,
+                                            **kwargs)
+
+    shape = data._griddata.shape
+    if isinstance(results, list):
+        return [_rescale_pyramid_results(r, age, factor, shape)
+                for r in results]
+
+    return _rescale_pyramid_results(results, age, factor, shape)
+
+
+def _rescale_pyramid_results(results, age, factor, shape):
+    """Restore template age and native resolution of results"""
+
+    results = _from_pyramid_level(results, factor, shape)
+    results[1] = np.where(results[1] > 0, age, 0)
+
+    return results
+
+
+def _from_pyramid_level(array, factor, shape):
+    """Upsample trailing grid dimensions of array by nearest neighbour"""
+
+    ny, nx = shape
+    rows = np.minimum(np.arange(ny) // factor, array.shape[-2] - 1)
+    cols = np.minimum(np.arange(nx) // factor, array.shape[-1] - 1)
+
+    return array[..., rows[:, np.newaxis], cols]
+
+
+def _mask_window(template_obj, *arrays):
+    """Zero cells within window border of template in place"""
+
+    bounds = template_obj.get_window_bounds()
+    for array in arrays:
+        WindowedTemplate.mask_window(array, bounds)
+
+
+def _mask_err(template_obj, snr):
+    """Zero SNR of cells masked by error mask of template in place"""
+
+    if hasattr(template_obj, 'get_err_bounds'):
+        start, stop = template_obj.get_err_bounds()
+        WindowedTemplate.mask_ranges(snr, start, stop)
+    elif hasattr(template_obj, 'get_err_mask'):
+        snr[template_obj.get_err_mask()] = 0
+
+
+def _create_template(Template, scale, age, angle, nx, ny, de, **kwargs):
+    """Create template object, omitting orientation for isotropic templates"""
+
+    if Template.symmetry_period == 0:
+        return Template(scale, age, nx, ny, de, **kwargs)
+
+    return Template(scale, age, angle, nx, ny, de, **kwargs)
+
+
+def calculate_amplitude_snr(fc, fc2, template, ramp=None):
+    """Calculate amplitude and SNR of a template from curvature spectra
+
+    Spectra of the curvature grid are passed in so that they can be shared
+    between templates matched at the same orientation.
+
+    Parameters
+    ----------
+    fc : np.array
+        2-D Fourier transform of curvature grid
+    fc2 : np.array
+        2-D Fourier transform of squared curvature grid
+    template : np.array
+        2-D array of template function
+    ramp : np.array, optional
+        Stack of phase ramps from WindowedTemplate.phase_ramp(). If given,
+        the template is shifted by each ramp's offset and results are
+        computed for all offsets with a single batched inverse FFT.
+
+    Returns
+    -------
+    amp : np.array
+        2-D array of amplitudes for each DEM pixel, or stack of arrays with
+        one per phase ramp
+    snr : np.array
+        2-D array of signal-to-noise ratios for each DEM pixel, or stack of
+        arrays with one per phase ramp
+    """
+
+    eps = np.spacing(1)
+
+    M = numexpr.evaluate("template != 0")
+    fm2 = fft2(M)
+    n = np.sum(M) + eps
+    del M
+
+    ft = fft2(template)
+    template_sum = np.sum(numexpr.evaluate("template**2"))
+
+    if ramp is None:
+        fxcorr = numexpr.evaluate("ft*fc")
+        fenergy = numexpr.evaluate("fc2*fm2")
+    else:
+        fxcorr = numexpr.evaluate("ft*fc*ramp")
+        fenergy = numexpr.evaluate("fc2*fm2*ramp")
+
+    xcorr = np.real(fftshift(ifft2(fxcorr), axes=(-2, -1)))
+    amp = numexpr.evaluate("xcorr/template_sum")
+    del fxcorr
+
+    T1 = numexpr.evaluate("template_sum*(amp**2)")
+    T3 = fftshift(ifft2(fenergy), axes=(-2, -1))
+    del fenergy
+
+    # XXX: Epsilon factor is added to avoid small-magnitude dvision
+    error = (1/n)*numexpr.evaluate("real(T1 - 2*amp*xcorr + T3)") + eps
+    snr = numexpr.evaluate("abs(T1/error)")
+
+    return amp, snr
 
 
 def plot_results(data, results, az=315, elev=45, figsize=(4, 16)):
@@ -0,0 +1,293 @@
+""" Persistent catalog of raster tile metadata """
+
+import os
+import sqlite3
+
+import numpy as np
+
+from collections import namedtuple
+from osgeo import gdal
+
+from scarplet.utils import BoundingBoxArray, TileIndex, file_checksum, \
+    tile_files
+
+
+FIELDS = ('path', 'xmin', 'ymin', 'xmax', 'ymax', 'dx', 'dy', 'nx', 'ny',
+          'dtype', 'projection', 'nodata_value', 'nodata_fraction', 'mtime',
+          'size', 'checksum')
+
+TileRecord = namedtuple('TileRecord', FIELDS)
+
+
+class TileCatalog(object):
+    """SQLite catalog of raster tile footprints and metadata
+
+    Stores the footprint, resolution, data type, nodata fraction,
+    modification time, size and checksum of each tile. Tiles are only
+    reopened when their modification time or size changes, so planning a run
+    over thousands of tiles does not need to open them.
+
+    Attributes
+    ----------
+    path : str
+        Path to SQLite database
+
+    Methods
+    -------
+    update(paths):
+        Add new or modified tiles to catalog
+    query(xmin, ymin, xmax, ymax):
+        Find tiles intersecting a bounding box
+    tiles():
+        List all tiles in catalog
+    remove(paths):
+        Remove tiles from catalog
+    prune(roots):
+        Remove tiles that no longer exist on disk
+    tile_index():
+        Build spatial index over tile footprints
+    """
+
+    def __init__(self, path):
+        """Open or create catalog
+
+        Parameters
+        ----------
+        path : str
+            Path to SQLite database, or ':memory:' for a temporary catalog
+        """
+
+        self.path = path
+        self._connection = sqlite3.connect(path)
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS tiles (
+                path TEXT PRIMARY KEY,
+                xmin REAL, ymin REAL, xmax REAL, ymax REAL,
+                dx REAL, dy REAL, nx INTEGER, ny INTEGER,
+                dtype TEXT, projection TEXT,
+                nodata_value REAL, nodata_fraction REAL,
+                mtime REAL, size INTEGER, checksum TEXT)""")
+        self._connection.execute("""
+            CREATE INDEX IF NOT EXISTS tiles_x ON tiles (xmin, xmax)""")
+        self._connection.execute("""
+            CREATE INDEX IF NOT EXISTS tiles_y ON tiles (ymin, ymax)""")
+        self._connection.commit()
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *args):
+
+        self.close()
+
+    def __len__(self):
+
+        cursor = self._connection.execute("SELECT COUNT(*) FROM tiles")
+        return cursor.fetchone()[0]
+
+    def close(self):
+        """Close connection to database"""
+
+        self._connection.close()
+
+    def update(self, paths, checksum=True):
+        """Add new or modified tiles to catalog
+
+        Tiles whose modification time and size match the catalog are skipped
+        without being opened. Tiles in the directories of the given paths
+        that no longer exist are removed from the catalog.
+
+        Parameters
+        ----------
+        paths : list
+            Paths of tiles. Directories holding a single raster (e.g. ArcInfo
+            grids) are treated as one tile.
+        checksum : bool, optional
+            If True (default), store SHA-256 checksum of each tile
+
+        Returns
+        -------
+        updated : list
+            Paths of tiles that were added or updated
+        """
+
+        if isinstance(paths, str):
+            paths = [paths]
+
+        paths = [os.path.abspath(path) for path in paths]
+        self.prune(set(os.path.dirname(path) for path in paths))
+
+        known = dict((row[0], row[1:]) for row in self._connection.execute(
+            "SELECT path, mtime, size FROM tiles"))
+
+        updated = []
+        for path in paths:
+            mtime, size = _signature(path)
+            if known.get(path) == (mtime, size):
+                continue
+
+            record = read_tile_metadata(path, checksum=checksum)
+            self._connection.execute(
+                "INSERT OR REPLACE INTO tiles VALUES ({})".format(
+                    ", ".join("?" * len(FIELDS))), record)
+            updated.append(path)
+
+        self._connection.commit()
+
+        return updated
+
+    def remove(self, paths):
+        """Remove tiles from catalog
+
+        Parameters
+        ----------
+        paths : list
+            Paths of tiles
+        """
+
+        if isinstance(paths, str):
+            paths = [paths]
+
+        self._connection.executemany("DELETE FROM tiles WHERE path = ?",
+                                     [(os.path.abspath(p),) for p in paths])
+        self._connection.commit()
+
+    def prune(self, roots=None):
+        """Remove tiles that no longer exist on disk
+
+        Parameters
+        ----------
+        roots : list, optional
+            Directories to check. By default, all tiles are checked.
+
+        Returns
+        -------
+        removed : list
+            Paths of tiles that were removed
+        """
+
+        if isinstance(roots, str):
+            roots = [roots]
+        if roots is not None:
+            roots = [os.path.join(os.path.abspath(root), '') for root in roots]
+
+        removed = []
+        for row in self._connection.execute("SELECT path FROM tiles"):
+            path = row[0]
+            if roots is not None and \
+                    not any(path.startswith(root) for root in roots):
+                continue
+            if not os.path.exists(path):
+                removed.append(path)
+
+        self.remove(removed)
+
+        return removed
+
+    def query(self, xmin, ymin, xmax, ymax):
+        """Find tiles intersecting or touching a bounding box
+
+        Parameters
+        ----------
+        xmin, ymin, xmax, ymax : float
+            Extent of bounding box in data projection units
+
+        Returns
+        -------
+        tiles : list
+            List of TileRecords of intersecting tiles, sorted by path
+        """
+
+        cursor = self._connection.execute(
+            "SELECT * FROM tiles WHERE xmin <= ? AND xmax >= ? "
+            "AND ymin <= ? AND ymax >= ? ORDER BY path",
+            (xmax, xmin, ymax, ymin))
+
+        return [TileRecord(*row) for row in cursor]
+
+    def tiles(self):
+        """List all tiles in catalog
+
+        Returns
+        -------
+        tiles : list
+            List of TileRecords, sorted by path
+        """
+
+        cursor = self._connection.execute("SELECT * FROM tiles ORDER BY path")
+        return [TileRecord(*row) for row in cursor]
+
+    def tile_index(self):
+        """Build spatial index over tile footprints
+
+        Returns
+        -------
+        tiles : list
+            List of TileRecords, sorted by path
+        index : TileIndex
+            Spatial index whose indices refer to the list of tiles
+        """
+
+        tiles = self.tiles()
+        bboxes = BoundingBoxArray([t.xmin for t in tiles],
+                                  [t.ymin for t in tiles],
+                                  [t.xmax for t in tiles],
+                                  [t.ymax for t in tiles])
+
+        return tiles, TileIndex(bboxes)
+
+
+def read_tile_metadata(path, checksum=True):
+    """Read metadata of a raster tile
+
+    Parameters
+    ----------
+    path : str
+        Path to tile
+    checksum : bool, optional
+        If True (default), calculate SHA-256 checksum of tile
+
+    Returns
+    -------
+    record : TileRecord
+        Metadata of tile
+    """
+
+    path = os.path.abspath(path)
+    dataset = gdal.Open(path)
+    if dataset is None:
+        raise IOError("Could not open {}".format(path))
+
+    gt = dataset.GetGeoTransform()
+    nx = dataset.RasterXSize
+    ny = dataset.RasterYSize
+    x = (gt[0], gt[0] + gt[1] * nx)
+    y = (gt[3], gt[3] + gt[5] * ny)
+
+    band = dataset.GetRasterBand(1)
+    nodata = band.GetNoDataValue()
+    data = band.ReadAsArray()
+    missing = np.isnan(data) if np.issubdtype(data.dtype, np.floating) \
+        else np.zeros(data.shape, dtype=bool)
+    if nodata is not None:
+        missing |= data == nodata
+    nodata_fraction = float(missing.mean()) if missing.size else 0.
+
+    mtime, size = _signature(path)
+
+    return TileRecord(path, min(x), min(y), max(x), max(y), gt[1], gt[5],
+                      nx, ny, str(data.dtype), dataset.GetProjection(),
+                      nodata, nodata_fraction, mtime, size,
+                      file_checksum(path) if checksum else None)
+
+
+def _signature(path):
+    """Return latest modification time and total size of a tile"""
+
+    stats = [os.stat(f) for f in tile_files(path)]
+    mtime = max([s.st_mtime for s in stats] + [os.stat(path).st_mtime])
+    size = sum(s.st_size for s in stats)
+
+    return mtime, size
+
@@ -0,0 +1,315 @@
+""" Concurrent, resumable downloads of raster tiles """
+
+import json
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from html.parser import HTMLParser
+from urllib.parse import urljoin, unquote
+
+from scarplet.utils import CHUNK_SIZE, file_checksum
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError:
+    requests = None
+
+
+MANIFEST_NAME = 'manifest.json'
+PARTIAL_SUFFIX = '.part'
+
+
+class TileDownloader(object):
+    """Download files over a pooled HTTP session with a bounded worker pool
+
+    Interrupted downloads are resumed with HTTP range requests. Completed
+    files are verified against the expected size and, if given, SHA-256
+    checksum before being recorded in a JSON manifest in the destination
+    directory. Files already in the manifest are not downloaded again.
+
+    Attributes
+    ----------
+    dest_dir : str
+        Directory to download files to
+    max_workers : int
+        Maximum number of concurrent downloads
+    retries : int
+        Number of attempts per file
+    timeout : float
+        Timeout of each request in seconds
+    manifest : dict
+        Completed files, keyed by path relative to destination directory
+
+    Methods
+    -------
+    list_files(url):
+        List files in a remote directory listing
+    download(urls):
+        Download a list of files
+    download_directory(url):
+        Download all files in a remote directory
+    """
+
+    def __init__(self, dest_dir, max_workers=8, retries=3, timeout=60,
+                 session=None):
+        """Create downloader
+
+        Parameters
+        ----------
+        dest_dir : str
+            Directory to download files to
+        max_workers : int, optional
+            Maximum number of concurrent downloads
+        retries : int, optional
+            Number of attempts per file
+        timeout : float, optional
+            Timeout of each request in seconds
+        session : requests.Session, optional
+            Session to reuse. By default a session with a connection pool of
+            size max_workers is created.
+        """
+
+        if requests is None:
+            raise ImportError("TileDownloader requires the requests package")
+
+        self.dest_dir = dest_dir
+        self.max_workers = max_workers
+        self.retries = retries
+        self.timeout = timeout
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.session = session
+
+        if not os.path.exists(dest_dir):
+            os.makedirs(dest_dir)
+
+        self._lock = threading.Lock()
+        self.manifest = self._load_manifest()
+
+    @property
+    def manifest_path(self):
+
+        return os.path.join(self.dest_dir, MANIFEST_NAME)
+
+    def list_files(self, url):
+        """List files in a remote directory. Ignores hidden files and
+        subdirectories.
+
+        Assumes the URL returns an HTML directory listing.
+
+        Parameters
+        ----------
+        url : str
+            URL of directory
+
+        Returns
+        -------
+        urls : list
+            URLs of files in directory
+        """
+
+        url = url.replace(' ', '%20')
+        if not url.endswith('/'):
+            url += '/'
+
+        response = self.session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+
+        parser = _LinkParser()
+        parser.feed(response.text)
+
+        urls = []
+        for link in parser.links:
+            name = link.split('?')[0].split('#')[0]
+            if not name or name.startswith(('.', '/')) or name.endswith('/') \
+                    or '://' in name:
+                continue
+            urls.append(urljoin(url, name))
+
+        return urls
+
+    def download_directory(self, url, checksums=None):
+        """Download all files in a remote directory into a subdirectory of the
+        destination directory
+
+        Parameters
+        ----------
+        url : str
+            URL of directory
+        checksums : dict, optional
+            Expected SHA-256 checksums, keyed by file name
+
+        Returns
+        -------
+        paths : list
+            Paths of downloaded files
+        """
+
+        name = unquote(url.rstrip('/').split('/')[-1])
+        urls = self.list_files(url)
+
+        if checksums is not None:
+            checksums = dict((os.path.join(name, fn), value)
+                             for fn, value in checksums.items())
+
+        return self.download(urls, subdir=name, checksums=checksums)
+
+    def download(self, urls, subdir='', checksums=None):
+        """Download a list of files concurrently
+
+        Parameters
+        ----------
+        urls : list
+            URLs of files
+        subdir : str, optional
+            Subdirectory of destination directory to download files to
+        checksums : dict, optional
+            Expected SHA-256 checksums, keyed by path relative to destination
+            directory
+
+        Returns
+        -------
+        paths : list
+            Paths of downloaded files, in the same order as urls
+        """
+
+        if checksums is None:
+            checksums = {}
+
+        names = [os.path.join(subdir, unquote(url.rstrip('/').split('/')[-1]))
+                 for url in urls]
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(self._download, url, name,
+                                       checksums.get(name))
+                       for url, name in zip(urls, names)]
+            paths = [f.result() for f in futures]
+
+        return paths
+
+    def _download(self, url, name, checksum=None):
+        """Download a single file, retrying and resuming on failure"""
+
+        path = os.path.join(self.dest_dir, name)
+        if self._is_complete(name, checksum):
+            return path
+
+        directory = os.path.dirname(path)
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        error = None
+        for _ in range(self.retries):
+            try:
+                size = self._fetch(url, path + PARTIAL_SUFFIX)
+            except (requests.RequestException, IOError) as e:
+                error = e
+                continue
+
+            digest = file_checksum(path + PARTIAL_SUFFIX)
+            if checksum is not None and digest != checksum:
+                os.remove(path + PARTIAL_SUFFIX)
+                error = IOError("Checksum mismatch for {}".format(url))
+                continue
+
+            os.replace(path + PARTIAL_SUFFIX, path)
+            self._record(name, {'url': url, 'size': size, 'sha256': digest})
+            return path
+
+        raise IOError("Could not download {}: {}".format(url, error))
+
+    def _fetch(self, url, path):
+        """Download a file to path, resuming from any existing partial file
+
+        Returns
+        -------
+        size : int
+            Size of complete file in bytes
+        """
+
+        offset = os.path.getsize(path) if os.path.exists(path) else 0
+        headers = {'Range': 'bytes={:d}-'.format(offset)} if offset else {}
+
+        with self.session.get(url, headers=headers, stream=True,
+                              timeout=self.timeout) as response:
+            if response.status_code == 416:
+                # Partial file is longer than remote file
+                os.remove(path)
+                raise IOError("Invalid partial download of {}".format(url))
+            response.raise_for_status()
+
+            if response.status_code == 206:
+                total = response.headers.get('Content-Range', '').split('/')[-1]
+                size = int(total) if total.isdigit() else None
+                mode = 'ab'
+            else:
+                length = response.headers.get('Content-Length')
+                size = int(length) if length is not None else None
+                mode = 'wb'
+
+            with open(path, mode) as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    f.write(chunk)
+
+        received = os.path.getsize(path)
+        if size is not None and received != size:
+            if received > size:
+                os.remove(path)
+            raise IOError("Incomplete download of {}: {:d} of {:d} bytes"
+                          .format(url, received, size))
+
+        return received
+
+    def _is_complete(self, name, checksum=None):
+        """Check if a file is recorded in the manifest and unchanged on disk"""
+
+        record = self.manifest.get(name)
+        path = os.path.join(self.dest_dir, name)
+        if record is None or not os.path.exists(path):
+            return False
+        if os.path.getsize(path) != record['size']:
+            return False
+
+        return checksum is None or checksum == record['sha256']
+
+    def _load_manifest(self):
+
+        if not os.path.exists(self.manifest_path):
+            return {}
+
+        with open(self.manifest_path) as f:
+            return json.load(f)
+
+    def _record(self, name, record):
+        """Add a completed file to the manifest and save it atomically"""
+
+        with self._lock:
+            self.manifest[name] = record
+            tmp_path = self.manifest_path + PARTIAL_SUFFIX
+            with open(tmp_path, 'w') as f:
+                json.dump(self.manifest, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.manifest_path)
+
+
+class _LinkParser(HTMLParser):
+    """Collect link targets from an HTML page"""
+
+    def __init__(self):
+
+        HTMLParser.__init__(self)
+        self.links = []
+
+    def handle_starttag(self, tag, attrs):
+
+        if tag == 'a':
+            href = dict(attrs).get('href')
+            if href is not None:
+                self.links.append(href)
+
@@ -0,0 +1,210 @@
+""" Planning and building of regional mosaics from raster tiles """
+
+import hashlib
+import json
+import os
+import uuid
+
+import numpy as np
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from osgeo import gdal
+
+from scarplet.utils import BoundingBoxArray, TileIndex
+
+
+SIGNATURE_SUFFIX = '.sig'
+
+MosaicJob = namedtuple('MosaicJob', ['name', 'bounds', 'inputs', 'signature'])
+
+
+def plan_mosaics(tiles, block_width, block_height, overlap=0, origin=None,
+                 prefix='mosaic'):
+    """Plan set of output mosaics covering a collection of tiles
+
+    Output mosaics are blocks of a fixed grid anchored at an origin, padded
+    on each side by an overlap. The plan only depends on the tile footprints,
+    so it is reproducible and every block is built exactly once.
+
+    Parameters
+    ----------
+    tiles : list
+        TileRecords of input tiles, e.g. from TileCatalog.tiles()
+    block_width, block_height : float
+        Size of blocks in data projection units
+    overlap : float, optional
+        Padding added to each side of blocks, default 0
+    origin : tuple, optional
+        Lower left corner (x, y) of block grid. Default is the lower left
+        corner of the tiles' extent, snapped to a multiple of the block size.
+    prefix : str, optional
+        Prefix of output names
+
+    Returns
+    -------
+    jobs : list
+        MosaicJobs holding output name, bounds (xmin, ymin, xmax, ymax), input
+        paths and a signature of the inputs, sorted by name
+    """
+
+    if len(tiles) == 0:
+        return []
+
+    bboxes = BoundingBoxArray([t.xmin for t in tiles],
+                              [t.ymin for t in tiles],
+                              [t.xmax for t in tiles],
+                              [t.ymax for t in tiles])
+    index = TileIndex(bboxes)
+
+    if origin is None:
+        origin = (np.floor(bboxes.xmin.min() / block_width) * block_width,
+                  np.floor(bboxes.ymin.min() / block_height) * block_height)
+    x0, y0 = origin
+
+    cols = np.arange(np.floor((bboxes.xmin.min() - x0) / block_width),
+                     np.ceil((bboxes.xmax.max() - x0) / block_width))
+    rows = np.arange(np.floor((bboxes.ymin.min() - y0) / block_height),
+                     np.ceil((bboxes.ymax.max() - y0) / block_height))
+    cols, rows = np.meshgrid(cols.astype(int), rows.astype(int))
+    cols = cols.ravel()
+    rows = rows.ravel()
+
+    xmin = x0 + cols * block_width - overlap
+    ymin = y0 + rows * block_height - overlap
+    xmax = x0 + (cols + 1) * block_width + overlap
+    ymax = y0 + (rows + 1) * block_height + overlap
+
+    # Shrink query boxes slightly so tiles that only touch a block are skipped
+    tol = 1e-6 * max(block_width, block_height)
+    hits = index.query_batch(BoundingBoxArray(xmin + tol, ymin + tol,
+                                              xmax - tol, ymax - tol))
+
+    jobs = []
+    for i, idx in enumerate(hits):
+        if len(idx) == 0:
+            continue
+
+        inputs = [tiles[j] for j in sorted(idx, key=lambda j: tiles[j].path)]
+        bounds = (float(xmin[i]), float(ymin[i]),
+                  float(xmax[i]), float(ymax[i]))
+        name = '{}_{:d}_{:d}'.format(prefix, rows[i], cols[i])
+        jobs.append(MosaicJob(name, bounds, [t.path for t in inputs],
+                              _signature(bounds, inputs)))
+
+    return sorted(jobs, key=lambda job: job.name)
+
+
+def build_mosaics(jobs, out_dir, max_workers=None, force=False,
+                  nodata_value=-9999):
+    """Build planned mosaics in parallel as GeoTIFFs
+
+    Outputs whose inputs are unchanged since they were last built are
+    skipped. A signature of the inputs is stored next to each output.
+
+    Parameters
+    ----------
+    jobs : list
+        MosaicJobs from plan_mosaics
+    out_dir : str
+        Directory to write mosaics to
+    max_workers : int, optional
+        Number of worker processes. Default is the number of CPUs.
+    force : bool, optional
+        If True, rebuild all mosaics
+    nodata_value : float, optional
+        Nodata value of mosaics
+
+    Returns
+    -------
+    built : list
+        Paths of mosaics that were built
+    """
+
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+
+    pending = [job for job in jobs
+               if force or not is_up_to_date(job, out_dir)]
+    if len(pending) == 0:
+        return []
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_build_mosaic, job, out_dir, nodata_value)
+                   for job in pending]
+        built = [f.result() for f in futures]
+
+    return built
+
+
+def mosaic_path(job, out_dir):
+    """Return path of output mosaic"""
+
+    return os.path.join(out_dir, job.name + '.tif')
+
+
+def is_up_to_date(job, out_dir):
+    """Check if mosaic exists and was built from unchanged inputs
+
+    Parameters
+    ----------
+    job : MosaicJob
+        Planned mosaic
+    out_dir : str
+        Directory of mosaics
+
+    Returns
+    -------
+    up_to_date : bool
+    """
+
+    path = mosaic_path(job, out_dir)
+    if not os.path.exists(path) or \
+            not os.path.exists(path + SIGNATURE_SUFFIX):
+        return False
+
+    with open(path + SIGNATURE_SUFFIX) as f:
+        return f.read().strip() == job.signature
+
+
+def _build_mosaic(job, out_dir, nodata_value):
+    """Build a single mosaic through an in-memory VRT"""
+
+    path = mosaic_path(job, out_dir)
+    tmp_path = path + '.tmp.tif'
+
+    vrt_filename = '/vsimem/scarplet_mosaic_{}.vrt'.format(uuid.uuid4().hex)
+    options = gdal.BuildVRTOptions(outputBounds=job.bounds,
+                                   VRTNodata=nodata_value)
+    vrt = out = None
+    try:
+        vrt = gdal.BuildVRT(vrt_filename, job.inputs, options=options)
+        if vrt is None:
+            raise IOError("Could not build mosaic of {}".format(job.inputs))
+
+        out = gdal.Translate(tmp_path, vrt, format='GTiff',
+                             creationOptions=['COMPRESS=DEFLATE', 'TILED=YES'])
+        if out is None:
+            raise IOError("Could not write mosaic {}".format(path))
+        out = None
+
+        os.replace(tmp_path, path)
+    finally:
+        # Datasets are closed before their files are removed
+        out = None
+        vrt = None
+        gdal.Unlink(vrt_filename)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    with open(path + SIGNATURE_SUFFIX, 'w') as f:
+        f.write(job.signature)
+
+    return path
+
+
+def _signature(bounds, tiles):
+    """Return hash of mosaic bounds and input tile metadata"""
+
+    state = [list(bounds)] + [[t.path, t.size, t.mtime, t.checksum]
+                              for t in tiles]
+    return hashlib.sha256(json.dumps(state).encode('utf-8')).hexdigest()
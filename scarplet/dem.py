@@ -4,8 +4,9 @@
 import numexpr
 import numpy as np
 import os
-import subprocess
 import sys
+import uuid
+import weakref
 
 import matplotlib
 import matplotlib.pyplot as plt
@@ -15,7 +16,7 @@ from osgeo import gdal, gdalconst
 
 from rasterio.fill import fillnodata
 
-from scarplet.utils import BoundingBox
+from scarplet.utils import BoundingBox, BoundingBoxArray, TileIndex
 
 
 sys.setrecursionlimit(10000)
@@ -23,19 +24,317 @@ sys.setrecursionlimit(10000)
 FLOAT32_MIN = np.finfo(np.float32).min
 GDAL_DRIVER_NAME = 'GTiff'
 
+# In-memory mosaic files created by mosaic() in this process, and numbers of
+# lazy grids reading each of them
+_mosaic_files = set()
+_vsimem_refs = {}
+
+
+def calculate_directional_laplacian(z, alpha, dx, dy, out=None,
+                                    dtype=np.float64):
+    """Calculate curvature of grid in arbitrary direction in a single pass.
+
+    Evaluates the directional second derivative stencil over views of the
+    input grid, writing directly into the output array. NaN values are
+    treated as zero by neighbouring cells and are NaN in the output, without
+    modifying or copying the input grid.
+
+    Parameters
+    ----------
+        z : numpy array
+            grid of elevation values
+        alpha : float
+            direction angle (azimuth) in radians. 0 is north or y-axis.
+        dx : float
+            grid spacing in x direction
+        dy : float
+            grid spacing in y direction
+        out : numpy array, optional
+            array to write curvature values to, with the same shape as z
+        dtype : numpy dtype, optional
+            data type of output if out is not given, default float64
+
+    Returns
+    -------
+        del2s : numpy array
+            grid of curvature values
+    """
+
+    a = np.cos(alpha) ** 2 / dx ** 2
+    b = -2 * np.sin(alpha) * np.cos(alpha) / dx ** 2
+    c = np.sin(alpha) ** 2 / dy ** 2
+
+    return _second_derivative_stencil(z, a, b, c, out=out, dtype=dtype)
+
+
+def _second_derivative_stencil(z, a, b, c, out=None, dtype=np.float64):
+    """Evaluate weighted sum of second derivative stencils of grid.
+
+    Computes a * d2z/dx2 + b * d2z/dxdy + c * d2z/dy2 without grid spacing,
+    which is included in the weights. Terms with zero weight are skipped.
+    """
+
+    ny, nx = z.shape
+    if out is None:
+        out = np.empty((ny, nx), dtype=dtype)
+
+    # Stencil coefficients of the d2z/dx2, d2z/dxdy and d2z/dy2 terms
+    coeffs = {'a': a, 'b': b, 'c': c, 'nan': np.nan}
+    terms = {'x': ("a*({e} - 2*{z} + {w})", 'zew'),
+             'xy': ("b*({z} - {w} - {n} + {nw})", ('z', 'w', 'n', 'nw')),
+             'y': ("c*({s} - 2*{z} + {n})", 'zsn')}
+    offsets = {'z': (0, 0), 'e': (0, 1), 'w': (0, -1), 'n': (-1, 0),
+               'nw': (-1, -1), 's': (1, 0)}
+    # NaN cells contribute zero to the stencils of their neighbours. A sum
+    # is NaN if any cell is NaN and avoids a full-grid mask
+    has_nan = np.isnan(np.sum(z))
+    if has_nan:
+        values = {name: "where(z_{0} != z_{0}, 0, z_{0})".format(name)
+                  for name in offsets}
+    else:
+        values = {name: "z_" + name for name in offsets}
+
+    # Split grid into regions where the same terms are defined; each
+    # derivative is zero on the edges where its stencil is incomplete
+    row_breaks = sorted(set([0, min(1, ny), max(ny - 1, 0), ny]))
+    col_breaks = sorted(set([0, min(1, nx), max(nx - 1, 0), nx]))
+
+    for i0, i1 in zip(row_breaks[:-1], row_breaks[1:]):
+        for j0, j1 in zip(col_breaks[:-1], col_breaks[1:]):
+            present = []
+            if a != 0 and j0 >= 1 and j1 <= nx - 1:
+                present.append('x')
+            if b != 0 and i0 >= 1 and j0 >= 1:
+                present.append('xy')
+            if c != 0 and i0 >= 1 and i1 <= ny - 1:
+                present.append('y')
+
+            local_dict = dict(coeffs)
+            local_dict['z_z'] = z[i0:i1, j0:j1]
+            for term in present:
+                for name in terms[term][1]:
+                    di, dj = offsets[name]
+                    local_dict['z_' + name] = z[i0 + di:i1 + di,
+                                                j0 + dj:j1 + dj]
+
+            expr = " + ".join(terms[term][0].format(**values)
+                              for term in present) or "0"
+            if has_nan:
+                expr = "where(z_z != z_z, nan, {})".format(expr)
+            elif not present:
+                out[i0:i1, j0:j1] = 0
+                continue
+
+            numexpr.evaluate(expr, local_dict=local_dict,
+                             out=out[i0:i1, j0:j1], casting='same_kind')
+
+    return out
+
+
+def _gaussian_filter_stack(grids, sigma, truncate=4.0):
+    """Apply Gaussian filter to each grid in a stack.
+
+    Equivalent to scipy.ndimage.gaussian_filter with reflected boundaries.
+    Large filters are applied by FFT on a reflect-padded grid, so the cost
+    does not grow with sigma.
+    """
+
+    from scipy import fft, ndimage
+
+    if sigma <= 10:
+        return np.stack([ndimage.gaussian_filter(grid, sigma, mode='reflect',
+                                                 truncate=truncate)
+                         for grid in grids])
+
+    radius = int(truncate * sigma + 0.5)
+    offsets = np.arange(-radius, radius + 1)
+    kernel = np.exp(-0.5 * (offsets / sigma) ** 2)
+    kernel /= kernel.sum()
+
+    _, ny, nx = grids.shape
+    padded = np.pad(grids, ((0, 0), (radius, radius), (radius, radius)),
+                    mode='symmetric')
+    shape = [fft.next_fast_len(n + 2 * radius, real=True)
+             for n in (ny, nx)]
+
+    # Kernels are centered on the first cell so the output is not shifted
+    kernel_y = np.zeros(shape[0])
+    kernel_y[offsets] = kernel
+    kernel_x = np.zeros(shape[1])
+    kernel_x[offsets] = kernel
+    fk = np.outer(fft.fft(kernel_y), fft.rfft(kernel_x))
+
+    filtered = fft.irfft2(fft.rfft2(padded, s=shape) * fk, s=shape)
+
+    return filtered[:, radius:radius + ny, radius:radius + nx]
+
+
+def _fill_nodata_regions(z, max_workers=None, block_size=256):
+    """Fill NaN values in grid by interpolation, one region at a time.
+
+    Labels connected regions of NaN values once and fills each region with
+    FillNoData in a window around its bounding box. The search distance of
+    each region is its greatest distance to cells outside the region, and
+    the window is padded by the search distance, so that cells are reached
+    in a single pass. Small regions in the same block are filled together to
+    limit the number of calls. Regions are read from the unfilled grid, so
+    they are filled in parallel.
+
+    Parameters
+    ----------
+        z : numpy array
+            grid of elevation values
+        max_workers : int, optional
+            maximum number of threads used to fill regions
+        block_size : int, optional
+            size of blocks used to group small regions, default 256
+
+    Returns
+    -------
+        filled : numpy array
+            grid with NaN values filled. Cells out of reach of valid data
+            remain NaN.
+    """
+
+    from concurrent.futures import ThreadPoolExecutor
+    from scipy import ndimage
+
+    ny, nx = z.shape
+    nodata = np.isnan(z)
+    labels, num_regions = ndimage.label(nodata, structure=np.ones((3, 3)))
+    if num_regions == 0 or nodata.all():
+        return z.copy()
+
+    regions = ndimage.find_objects(labels)
+    del nodata
+
+    # Group small regions by block; fill large regions on their own
+    groups = {}
+    for label, (rows, cols) in enumerate(regions, start=1):
+        # Greatest distance from region to valid data, found in its bounding
+        # box padded by one cell
+        window = (slice(max(rows.start - 1, 0), rows.stop + 1),
+                  slice(max(cols.start - 1, 0), cols.stop + 1))
+        in_region = labels[window] == label
+        if in_region.all():
+            dist = max(ny, nx)
+        else:
+            dist = ndimage.distance_transform_edt(in_region).max()
+        dist = np.ceil(dist) + 1
+
+        if max(rows.stop - rows.start, cols.stop - cols.start) + 2 * dist \
+                <= block_size:
+            key = (rows.start // block_size, cols.start // block_size)
+        else:
+            key = label
+        groups.setdefault(key, []).append((label, rows, cols, dist))
+
+    filled = z.copy()
+
+    def fill_group(group):
+        dist = max(d for _, _, _, d in group)
+        pad = int(dist)
+        window = (slice(max(min(r.start for _, r, _, _ in group) - pad, 0),
+                        min(max(r.stop for _, r, _, _ in group) + pad, ny)),
+                  slice(max(min(c.start for _, _, c, _ in group) - pad, 0),
+                        min(max(c.stop for _, _, c, _ in group) + pad, nx)))
+
+        z_window = z[window]
+        values = fillnodata(z_window, mask=~np.isnan(z_window),
+                            max_search_distance=dist)
+        in_group = np.isin(labels[window], [label for label, _, _, _ in group])
+        filled[window][in_group] = values[in_group]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for _ in executor.map(fill_group, groups.values()):
+            pass
+
+    return filled
+
 
 class CalculationMixin(object):
-    """Mix-in class for grid calculations"""
+    """Mix-in class for grid calculations
+
+    Derivative grids are cached and keyed to a version counter of the grid
+    data. Assigning to _griddata increments the version and clears the cache.
+    Code that modifies _griddata in place must call _invalidate_derivatives().
+    Cached grids are read-only and are pickled with the grid, so they can be
+    shared with worker processes.
+    """
 
     def __init__(self):
 
         pass
 
+    @property
+    def _griddata(self):
+        return self._grid
+
+    @_griddata.setter
+    def _griddata(self, value):
+        self._grid = value
+        self._invalidate_derivatives()
+
+    @property
+    def _grid_version(self):
+        """Version counter of grid data"""
+
+        return self.__dict__.get('_version', 0)
+
+    def _invalidate_derivatives(self):
+        """Increment grid version and clear cached derivative grids.
+        """
+
+        self._version = self._grid_version + 1
+        self._derivatives = {}
+
+    def _get_derivative(self, name):
+        """Get cached derivative grid, calculating it if needed.
+
+        Parameters
+        ----------
+            name : str
+                one of 'slope', 'd2z_dx2', 'd2z_dxdy' or 'd2z_dy2'
+
+        Returns
+        -------
+            derivative : numpy array or tuple
+                read-only derivative grid, or tuple of grids in x and y
+                directions for 'slope'
+        """
+
+        dx = self._georef_info.dx
+        dy = self._georef_info.dy
+        key = (name, dx, dy)
+
+        cache = self.__dict__.setdefault('_derivatives', {})
+        if key in cache:
+            return cache[key]
+
+        z = self._griddata
+        if name == 'slope':
+            derivative = self._calculate_slope_uncached()
+        elif name == 'd2z_dx2':
+            derivative = _second_derivative_stencil(z, 1 / dx ** 2, 0, 0)
+        elif name == 'd2z_dxdy':
+            derivative = _second_derivative_stencil(z, 0, 1 / dx ** 2, 0)
+        elif name == 'd2z_dy2':
+            derivative = _second_derivative_stencil(z, 0, 0, 1 / dy ** 2)
+        else:
+            raise ValueError("Unknown derivative: {}".format(name))
+
+        grids = derivative if name == 'slope' else (derivative,)
+        for grid in grids:
+            grid.flags.writeable = False
+
+        cache[key] = derivative
+        return derivative
+
     def _calculate_slope(self):
         """Calculate gradient of grid in x and y directions.
 
         Pads boundary so as to return slope grids of same size as object's
-        grid data
+        grid data. Slope grids are cached and read-only.
 
         Returns
         -------
@@ -45,14 +344,22 @@ class CalculationMixin(object):
                 slope in y direction
         """
 
+        return self._get_derivative('slope')
+
+    def _calculate_slope_uncached(self):
+        """Calculate gradient of grid in x and y directions.
+
+        Pads a copy of the grid data, leaving the grid unchanged.
+        """
+
         dx = self._georef_info.dx
         dy = self._georef_info.dy
 
         PAD_DX = 2
         PAD_DY = 2
 
-        self._pad_boundary(PAD_DX, PAD_DY)
-        z_pad = self._griddata
+        z_pad = np.pad(self._griddata, pad_width=(PAD_DY, PAD_DX),
+                       mode='reflect')
 
         slope_x = (z_pad[1:-1, 2:] - z_pad[1:-1, :-2]) / (2 * dx)
         slope_y = (z_pad[2:, 1:-1] - z_pad[:-2, 1:-1]) / (2 * dy)
@@ -65,13 +372,37 @@ class CalculationMixin(object):
 
         return self._calculate_directional_laplacian(0)
 
-    def _calculate_directional_laplacian(self, alpha):
+    def _calculate_isotropic_laplacian(self):
+        """Calculate curvature of grid independent of direction.
+
+        Returns
+        -------
+            del2z : numpy array
+                grid of curvature values (sum of x and y curvature)
+        """
+
+        d2z_dx2 = self._get_derivative('d2z_dx2')
+        d2z_dy2 = self._get_derivative('d2z_dy2')
+
+        return numexpr.evaluate("d2z_dx2 + d2z_dy2")
+
+    def _calculate_directional_laplacian(self, alpha, out=None,
+                                         dtype=np.float64):
         """Calculate curvature of grid in arbitrary direction.
 
+        Combines cached second derivative grids, so that curvature in many
+        directions is calculated with one pass over the grid data. Does not
+        modify grid data. NaN values in the grid are treated as zero by
+        neighbouring cells and are NaN in the curvature grid.
+
         Parameters
         ----------
             alpha : float
                 direction angle (azimuth) in radians. 0 is north or y-axis.
+            out : numpy array, optional
+                array to write curvature values to
+            dtype : numpy dtype, optional
+                data type of output if out is not given, default float64
 
         Returns
         -------
@@ -79,37 +410,58 @@ class CalculationMixin(object):
                 grid of curvature values
         """
 
-        dx = self._georef_info.dx
-        dy = self._georef_info.dy
-        z = self._griddata
-        nan_idx = np.isnan(z)
-        z[nan_idx] = 0
+        d2z_dx2 = self._get_derivative('d2z_dx2')
+        d2z_dxdy = self._get_derivative('d2z_dxdy')
+        d2z_dy2 = self._get_derivative('d2z_dy2')
+
+        a = np.cos(alpha) ** 2
+        b = -2 * np.sin(alpha) * np.cos(alpha)
+        c = np.sin(alpha) ** 2
+
+        if out is None:
+            out = np.empty(d2z_dx2.shape, dtype=dtype)
+
+        return numexpr.evaluate("a*d2z_dx2 + b*d2z_dxdy + c*d2z_dy2",
+                                out=out, casting='same_kind')
 
-        dz_dx = np.diff(z, 1, 1)/dx
-        d2z_dxdy = np.diff(dz_dx, 1, 0)/dx
-        pad_x = np.zeros((d2z_dxdy.shape[0], 1))
-        d2z_dxdy = np.hstack([pad_x, d2z_dxdy])
-        pad_y = np.zeros((1, d2z_dxdy.shape[1]))
-        d2z_dxdy = np.vstack([pad_y, d2z_dxdy])
+    def _calculate_laplacian_at(self, alpha, rows, cols):
+        """Calculate curvature at selected cells from cached derivatives.
 
-        d2z_dx2 = np.diff(z, 2, 1)/dx**2
-        pad_x = np.zeros((d2z_dx2.shape[0], 1))
-        d2z_dx2 = np.hstack([pad_x, d2z_dx2, pad_x])
+        Parameters
+        ----------
+            alpha : float or None
+                direction angle (azimuth) in radians, or None for isotropic
+                curvature
+            rows : numpy array
+                row indices of cells
+            cols : numpy array
+                column indices of cells, with the same shape as rows
 
-        d2z_dy2 = np.diff(z, 2, 0)/dy**2
-        pad_y = np.zeros((1, d2z_dy2.shape[1]))
-        d2z_dy2 = np.vstack([pad_y, d2z_dy2, pad_y])
+        Returns
+        -------
+            del2s : numpy array
+                curvature values, with the same shape as rows
+        """
 
-        del2z = d2z_dx2 * np.cos(alpha) ** 2 - 2 * d2z_dxdy * np.sin(alpha) \
-            * np.cos(alpha) + d2z_dy2 * np.sin(alpha) ** 2
-        del2z[nan_idx] = np.nan
+        d2z_dx2 = self._get_derivative('d2z_dx2')[rows, cols]
+        d2z_dy2 = self._get_derivative('d2z_dy2')[rows, cols]
 
-        return del2z
+        if alpha is None:
+            return numexpr.evaluate("d2z_dx2 + d2z_dy2")
+
+        d2z_dxdy = self._get_derivative('d2z_dxdy')[rows, cols]
+
+        a = np.cos(alpha) ** 2
+        b = -2 * np.sin(alpha) * np.cos(alpha)
+        c = np.sin(alpha) ** 2
+
+        return numexpr.evaluate("a*d2z_dx2 + b*d2z_dxdy + c*d2z_dy2")
 
     def _calculate_directional_laplacian_numexpr(self, alpha):
         """Calculate curvature of grid in arbitrary direction.
 
-        Optimized with numexpr expressions.
+        Equivalent to _calculate_directional_laplacian(), which is evaluated
+        with numexpr.
 
         Parameters
         ----------
@@ -122,35 +474,27 @@ class CalculationMixin(object):
                 grid of curvature values
         """
 
-        dx = self._georef_info.dx
-        dy = self._georef_info.dy
-        z = self._griddata
-        nan_idx = np.isnan(z)
-        z[nan_idx] = 0
+        return self._calculate_directional_laplacian(alpha)
 
-        dz_dx = np.diff(z, 1, 1)/dx
-        d2z_dxdy = np.diff(dz_dx, 1, 0)/dx
-        pad_x = np.zeros((d2z_dxdy.shape[0], 1))
-        d2z_dxdy = np.hstack([pad_x, d2z_dxdy])
-        pad_y = np.zeros((1, d2z_dxdy.shape[1]))
-        d2z_dxdy = np.vstack([pad_y, d2z_dxdy])
-
-        d2z_dx2 = np.diff(z, 2, 1)/dx**2
-        pad_x = np.zeros((d2z_dx2.shape[0], 1))
-        d2z_dx2 = np.hstack([pad_x, d2z_dx2, pad_x])
-
-        d2z_dy2 = np.diff(z, 2, 0)/dy**2
-        pad_y = np.zeros((1, d2z_dy2.shape[1]))
-        d2z_dy2 = np.vstack([pad_y, d2z_dy2, pad_y])
+    def _estimate_curvature_noiselevel(self, num_angles=180, sigma=100):
+        """Estimate noise level in curvature of grid as a function of direction.
 
-        del2z = numexpr.evaluate("d2z_dx2*cos(alpha)**2 - \
-                2*d2z_dxdy*sin(alpha)*cos(alpha) + d2z_dy2*sin(alpha)**2")
-        del2z[nan_idx] = np.nan
+        Noise is the high-pass filtered curvature, i.e. curvature minus its
+        Gaussian-smoothed version. Both steps are linear, so the high-pass
+        curvature in any direction is a combination of the high-pass second
+        derivative grids. Only those three grids are filtered, and the mean
+        and standard deviation in each direction are calculated from their
+        means and covariances.
 
-        return del2z
+        Cells within the filter's reach of missing data are excluded.
 
-    def _estimate_curvature_noiselevel(self):
-        """Estimate noise level in curvature of grid as a function of direction.
+        Parameters
+        ----------
+            num_angles : int, optional
+                number of orientations between 0 and pi, default 180
+            sigma : float, optional
+                standard deviation of Gaussian low-pass filter in grid cells,
+                default 100
 
         Returns
         -------
@@ -164,17 +508,33 @@ class CalculationMixin(object):
 
         from scipy import ndimage
 
-        angles = np.linspace(0, np.pi, num=180)
-
-        mean = []
-        sd = []
-
-        for alpha in angles:
-            del2z = self._calculate_directional_laplacian(alpha)
-            lowpass = ndimage.gaussian_filter(del2z, 100)
-            highpass = del2z - lowpass
-            mean.append(np.nanmean(highpass))
-            sd.append(np.nanstd(highpass))
+        angles = np.linspace(0, np.pi, num=num_angles)
+
+        names = ('d2z_dx2', 'd2z_dxdy', 'd2z_dy2')
+        grids = [self._get_derivative(name) for name in names]
+        nodata = np.isnan(grids[0])
+        highpass = np.stack([np.where(nodata, 0, grid) for grid in grids])
+        highpass -= _gaussian_filter_stack(highpass, sigma)
+
+        # Low-pass values are missing wherever the (separable) filter window
+        # reaches a missing cell
+        size = 2 * int(4 * sigma + 0.5) + 1
+        for axis in (0, 1):
+            nodata = ndimage.maximum_filter1d(nodata, size, axis=axis,
+                                              mode='reflect')
+        highpass = highpass[:, ~nodata]
+        del nodata
+
+        grid_mean = highpass.mean(axis=1)
+        highpass -= grid_mean[:, np.newaxis]
+        grid_cov = highpass @ highpass.T / highpass.shape[1]
+
+        weights = np.stack([np.cos(angles) ** 2,
+                            -2 * np.sin(angles) * np.cos(angles),
+                            np.sin(angles) ** 2])
+        mean = weights.T @ grid_mean
+        var = np.einsum('ia,ij,ja->a', weights, grid_cov, weights)
+        sd = np.sqrt(np.maximum(var, 0))
 
         return angles, mean, sd
 
@@ -196,6 +556,63 @@ class CalculationMixin(object):
         self._georef_info.yllcenter -= dy
 
 
+def mosaic(grids, lazy=True):
+    """Create grid from a virtual mosaic of grid files.
+
+    Builds a GDAL VRT in memory (/vsimem/) over any number of files. Overlaps
+    are taken from the last file listed. The in-memory file is removed once
+    grid data are read, or for lazy grids once no grid reads from it.
+
+    Parameters
+    ----------
+        grids : list
+            list of filenames or grids loaded from files
+        lazy : bool, optional
+            if True (default), read grid data from the mosaic on demand
+
+    Returns
+    -------
+        grid : DEMGrid
+            grid of virtual mosaic
+    """
+
+    filenames = [grid if isinstance(grid, str) else grid.filename
+                 for grid in grids]
+    filenames = [os.path.abspath(filename) for filename in filenames]
+
+    vrt_filename = '/vsimem/scarplet_mosaic_{}.vrt'.format(uuid.uuid4().hex)
+    vrt = gdal.BuildVRT(vrt_filename, filenames)
+    if vrt is None:
+        raise IOError("Could not build mosaic of {}".format(filenames))
+    vrt.FlushCache()
+    vrt = None
+
+    if lazy:
+        _mosaic_files.add(vrt_filename)
+    grid = DEMGrid(vrt_filename, lazy=lazy)
+    if not lazy:
+        gdal.Unlink(vrt_filename)
+
+    return grid
+
+
+def _acquire_vsimem(grid, filename):
+    """Keep in-memory file until grid is garbage collected"""
+
+    _vsimem_refs[filename] = _vsimem_refs.get(filename, 0) + 1
+    weakref.finalize(grid, _release_vsimem, filename)
+
+
+def _release_vsimem(filename):
+    """Unlink in-memory file once no grid reads from it"""
+
+    _vsimem_refs[filename] -= 1
+    if _vsimem_refs[filename] == 0:
+        del _vsimem_refs[filename]
+        _mosaic_files.discard(filename)
+        gdal.Unlink(filename)
+
+
 class GDALMixin(object):
     pass
 
@@ -217,6 +634,61 @@ class GeorefInfo(object):
         self.lrx = None
         self.lry = None
 
+    def pixel_to_xy(self, row, col):
+        """Convert pixel indices to map coordinates of pixel centers
+
+        Parameters
+        ----------
+            row : int or numpy array
+                row index
+            col : int or numpy array
+                column index
+
+        Returns
+        -------
+            x : float or numpy array
+                x coordinate in data projection units
+            y : float or numpy array
+                y coordinate in data projection units
+        """
+
+        gt = self.geo_transform
+        row = np.asarray(row) + 0.5
+        col = np.asarray(col) + 0.5
+
+        x = gt[0] + col * gt[1] + row * gt[2]
+        y = gt[3] + col * gt[4] + row * gt[5]
+
+        return x, y
+
+    def xy_to_pixel(self, x, y):
+        """Convert map coordinates to indices of pixels containing them
+
+        Parameters
+        ----------
+            x : float or numpy array
+                x coordinate in data projection units
+            y : float or numpy array
+                y coordinate in data projection units
+
+        Returns
+        -------
+            row : int or numpy array
+                row index
+            col : int or numpy array
+                column index
+        """
+
+        gt = self.geo_transform
+        x = np.asarray(x, dtype=float) - gt[0]
+        y = np.asarray(y, dtype=float) - gt[3]
+
+        det = gt[1] * gt[5] - gt[2] * gt[4]
+        col = (x * gt[5] - y * gt[2]) / det
+        row = (y * gt[1] - x * gt[4]) / det
+
+        return np.floor(row).astype(int), np.floor(col).astype(int)
+
 
 class BaseSpatialGrid(GDALMixin):
     """Base class for spatial grid"""
@@ -244,38 +716,33 @@ class BaseSpatialGrid(GDALMixin):
             grid : BaseSpatialGrid
         """
 
-        return self.bbox.intersects(grid.bbox)
+        bbox = BoundingBoxArray.from_bboxes(self.bbox)
+        return bool(bbox.intersects(grid.bbox)[0, 0])
 
-    def merge(self, grid):
-        """Merge this grid with another BaseSpatialGrid.
+    def merge(self, *grids):
+        """Merge this grid with other grids as a virtual mosaic.
 
-        Wrapper argound gdal_merge.py.
+        Builds an in-memory GDAL VRT over the grid files, so no merged raster
+        is written to disk. Grid data are read on demand from the mosaic,
+        including windows that cross tile seams.
 
         Parameters
         ----------
-            grid : BaseSpatialGrid
+            grids : BaseSpatialGrid
+                one or more grids loaded from files
 
         Returns
         -------
-            merged_grid : BaseSpatialGrid
+            merged_grid : DEMGrid
+                lazily loaded grid of virtual mosaic
         """
 
-        if not self.is_contiguous(grid):
+        grids = [self] + list(grids)
+        index = TileIndex([grid.bbox for grid in grids])
+        if index.connected_components().max() > 0:
             raise ValueError("ValueError: Grids are not contiguous")
 
-        # XXX: this is hacky, eventually implement as native GDAL
-        try:
-            command = ['gdal_merge.py', self.filename, grid.filename]
-            subprocess.check_output(command, stderr=subprocess.STDOUT)
-        except subprocess.CalledProcessError as e:
-            print("Failed to merge grids. gdal_merge may not be installed.")
-            raise e
-
-        merged_grid = BaseSpatialGrid('out.tif')
-        merged_grid._griddata[merged_grid._griddata == FLOAT32_MIN] = np.nan
-        os.remove('out.tif')
-
-        return merged_grid
+        return mosaic(grids)
 
     def plot(self, **kwargs):
         """Plot grid data
@@ -321,11 +788,23 @@ class BaseSpatialGrid(GDALMixin):
             if self.dtype is not np.uint8:
                 self._griddata[nodata_index] = np.nan
 
+        self._load_georef_info(gdal_dataset)
+
+    def _load_georef_info(self, gdal_dataset):
+        """Set georeferencing information from GDAL dataset
+        """
+
         geo_transform = gdal_dataset.GetGeoTransform()
         projection = gdal_dataset.GetProjection()
         nx = gdal_dataset.RasterXSize
         ny = gdal_dataset.RasterYSize
 
+        self._set_georef_info(geo_transform, projection, nx, ny)
+
+    def _set_georef_info(self, geo_transform, projection, nx, ny):
+        """Set georeferencing information from geotransform and grid size
+        """
+
         self._georef_info.geo_transform = geo_transform
         self._georef_info.projection = projection
         self._georef_info.dx = self._georef_info.geo_transform[1]
@@ -349,13 +828,25 @@ class BaseSpatialGrid(GDALMixin):
 
 
 class DEMGrid(CalculationMixin, BaseSpatialGrid):
-    """Class representing grid of elevation values"""
+    """Class representing grid of elevation values
 
-    def __init__(self, filename=None):
+    If opened with lazy=True, only metadata is read from the file. Windows
+    of grid data are read on demand with read_window() or get_window(), and
+    the full grid is read on first access to _griddata. Lazy grids keep the
+    native data type of floating point rasters.
+    """
+
+    def __init__(self, filename=None, lazy=False):
 
         _georef_info = GeorefInfo()
 
-        if filename is not None:
+        if filename is not None and lazy:
+            self._georef_info = _georef_info
+            self._open(filename)
+            self.nodata_value = np.nan
+            self.filename = filename
+            self.is_interpolated = False
+        elif filename is not None:
             self._georef_info = _georef_info
             self.load(filename)
             self._griddata[self._griddata == FLOAT32_MIN] = np.nan
@@ -371,6 +862,204 @@ class DEMGrid(CalculationMixin, BaseSpatialGrid):
             self._griddata = np.empty((0, 0))
             self.is_interpolated = False
 
+    @CalculationMixin._griddata.getter
+    def _griddata(self):
+        if self._grid is None:
+            ny, nx = self.shape
+            self._griddata = self.read_window(0, 0, ny, nx)
+
+        return self._grid
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_dataset', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.__dict__.get('lazy', False):
+            # In-memory mosaics do not exist in a new process, so they are
+            # recreated from their VRT definition
+            vrt_xml = self.__dict__.get('_vrt_xml')
+            if vrt_xml is not None:
+                if gdal.VSIStatL(self.filename) is None:
+                    gdal.FileFromMemBuffer(self.filename, vrt_xml)
+                _mosaic_files.add(self.filename)
+                _acquire_vsimem(self, self.filename)
+            self._dataset = gdal.Open(self.filename)
+
+    def _open(self, filename):
+        """Open grid file, reading only metadata
+        """
+
+        self.label = filename.split('/')[-1].split('.')[0]
+        self.lazy = True
+
+        self._dataset = gdal.Open(filename)
+        if self._dataset is None:
+            raise IOError("Could not open {}".format(filename))
+
+        # Only in-memory files made by mosaic() are owned by their grids
+        if filename in _mosaic_files:
+            self._vrt_xml = self._dataset.GetMetadata('xml:VRT')[0]
+            _acquire_vsimem(self, filename)
+
+        self._load_georef_info(self._dataset)
+        self.shape = (self._georef_info.ny, self._georef_info.nx)
+        self._grid = None
+
+    def read_window(self, row, col, nrows, ncols):
+        """Read window of grid data
+
+        Windows are clipped to the grid extent. For lazy grids, only the
+        window is read from file and nodata values in it are set to NaN.
+
+        Parameters
+        ----------
+            row : int
+                index of first row of window
+            col : int
+                index of first column of window
+            nrows : int
+                number of rows in window
+            ncols : int
+                number of columns in window
+
+        Returns
+        -------
+            data : numpy array
+                grid data in window
+        """
+
+        in_memory = self.__dict__.get('_dataset') is None \
+            or self.__dict__.get('_grid') is not None
+
+        ny, nx = self._griddata.shape if in_memory else self.shape
+        row0, col0 = max(row, 0), max(col, 0)
+        row1, col1 = min(row + nrows, ny), min(col + ncols, nx)
+
+        if in_memory:
+            return self._griddata[row0:row1, col0:col1].copy()
+
+        band = self._dataset.GetRasterBand(1)
+        data = band.ReadAsArray(col0, row0, col1 - col0, row1 - row0)
+        if not np.issubdtype(data.dtype, np.floating):
+            data = data.astype(np.float32)
+
+        nodata = band.GetNoDataValue()
+        if nodata is not None:
+            data[data == nodata] = np.nan
+        data[data == FLOAT32_MIN] = np.nan
+
+        return data
+
+    def get_window(self, row, col, nrows, ncols):
+        """Get window of grid as a new grid
+
+        Parameters
+        ----------
+            row : int
+                index of first row of window
+            col : int
+                index of first column of window
+            nrows : int
+                number of rows in window
+            ncols : int
+                number of columns in window
+
+        Returns
+        -------
+            window : DEMGrid
+                grid of data in window, with georeferencing of window
+        """
+
+        data = self.read_window(row, col, nrows, ncols)
+        row, col = max(row, 0), max(col, 0)
+        ny, nx = data.shape
+
+        gt = self._georef_info.geo_transform
+        geo_transform = (gt[0] + col * gt[1] + row * gt[2], gt[1], gt[2],
+                         gt[3] + col * gt[4] + row * gt[5], gt[4], gt[5])
+
+        window = DEMGrid()
+        window._set_georef_info(geo_transform, self._georef_info.projection,
+                                nx, ny)
+        window._griddata = data
+        window.label = self.label
+        window.filename = self.filename
+        window.nodata_value = self.__dict__.get('nodata_value', np.nan)
+        window.shape = data.shape
+        window.is_interpolated = self.is_interpolated
+
+        return window
+
+    def get_pyramid_level(self, factor):
+        """Get grid smoothed by a Gaussian filter and decimated by a factor
+
+        Levels are cached with the derivative grids and cleared when the grid
+        data change. Smoothing by a Gaussian filter of standard deviation
+        sigma is equivalent to linear diffusion of age sigma ** 2 / 2, which
+        is stored in the level's smoothing_age attribute.
+
+        Parameters
+        ----------
+            factor : int
+                decimation factor, e.g. 2 for a grid with half the number
+                of rows and columns
+
+        Returns
+        -------
+            level : DEMGrid
+                smoothed and decimated grid. Cell i of the level is sampled
+                from native cell i * factor + (factor - 1) // 2, the cell
+                nearest the centre of native cells i * factor to
+                (i + 1) * factor - 1, and is georeferenced to be centred on
+                that sample.
+        """
+
+        factor = int(factor)
+        if factor < 1:
+            raise ValueError("Decimation factor must be a positive integer")
+        if factor == 1:
+            return self
+
+        dx = self._georef_info.dx
+        dy = self._georef_info.dy
+        key = ('pyramid', factor, dx, dy)
+
+        cache = self.__dict__.setdefault('_derivatives', {})
+        if key in cache:
+            return cache[key]
+
+        sigma = factor / 2
+        offset = (factor - 1) // 2
+        smoothed = _gaussian_filter_stack(self._griddata[np.newaxis], sigma)[0]
+        data = np.ascontiguousarray(smoothed[offset::factor, offset::factor])
+        ny, nx = data.shape
+
+        # Origin is shifted so that level cell centres fall on the sampled
+        # native cell centres
+        gt = self._georef_info.geo_transform
+        shift = offset + 0.5 - factor / 2
+        geo_transform = (gt[0] + shift * (gt[1] + gt[2]),
+                         gt[1] * factor, gt[2] * factor,
+                         gt[3] + shift * (gt[4] + gt[5]),
+                         gt[4] * factor, gt[5] * factor)
+
+        level = DEMGrid()
+        level._set_georef_info(geo_transform, self._georef_info.projection,
+                               nx, ny)
+        level._griddata = data
+        level.label = self.__dict__.get('label', '')
+        level.filename = self.filename
+        level.nodata_value = self.__dict__.get('nodata_value', np.nan)
+        level.shape = data.shape
+        level.is_interpolated = self.is_interpolated
+        level.smoothing_age = (sigma * abs(dx)) ** 2 / 2
+
+        cache[key] = level
+        return level
+
     def plot(self, color=True, **kwargs):
         fig, ax = plt.subplots(1, 1, **kwargs)
 
@@ -385,10 +1074,17 @@ class DEMGrid(CalculationMixin, BaseSpatialGrid):
         ax.set_xlabel('x')
         ax.set_ylabel('y')
 
-    def _fill_nodata(self):
+    def _fill_nodata(self, max_workers=None):
         """Fill nodata values in elevation grid by interpolation.
 
-        Wrapper around GDAL/rasterio's FillNoData, fillnodata methods
+        Wrapper around GDAL/rasterio's FillNoData, fillnodata methods. Each
+        connected nodata region is filled within its own bounding window, in
+        parallel across regions.
+
+        Parameters
+        ----------
+            max_workers : int, optional
+                maximum number of threads used to fill regions
         """
 
         if ~np.isnan(self.nodata_value):
@@ -397,10 +1093,14 @@ class DEMGrid(CalculationMixin, BaseSpatialGrid):
             nodata_mask = np.isnan(self._griddata)
         self.nodata_mask = nodata_mask
 
+        self._griddata = _fill_nodata_regions(self._griddata,
+                                              max_workers=max_workers)
+
         # XXX: GDAL (or rasterio) FillNoData takes mask with 0s at nodata
-        num_nodata = np.sum(nodata_mask)
+        # Fall back to filling the whole grid if any cells were out of reach
+        num_nodata = np.sum(np.isnan(self._griddata))
         prev_nodata = np.nan
-        while num_nodata > 0 or num_nodata == prev_nodata:
+        while num_nodata > 0 and num_nodata != prev_nodata:
             mask = np.isnan(self._griddata)
             col_nodata = np.sum(mask, axis=0).max()
             row_nodata = np.sum(mask, axis=1).max()
@@ -413,8 +1113,21 @@ class DEMGrid(CalculationMixin, BaseSpatialGrid):
 
         self.is_interpolated = True
 
-    def _fill_nodata_with_edge_values(self):
-        """Fill nodata values using swath edge values by row,"""
+    def _fill_nodata_with_edge_values(self, axis=1, mode='first'):
+        """Fill nodata values using swath edge values by row.
+
+        Parameters
+        ----------
+            axis : int, optional
+                axis along which to find edge values, 1 (default) to fill
+                by row or 0 to fill by column
+            mode : str, optional
+                'first' (default) to fill all nodata values in a row with the
+                row's first valid value, or 'nearest' to fill each nodata
+                value with the nearest valid value in its row
+
+        Rows with no valid values are left unfilled.
+        """
 
         if ~np.isnan(self.nodata_value):
             nodata_mask = self._griddata == self.nodata_value
@@ -422,11 +1135,29 @@ class DEMGrid(CalculationMixin, BaseSpatialGrid):
             nodata_mask = np.isnan(self._griddata)
         self.nodata_mask = nodata_mask
 
-        for row in self._griddata:
-            idx = np.where(np.isnan(row)).min()
-            fill_value = row[idx]
-            row[np.isnan(row)] = fill_value
+        z = self._griddata if axis == 1 else self._griddata.T
+        nodata = nodata_mask if axis == 1 else nodata_mask.T
+        ny, nx = z.shape
+        rows = np.arange(ny)[:, np.newaxis]
+
+        if mode == 'first':
+            idx = np.argmin(nodata, axis=1)[:, np.newaxis]
+        elif mode == 'nearest':
+            cols = np.arange(nx, dtype=np.int32)
+            before = np.where(nodata, -1, cols)
+            np.maximum.accumulate(before, axis=1, out=before)
+            after = np.where(nodata, 2 * nx, cols)
+            after = np.minimum.accumulate(after[:, ::-1], axis=1)[:, ::-1]
+            idx = np.where((before >= 0) & (cols - before <= after - cols),
+                           before, np.minimum(after, nx - 1))
+            del before, after
+        else:
+            raise ValueError("Unknown fill mode: {}".format(mode))
+
+        # Rows with no valid values index a nodata value and stay unfilled
+        np.copyto(z, z[rows, idx], where=nodata)
 
+        self._invalidate_derivatives()
         self.is_interpolated = True
 
 
@@ -0,0 +1,390 @@
+# -*- coding: utf-8
+""" Classes for storing and writing template matching results """
+
+import numpy as np
+
+from scarplet.dem import GeorefInfo
+
+try:
+    import zarr
+except ImportError:
+    zarr = None
+
+
+BAND_NAMES = ('amp', 'age', 'angle', 'snr')
+COG_DRIVER_NAME = 'COG'
+
+
+class PointTable(object):
+    """Sparse table of template matching results above an SNR threshold
+
+    Results are stored column-wise, with one row for each pixel whose
+    signal-to-noise ratio exceeds the threshold. Tables can be built
+    incrementally from the results for separate tiles of a DEM.
+
+    Attributes
+    ----------
+    snr_threshold : float
+        Minimum signal-to-noise ratio of pixels included in table
+    columns : tuple
+        Names of table columns
+
+    Methods
+    -------
+    append(results, georef_info, row_offset, col_offset):
+        Append pixels above threshold from array of results
+    save(filename):
+        Save table as compressed .npz file
+    load(filename):
+        Load table from .npz file
+    """
+
+    columns = ('row', 'col', 'x', 'y', 'amp', 'age', 'angle', 'snr')
+
+    def __init__(self, snr_threshold=0):
+        """Constructor method for point table
+
+        Parameters
+        ----------
+        snr_threshold : float
+            Minimum signal-to-noise ratio of pixels included in table
+        """
+
+        self.snr_threshold = snr_threshold
+        self._chunks = dict((name, []) for name in self.columns)
+
+    def __len__(self):
+
+        return sum(len(chunk) for chunk in self._chunks['snr'])
+
+    def __getitem__(self, name):
+
+        if name not in self._chunks:
+            raise KeyError(name)
+
+        chunks = self._chunks[name]
+        if len(chunks) == 0:
+            dtype = int if name in ('row', 'col') else float
+            return np.empty(0, dtype=dtype)
+        if len(chunks) > 1:
+            self._chunks[name] = [np.concatenate(chunks)]
+
+        return self._chunks[name][0]
+
+    def append(self, results, georef_info, row_offset=0, col_offset=0):
+        """Append pixels above threshold from array of results
+
+        Parameters
+        ----------
+        results : np.array
+            Array of best amplitudes, ages, orientations, and signal-to-noise
+            ratios for each pixel of a tile. Dimensions of (4, height, width).
+        georef_info : GeorefInfo
+            Georeferencing information used to compute map coordinates
+        row_offset : int, optional
+            Row index of tile origin in grid described by georef_info
+        col_offset : int, optional
+            Column index of tile origin in grid described by georef_info
+        """
+
+        amp, age, angle, snr = results
+
+        snr_threshold = self.snr_threshold
+        rows, cols = np.nonzero(snr > snr_threshold)
+        values = [np.broadcast_to(val, snr.shape)[rows, cols]
+                  for val in (amp, age, angle, snr)]
+
+        rows = rows + row_offset
+        cols = cols + col_offset
+        x, y = georef_info.pixel_to_xy(rows, cols)
+
+        for name, val in zip(self.columns, [rows, cols, x, y] + values):
+            self._chunks[name].append(val)
+
+    def to_dict(self):
+        """Return table as dictionary of column arrays
+
+        Returns
+        -------
+        table : dict
+            Dictionary of 1-D arrays, keyed by column name
+        """
+
+        return dict((name, self[name]) for name in self.columns)
+
+    def save(self, filename):
+        """Save table as compressed .npz file
+
+        Parameters
+        ----------
+        filename : string
+            Output filename
+        """
+
+        np.savez_compressed(filename,
+                            snr_threshold=self.snr_threshold,
+                            **self.to_dict())
+
+    @classmethod
+    def load(cls, filename):
+        """Load table from .npz file
+
+        Parameters
+        ----------
+        filename : string
+            Filename of table saved with PointTable.save()
+
+        Returns
+        -------
+        table : PointTable
+            Table of results
+        """
+
+        with np.load(filename) as data:
+            table = cls(float(data['snr_threshold']))
+            for name in cls.columns:
+                table._chunks[name] = [data[name]]
+
+        return table
+
+
+class ResultStore(object):
+    """Chunked, compressed and georeferenced store of template matching results
+
+    Results are stored as a Zarr array of dimensions (4, height, width)
+    holding amplitude, age, orientation and signal-to-noise ratio bands.
+    The grid's geotransform and projection are kept as array attributes.
+
+    Each chunk holds all four bands of a block of pixels, so workers may
+    open the same store and write windows aligned to chunk boundaries in
+    parallel. Reading a window only decompresses the chunks it overlaps.
+
+    Attributes
+    ----------
+    path : string
+        Path of Zarr store
+    georef_info : GeorefInfo
+        Georeferencing information of result grid
+    shape : tuple
+        Dimensions of result grid (height, width)
+    chunks : tuple
+        Dimensions of chunks (height, width)
+
+    Methods
+    -------
+    create(path, georef_info, shape, chunks, dtype):
+        Create new result store
+    write_window(results, row, col):
+        Write block of results with upper left corner at (row, col)
+    read_window(row, col, nrows, ncols):
+        Read block of results with upper left corner at (row, col)
+    to_cog(filename):
+        Save results as cloud-optimized GeoTIFF
+    """
+
+    def __init__(self, path, mode='r'):
+        """Open existing result store
+
+        Parameters
+        ----------
+        path : string
+            Path of Zarr store
+        mode : string, optional
+            'r' for read-only access (default), 'r+' for reading and writing
+        """
+
+        if zarr is None:
+            raise ImportError("ResultStore requires the zarr package")
+
+        self.path = path
+        self._array = zarr.open_array(path, mode=mode)
+
+        georef_info = GeorefInfo()
+        georef_info.geo_transform = tuple(self._array.attrs['geo_transform'])
+        georef_info.projection = self._array.attrs['projection']
+        georef_info.dx = georef_info.geo_transform[1]
+        georef_info.dy = georef_info.geo_transform[5]
+        georef_info.ny, georef_info.nx = self._array.shape[1:]
+        self.georef_info = georef_info
+
+    @classmethod
+    def create(cls, path, georef_info, shape=None, chunks=(512, 512),
+               dtype=np.float32):
+        """Create new result store
+
+        Parameters
+        ----------
+        path : string
+            Path of Zarr store
+        georef_info : GeorefInfo
+            Georeferencing information of matched DEM
+        shape : tuple, optional
+            Dimensions of result grid (height, width). Defaults to the
+            dimensions in georef_info.
+        chunks : tuple, optional
+            Dimensions of chunks (height, width), default (512, 512)
+        dtype : numpy dtype, optional
+            Data type of stored results, default float32
+
+        Returns
+        -------
+        store : ResultStore
+            Writable result store
+        """
+
+        if zarr is None:
+            raise ImportError("ResultStore requires the zarr package")
+
+        if shape is None:
+            shape = (georef_info.ny, georef_info.nx)
+        ny, nx = shape
+
+        array = zarr.open_array(path,
+                                mode='w',
+                                shape=(len(BAND_NAMES), ny, nx),
+                                chunks=(len(BAND_NAMES),) + tuple(chunks),
+                                dtype=dtype,
+                                fill_value=0)
+        array.attrs['geo_transform'] = list(georef_info.geo_transform)
+        array.attrs['projection'] = _projection_to_wkt(
+            georef_info.projection)
+        array.attrs['bands'] = list(BAND_NAMES)
+
+        return cls(path, mode='r+')
+
+    @property
+    def shape(self):
+
+        return self._array.shape[1:]
+
+    @property
+    def chunks(self):
+
+        return self._array.chunks[1:]
+
+    def write_window(self, results, row=0, col=0):
+        """Write block of results
+
+        Windows written concurrently by different workers must not share
+        chunks, i.e. row and col should be multiples of the chunk size.
+
+        Parameters
+        ----------
+        results : np.array
+            Array of results of dimensions (4, nrows, ncols)
+        row : int, optional
+            Row index of upper left corner of block
+        col : int, optional
+            Column index of upper left corner of block
+        """
+
+        _, nrows, ncols = np.shape(results)
+        self._array[:, row:row + nrows, col:col + ncols] = results
+
+    def read_window(self, row=0, col=0, nrows=None, ncols=None):
+        """Read block of results
+
+        Parameters
+        ----------
+        row : int, optional
+            Row index of upper left corner of block
+        col : int, optional
+            Column index of upper left corner of block
+        nrows : int, optional
+            Number of rows in block. Defaults to all remaining rows.
+        ncols : int, optional
+            Number of columns in block. Defaults to all remaining columns.
+
+        Returns
+        -------
+        results : np.array
+            Array of results of dimensions (4, nrows, ncols)
+        """
+
+        ny, nx = self.shape
+        if nrows is None:
+            nrows = ny - row
+        if ncols is None:
+            ncols = nx - col
+
+        return self._array[:, row:row + nrows, col:col + ncols]
+
+    def to_cog(self, filename, **kwargs):
+        """Save results as cloud-optimized GeoTIFF
+
+        Parameters
+        ----------
+        filename : string
+            Output filename
+
+        Other Parameters
+        ----------------
+        kwargs : optional
+            Any additional keyword arguments that may be passed to save_cog()
+        """
+
+        save_cog(self.read_window(), self.georef_info, filename, **kwargs)
+
+
+def save_cog(results, georef_info, filename, blocksize=512, overviews=True,
+             compress='DEFLATE'):
+    """Save results as cloud-optimized GeoTIFF
+
+    Bands are written in the order amplitude, age, orientation and
+    signal-to-noise ratio. Overviews are resampled by nearest neighbour so
+    that ages and orientations remain valid template parameters.
+
+    Parameters
+    ----------
+    results : np.array
+        Array of results of dimensions (4, height, width)
+    georef_info : GeorefInfo
+        Georeferencing information of matched DEM
+    filename : string
+        Output filename
+
+    Other Parameters
+    ----------------
+    blocksize : int, optional
+        Size of internal tiles, default 512
+    overviews : bool, optional
+        Whether to generate overviews, default True
+    compress : string, optional
+        GDAL compression method, default 'DEFLATE'
+    """
+
+    from osgeo import gdal
+
+    nbands, ny, nx = np.shape(results)
+
+    mem_driver = gdal.GetDriverByName('MEM')
+    dataset = mem_driver.Create('', nx, ny, nbands, gdal.GDT_Float32)
+    dataset.SetGeoTransform(georef_info.geo_transform)
+    dataset.SetProjection(_projection_to_wkt(georef_info.projection))
+    for i, band in enumerate(results):
+        dataset.GetRasterBand(i + 1).WriteArray(band)
+
+    options = ['BLOCKSIZE={:d}'.format(blocksize),
+               'COMPRESS={}'.format(compress),
+               'RESAMPLING=NEAREST',
+               'OVERVIEWS={}'.format('AUTO' if overviews else 'NONE')]
+
+    driver = gdal.GetDriverByName(COG_DRIVER_NAME)
+    if driver is None:
+        raise IOError("Writing cloud-optimized GeoTIFFs requires GDAL 3.1 "
+                      "or later")
+    out_raster = driver.CreateCopy(filename, dataset, options=options)
+    out_raster.FlushCache()
+    out_raster = None
+    dataset = None
+
+
+def _projection_to_wkt(projection):
+    """Return projection as WKT string"""
+
+    if projection is None:
+        return ''
+    if hasattr(projection, 'ExportToWkt'):
+        return projection.ExportToWkt()
+
+    return projection
@@ -9,7 +9,7 @@ from scipy.special import erf
 
 from context import scarplet
 import scarplet as sl
-from scarplet.WindowedTemplate import Scarp, Channel
+from scarplet.WindowedTemplate import Scarp, Channel, Crater, RightFacingUpperBreakScarp, LeftFacingUpperBreakScarp, ShiftedRightFacingUpperBreakScarp, get_grid
 
 
 DEFAULT_EPSG = 32610 # UTM 10N
@@ -40,6 +40,63 @@ class ScarpTestCase(unittest.TestCase):
         self.assertTrue(np.allclose(test, true), "Scarp template function is \
                         incorrect")
 
+    def test_template_stack(self):
+
+        ages = [1, 10, 100]
+        angles = [0, np.pi / 4, -np.pi / 3]
+        for Template in [Scarp, RightFacingUpperBreakScarp]:
+            test = Template.template_stack(100, ages, angles, 100, 80, 1)
+            true = np.stack([Template(100, age, angle, 100, 80, 1).template() for age, angle in zip(ages, angles)])
+            self.assertTrue(np.allclose(test, true), "Template stack is incorrect")
+
+            test = Template.window_limits_stack(100, ages, angles, 100, 80, 1)
+            true = np.stack([Template(100, age, angle, 100, 80, 1).get_window_limits() for age, angle in zip(ages, angles)])
+            self.assertTrue(np.array_equal(test, true), "Window limits stack is incorrect")
+
+    def test_window_bounds(self):
+
+        for angle in [0, np.pi / 2, np.pi / 6, -2 * np.pi / 3]:
+            obj = Scarp(30, 10, angle, 101, 80, 1)
+            X, Y = get_grid(101, 80, 1)
+            x = X[0]
+            y = Y[:, 0]
+            xr, _ = obj.get_coordinates()
+            c, d = obj.c, obj.d
+            an_y = abs(d * np.cos(obj.alpha - np.pi / 2) - d * np.cos(obj.alpha) + 2 * c * np.cos(obj.alpha - np.pi / 2))
+            an_x = abs(d * np.sin(obj.alpha) - d * np.sin(obj.alpha - np.pi / 2) + 2 * c * np.sin(obj.alpha - np.pi / 2))
+            true = ((X < (min(x) + an_x)) | (X > (max(x) - an_x))
+                    | (Y < (min(y) + an_y)) | (Y > (max(y) - an_y)))
+            self.assertTrue(np.array_equal(obj.get_window_limits(), true), "Window limits are incorrect")
+
+            obj = RightFacingUpperBreakScarp(30, 10, angle, 101, 80, 1)
+            self.assertTrue(np.array_equal(obj.get_err_mask(), xr <= 0), "Error mask is incorrect")
+
+            obj = LeftFacingUpperBreakScarp(30, 10, angle, 101, 80, 1)
+            self.assertTrue(np.array_equal(obj.get_err_mask(), xr >= 0), "Error mask is incorrect")
+
+    def test_mask_ranges(self):
+
+        array = np.ones((4, 6))
+        start = np.array([0, 2, 5, 4])
+        stop = np.array([3, 2, 6, 1])
+        sl.WindowedTemplate.mask_ranges(array, start, stop)
+        true = np.ones((4, 6))
+        true[0, :3] = 0
+        true[2, 5] = 0
+        self.assertTrue(np.array_equal(array, true), "Masked ranges are incorrect")
+
+
+class ShiftedScarpTestCase(unittest.TestCase):
+
+
+    def test_shift_template(self):
+
+        true = RightFacingUpperBreakScarp(30, 10, 0.3, 101, 80, 1).template()
+
+        for dx, dy in [(3, 0), (-4, 0), (0, 5), (0, -2), (2, -3)]:
+            test = ShiftedRightFacingUpperBreakScarp(30, 10, 0.3, 101, 80, 1, dx=dx, dy=dy).template()
+            self.assertTrue(np.array_equal(test, np.roll(true, (dy, dx), axis=(0, 1))), "Shifted template is incorrect")
+
 
 class ChannelTestCase(unittest.TestCase):
 
@@ -55,3 +112,17 @@ class ChannelTestCase(unittest.TestCase):
 
         self.assertTrue(np.allclose(test, true), "Channel template function is \
                         incorrect")
+
+
+class CraterTestCase(unittest.TestCase):
+
+
+    def test_template(self):
+
+        for r, kt, de in [(50, 10, 1), (20, 1, 2), (0.5, 5, 1), (3, 100, 0.5)]:
+            obj = Crater(r, kt, 120, 110, de)
+            test = obj.template()
+            true = obj.template_loop()
+
+            self.assertTrue(np.allclose(test, true), "Crater template function is \
+                            incorrect")
@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from context import scarplet
+from scarplet.datasets.catalog import TileCatalog
+
+
+TEST_DIR = os.path.dirname(__file__)
+
+
+class TileCatalogTestCase(unittest.TestCase):
+
+
+    def setUp(self):
+
+        self.tmp_dir = tempfile.mkdtemp()
+        self.paths = []
+        for name in ['synthetic.tif', 'faultzone.tif']:
+            path = os.path.join(self.tmp_dir, name)
+            shutil.copy(os.path.join(TEST_DIR, 'data', name), path)
+            self.paths.append(path)
+        self.catalog = TileCatalog(os.path.join(self.tmp_dir, 'catalog.sqlite'))
+
+    def tearDown(self):
+
+        self.catalog.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_update(self):
+
+        updated = self.catalog.update(self.paths)
+        self.assertEqual(len(updated), 2)
+        self.assertEqual(len(self.catalog), 2)
+
+        updated = self.catalog.update(self.paths)
+        self.assertEqual(updated, [], "Unchanged tiles were reread")
+
+        mtime = os.path.getmtime(self.paths[0]) + 10
+        os.utime(self.paths[0], (mtime, mtime))
+        updated = self.catalog.update(self.paths)
+        self.assertEqual(updated, [self.paths[0]], "Modified tile was not reread")
+
+        self.catalog.remove(self.paths[0])
+        self.assertEqual([t.path for t in self.catalog.tiles()], [self.paths[1]])
+
+    def test_prune(self):
+
+        other = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, other)
+        other_path = os.path.join(other, 'synthetic.tif')
+        shutil.copy(self.paths[0], other_path)
+
+        self.catalog.update(self.paths + [other_path])
+        os.remove(self.paths[0])
+        os.remove(other_path)
+
+        updated = self.catalog.update(self.paths[1:])
+        self.assertEqual(updated, [])
+        self.assertEqual(sorted(t.path for t in self.catalog.tiles()), sorted([self.paths[1], other_path]), "Tile outside scanned directories was removed")
+
+        self.assertEqual(self.catalog.prune(), [other_path])
+        self.assertEqual([t.path for t in self.catalog.tiles()], [self.paths[1]], "Deleted tile was not removed")
+
+    def test_persistence(self):
+
+        self.catalog.update(self.paths)
+        self.catalog.close()
+
+        self.catalog = TileCatalog(os.path.join(self.tmp_dir, 'catalog.sqlite'))
+        self.assertEqual(len(self.catalog), 2)
+        self.assertEqual(self.catalog.update(self.paths), [])
+
+    def test_query(self):
+
+        self.catalog.update(self.paths)
+        tiles, _ = self.catalog.tile_index()
+
+        for tile in tiles:
+            test = self.catalog.query(tile.xmin, tile.ymin, tile.xmax, tile.ymax)
+            self.assertIn(tile.path, [t.path for t in test])
+            self.assertEqual(tile.nx * tile.dx, tile.xmax - tile.xmin)
+
+        tile = tiles[0]
+        test = self.catalog.query(tile.xmax + 1, tile.ymax + 1, tile.xmax + 2, tile.ymax + 2)
+        self.assertNotIn(tile.path, [t.path for t in test])
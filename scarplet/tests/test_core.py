@@ -11,7 +11,7 @@ from scipy.special import erf
 from context import scarplet
 import scarplet as sl
 from scarplet import dem
-from scarplet.WindowedTemplate import Scarp
+from scarplet.WindowedTemplate import Scarp, Ricker, Crater, LeftFacingUpperBreakScarp, RightFacingUpperBreakScarp, ShiftedRightFacingUpperBreakScarp
 
 
 DEFAULT_EPSG = 32610
@@ -81,6 +81,374 @@ class TemplateMatchingTestCase(unittest.TestCase):
         self.assertTrue(np.allclose(alpha, true_alpha), "Orientations incorrect")
         self.assertTrue(np.allclose(snr, true_snr), "SNRs incorrect")
 
+    def test_match_template_antisymmetry(self):
+
+        amp, _, _, snr = sl.match_template(self.data, Scarp, 100, 10, 0.3)
+        amp_mirror, _, _, snr_mirror = sl.match_template(self.data, Scarp, 100, 10, 0.3 + np.pi)
+
+        self.assertTrue(np.allclose(amp, -amp_mirror), "Amplitudes not antisymmetric")
+        self.assertTrue(np.allclose(snr, snr_mirror), "SNRs not symmetric")
+
+    def test_match_template_stack(self):
+
+        ages = [10, 30, 100]
+        ny, nx = self.data._griddata.shape
+        test = sl.match_template_stack(self.data, Scarp, 100, ages, 0.1, chunk_size=2)
+        true = sl.compare([sl.match_template(self.data, Scarp, 100, age, 0.1) for age in ages], ny, nx)
+
+        for this_test, this_true in zip(test, true):
+            self.assertTrue(np.allclose(this_test, this_true), "Results incorrect")
+
+        test = sl.match_template_stack(self.data, Scarp, 100, ages, 0.1, k=2)
+        self.assertEqual(test[0].shape, (2, ny, nx))
+        self.assertTrue(np.allclose(test[3][0], true[3]), "SNRs incorrect")
+
+    def test_match_template_variants(self):
+
+        Templates = [LeftFacingUpperBreakScarp, RightFacingUpperBreakScarp]
+        res = sl.match_template_variants(self.data, Templates, 100, 10, 0.3)
+
+        for Template, test in zip(Templates, res):
+            true = sl.match_template(self.data, Template, 100, 10, 0.3)
+            self.assertTrue(np.allclose(test[0], true[0]), "Amplitudes incorrect")
+            self.assertTrue(np.allclose(test[3], true[3]), "SNRs incorrect")
+
+    def test_match_template_offsets(self):
+
+        dx = [-4, 0, 3, 0, 2]
+        dy = [0, 0, 0, -3, 5]
+        res = sl.match_template_offsets(self.data, ShiftedRightFacingUpperBreakScarp, 100, 10, 0, dx, dy)
+
+        for this_dx, this_dy, test in zip(dx, dy, res):
+            true = sl.match_template(self.data, ShiftedRightFacingUpperBreakScarp, 100, 10, 0, dx=this_dx, dy=this_dy)
+            self.assertTrue(np.allclose(test[0], true[0]), "Amplitudes incorrect")
+            self.assertTrue(np.allclose(test[3], true[3]), "SNRs incorrect")
+
+
+class PyramidTestCase(unittest.TestCase):
+
+
+    def setUp(self):
+
+        np.random.seed(0)
+        self.data = generate_synthetic_scarp(1, 0, 100, 100, 100, sig2=0.01)
+
+    def test_get_pyramid_factor(self):
+
+        self.assertEqual(sl.get_pyramid_factor(10, 1), 1)
+        self.assertEqual(sl.get_pyramid_factor(1000, 1), 4)
+        self.assertEqual(sl.get_pyramid_factor(1000, 2), 2)
+        self.assertEqual(sl.get_pyramid_factor(1000, 1, 8), 2)
+        self.assertEqual(sl.get_pyramid_factor(1000, 1, 4), 1)
+        self.assertEqual(sl.get_pyramid_factor(1000, 1, 100), 4)
+
+    def test_match_template_pyramid(self):
+
+        amp, age, angle, snr = sl.match_template_pyramid(self.data, Scarp, 50, 100, 0, factor=1)
+        true = sl.match_template(self.data, Scarp, 50, 100, 0)
+        self.assertTrue(np.allclose(amp, true[0]), "Amplitudes incorrect")
+
+        amp, age, angle, snr = sl.match_template_pyramid(self.data, Scarp, 50, 100, 0, factor=2)
+        self.assertEqual(amp.shape, self.data._griddata.shape)
+        self.assertEqual(age, 100)
+
+        valid = (snr > 0) & (true[3] > 0)
+        self.assertTrue(valid.any())
+        self.assertTrue(np.allclose(amp[95:105, 100], true[0][95:105, 100], atol=0.1), "Amplitudes incorrect")
+
+        amp_error, _ = sl.calculate_pyramid_error(self.data, Scarp, 50, 100, 0, factor=2)
+        self.assertTrue(amp_error < 0.3, "Amplitude error too large")
+
+
+class CascadeTestCase(unittest.TestCase):
+
+
+    def setUp(self):
+
+        np.random.seed(0)
+        self.data = generate_synthetic_scarp(1, 0, 10, 100, 100, sig2=0.01)
+
+    def test_get_candidate_windows(self):
+
+        candidates = np.zeros((200, 201), dtype=bool)
+        candidates[40, 50] = True
+        candidates[150:160, 170:180] = True
+
+        windows, mask = sl.get_candidate_windows(candidates, 10, block_size=32, window_size=64)
+        self.assertEqual(len(windows), 2)
+        self.assertTrue(np.all(mask[candidates]), "Candidates outside mask")
+
+        for (r0, r1, c0, c1), (i0, i1, j0, j1) in windows:
+            self.assertEqual((r1 - r0) % 2, 0, "Window row parity incorrect")
+            self.assertEqual((c1 - c0) % 2, 1, "Window column parity incorrect")
+            self.assertTrue(r0 <= i0 - 10 or r0 == 0)
+            self.assertTrue(c1 >= j1 + 10 or c1 == 201)
+
+    def test_match_cascade(self):
+
+        candidates = np.zeros((200, 200), dtype=bool)
+        candidates[90:110, 60:70] = True
+        template_args = {'scale': 20,
+                         'age': 10,
+                         'ang_max': 0.1,
+                         'ang_min': -0.1
+                         }
+
+        test = sl.match_cascade(self.data, Scarp, candidates=candidates, block_size=16, **template_args)
+        true = sl.match(self.data, Scarp, **template_args)
+        _, mask = sl.get_candidate_windows(candidates, 0, block_size=16)
+
+        self.assertTrue(np.allclose(test[:, mask], true[:, mask]), "Results in candidate blocks incorrect")
+        self.assertTrue(np.all(test[:, ~mask] == 0), "Results outside candidate blocks not zero")
+
+    def test_match_cascade_crater(self):
+
+        candidates = np.zeros((200, 200), dtype=bool)
+        candidates[90:110, 60:70] = True
+        template_args = {'scale': 10,
+                         'age': 10
+                         }
+
+        test = sl.match_cascade(self.data, Crater, candidates=candidates, block_size=16, **template_args)
+        true = sl.match(self.data, Crater, **template_args)
+        _, mask = sl.get_candidate_windows(candidates, 0, block_size=16)
+
+        self.assertTrue(np.allclose(test[:, mask], true[:, mask]), "Results in candidate blocks incorrect")
+
+        with self.assertRaises(ValueError):
+            sl.match_cascade(self.data, Ricker, candidates=candidates, **template_args)
+
+    def test_screen_curvature(self):
+
+        candidates = sl.screen_curvature(self.data, Scarp, 20, quantile=0.9)
+        self.assertEqual(candidates.shape, self.data._griddata.shape)
+        self.assertTrue(abs(candidates.mean() - 0.1) < 0.02)
+
+
+class PointQueryTestCase(unittest.TestCase):
+
+
+    def setUp(self):
+
+        np.random.seed(0)
+        self.data = generate_synthetic_scarp(1, 0, 10, 100.5, 100, sig2=0.01)
+
+    def test_match_template_points(self):
+
+        ny, nx = self.data._griddata.shape
+        rows = np.array([0, 5, 100, 101, 150, 199])
+        cols = np.array([0, 195, 100, 90, 20, 200])
+
+        for Template, scale in [(Scarp, 20), (RightFacingUpperBreakScarp, 20), (Crater, 10)]:
+            amp, snr = sl.match_template_points(self.data, Template, scale, [10, 100], 0.3, rows, cols)
+            self.assertEqual(amp.shape, (2, len(rows)))
+
+            for i, age in enumerate([10, 100]):
+                true = sl.match_template(self.data, Template, scale, age, 0.3)
+                self.assertTrue(np.allclose(amp[i], true[0][rows, cols]), "Amplitudes incorrect")
+                self.assertTrue(np.allclose(snr[i], true[3][rows, cols]), "SNRs incorrect")
+
+    def test_match_points(self):
+
+        rows = np.array([100, 102])
+        cols = np.array([100, 95])
+        x, y = self.data._georef_info.pixel_to_xy(rows, cols)
+        template_args = {'scale': 20,
+                         'age': 10,
+                         'ang_max': 0.1,
+                         'ang_min': -0.1
+                         }
+
+        test = sl.match_points(self.data, Scarp, x=x, y=y, **template_args)
+        true = sl.match(self.data, Scarp, **template_args)
+
+        self.assertTrue(np.allclose(test, true[:, rows, cols]), "Best-fit parameters incorrect")
+        test = sl.match_points(self.data, Crater, 10, x, y, age=10)
+        true = sl.match(self.data, Crater, scale=10, age=10)
+        self.assertTrue(np.allclose(test, true[:, rows, cols]), "Best-fit parameters incorrect")
+
+        with self.assertRaises(ValueError):
+            sl.match_points(self.data, Scarp, 20, [-1e6], [0])
+        with self.assertRaises(ValueError):
+            sl.match_points(self.data, Ricker, 20, x, y, age=10)
+
+
+class RegionOfInterestTestCase(unittest.TestCase):
+
+
+    def setUp(self):
+
+        np.random.seed(0)
+        self.data = generate_synthetic_scarp(1, 0, 10, 100.5, 100, sig2=0.01)
+        self.template_args = {'scale': 20,
+                              'age': 10,
+                              'ang_max': 0.1,
+                              'ang_min': -0.1
+                              }
+
+    def test_match_roi_bbox(self):
+
+        x, y = self.data._georef_info.pixel_to_xy(np.array([110, 80]), np.array([70, 130]))
+        bbox = (x.min(), y.min(), x.max(), y.max())
+
+        test, region = sl.match_roi(self.data, Scarp, bbox=bbox, **self.template_args)
+        true = sl.match(self.data, Scarp, **self.template_args)
+
+        self.assertEqual(test.shape, (4, 31, 61))
+        self.assertEqual(region._griddata.shape, (31, 61))
+        self.assertTrue(np.allclose(test, true[:, 80:111, 70:131]), "Results in region incorrect")
+
+        x0, y0 = region._georef_info.pixel_to_xy(0, 0)
+        self.assertTrue(np.allclose((x0, y0), self.data._georef_info.pixel_to_xy(80, 70)), "Region georeferencing incorrect")
+
+        self.assertTrue(np.array_equal(sl.match(self.data, Scarp, bbox=bbox, **self.template_args), test), "Results of match() incorrect")
+
+        table = sl.match(self.data, Scarp, bbox=bbox, snr_threshold=1, **self.template_args)
+        rows, cols = np.nonzero(test[3] > 1)
+        self.assertTrue(np.array_equal(table['row'], rows + 80), "Table rows incorrect")
+        self.assertTrue(np.array_equal(table['col'], cols + 70), "Table columns incorrect")
+
+    def test_match_tiles(self):
+
+        test = sl.match(self.data, Scarp, snr_threshold=1, tile_size=64, **self.template_args)
+        true = sl.match(self.data, Scarp, snr_threshold=1, **self.template_args)
+
+        def interior(table):
+            keep = (table['row'] >= 50) & (table['row'] < 150) & (table['col'] >= 50) & (table['col'] < 151)
+            order = np.lexsort((table['col'][keep], table['row'][keep]))
+            return [table[name][keep][order] for name in table.columns]
+
+        for this_test, this_true in zip(interior(test), interior(true)):
+            self.assertTrue(np.allclose(this_test, this_true), "Table incorrect")
+
+        with self.assertRaises(ValueError):
+            sl.match(self.data, Scarp, tile_size=64, **self.template_args)
+
+    def test_match_roi_mask(self):
+
+        roi = np.zeros((200, 201), dtype=bool)
+        roi[90:110, 60:70] = True
+        roi[95, 75] = True
+
+        test = sl.match(self.data, Scarp, roi=roi, **self.template_args)
+        true = sl.match(self.data, Scarp, **self.template_args)
+
+        self.assertEqual(test.shape, (4, 20, 16))
+        self.assertTrue(np.allclose(test[:, roi[90:110, 60:76]], true[:, roi]), "Results in region incorrect")
+        self.assertTrue(np.all(test[:, ~roi[90:110, 60:76]] == 0), "Results outside region not zero")
+
+        with self.assertRaises(ValueError):
+            sl.match(self.data, Scarp, roi=np.zeros((200, 201), dtype=bool), **self.template_args)
+
+    def test_match_roi_crater(self):
+
+        template_args = {'scale': 10,
+                         'age': 10
+                         }
+        true = sl.match(self.data, Crater, **template_args)
+
+        x, y = self.data._georef_info.pixel_to_xy(np.array([110, 80]), np.array([70, 130]))
+        test = sl.match(self.data, Crater, bbox=(x.min(), y.min(), x.max(), y.max()), **template_args)
+        self.assertTrue(np.allclose(test, true[:, 80:111, 70:131]), "Results in region incorrect")
+
+        roi = np.zeros((200, 201), dtype=bool)
+        roi[90:110, 60:70] = True
+        test = sl.match(self.data, Crater, roi=roi, **template_args)
+        self.assertTrue(np.allclose(test, true[:, 90:110, 60:70]), "Results in region incorrect")
+
+        with self.assertRaises(TypeError):
+            sl.match(self.data, Crater, roi=roi, age=10)
+        with self.assertRaises(ValueError):
+            sl.match(self.data, Ricker, roi=roi, **template_args)
+
+    def test_match_roi_lazy(self):
+
+        lazy = dem.DEMGrid(os.path.join(TEST_DIR, 'data/faultzone.tif'), lazy=True)
+        x, y = lazy._georef_info.pixel_to_xy(np.array([60, 40]), np.array([40, 80]))
+        bbox = (x.min(), y.min(), x.max(), y.max())
+
+        test = sl.match(lazy, Scarp, bbox=bbox, **self.template_args)
+
+        self.assertIsNone(lazy._grid, "Full grid read for region of interest")
+        self.assertEqual(test.shape, (4, 21, 41))
+
+
+class CompareTestCase(unittest.TestCase):
+
+
+    def setUp(self):
+
+        np.random.seed(0)
+        self.ny, self.nx = 20, 30
+        self.results = [(np.random.randn(self.ny, self.nx), age, angle,
+                         np.random.rand(self.ny, self.nx))
+                        for age, angle in zip([1, 10, 100, 1000], [0, 0.1, 0.2, 0.3])]
+
+    def test_compare_top_k(self):
+
+        amp, age, alpha, snr = sl.compare_top_k(self.results, self.ny, self.nx, k=3)
+
+        all_snr = np.stack([r[3] for r in self.results])
+        all_age = np.array([r[1] for r in self.results])
+        idx = np.argsort(-all_snr, axis=0)[:3]
+        
+        self.assertEqual(snr.shape, (3, self.ny, self.nx))
+        self.assertTrue(np.allclose(snr, np.take_along_axis(all_snr, idx, 0)), "SNRs incorrect")
+        self.assertTrue(np.allclose(age, all_age[idx]), "Ages incorrect")
+
+        best_amp, best_age, best_alpha, best_snr = sl.compare(self.results, self.ny, self.nx)
+        self.assertTrue(np.allclose(amp[0], best_amp), "Amplitudes incorrect")
+        self.assertTrue(np.allclose(alpha[0], best_alpha), "Orientations incorrect")
+
+    def test_compare_top_k_stacked(self):
+
+        first = sl.compare_top_k(self.results[:2], self.ny, self.nx, k=2)
+        second = sl.compare_top_k(self.results[2:], self.ny, self.nx, k=2)
+        merged = sl.compare_top_k([first, second], self.ny, self.nx, k=2)
+        full = sl.compare_top_k(self.results, self.ny, self.nx, k=2)
+
+        for test, true in zip(merged, full):
+            self.assertTrue(np.allclose(test, true), "Merged results incorrect")
+
+
+class OrientationTestCase(unittest.TestCase):
+
+
+    def test_get_orientations(self):
+
+        orientations = sl.get_orientations(Scarp, -np.pi / 2, np.pi / 2)
+        self.assertEqual(len(orientations), 181)
+
+        orientations = sl.get_orientations(Scarp, -np.pi, np.pi)
+        self.assertEqual(len(orientations), 180)
+        self.assertTrue(np.all(orientations < 0), "Orientations outside first half period")
+
+        orientations = sl.get_orientations(RightFacingUpperBreakScarp, -np.pi / 2, np.pi / 2)
+        self.assertEqual(len(orientations), 181)
+
+        orientations = sl.get_orientations(Ricker, -np.pi / 2, np.pi / 2)
+        self.assertEqual(len(orientations), 180)
+        self.assertAlmostEqual(orientations[0], -np.pi / 2)
+
+        orientations = sl.get_orientations(Crater, -np.pi / 2, np.pi / 2)
+        self.assertEqual(len(orientations), 1)
+
+    def test_default_sweep(self):
+
+        np.random.seed(0)
+        data = generate_synthetic_scarp(1, 0, 10, 50, 50, sig2=0.01, theta=np.pi / 2)
+        ny, nx = data._griddata.shape
+
+        test = sl.match(data, Scarp, scale=20, age=10)
+        true = sl.compare([sl.match_template(data, Scarp, 20, 10, angle)
+                           for angle in np.linspace(-np.pi / 2, np.pi / 2, 181)], ny, nx)
+
+        edge = np.isclose(np.abs(true[2]), np.pi / 2)
+        self.assertTrue(np.any(edge), "No best fits at +-pi / 2")
+        for this_test, this_true in zip(test, true):
+            self.assertTrue(np.allclose(this_test[edge], this_true[edge]), "Results at +-pi / 2 incorrect")
+            self.assertTrue(np.allclose(this_test, this_true), "Results incorrect")
+
 
 def generate_synthetic_scarp(a, b, kt, x_max, y_max, de=1, sig2=0, theta=0):
     """ Generate DEM of synthetic scarp for testing """
@@ -1,6 +1,7 @@
 import os
 import sys
 import filecmp
+import gc
 import numpy as np
 import unittest
 
@@ -44,6 +45,119 @@ class CalculationMethodsTestCase(unittest.TestCase):
             true_del2z = np.load(os.path.join(TEST_DIR, 'results/faultzone_del2z_{:.0f}.npy'.format(alpha)))
             self.assertTrue(np.allclose(del2z, true_del2z), "Laplacian incorrect (+{:.0f} deg)".format(alpha))
 
+    def test_calculate_directional_laplacian_nodata(self):
+
+        grid = self.dem._griddata.copy()
+        grid[10:15, 20:30] = np.nan
+        self.dem._griddata = grid.copy()
+
+        out = np.empty(grid.shape, dtype=np.float32)
+        del2z = self.dem._calculate_directional_laplacian(np.pi / 4, out=out)
+        self.assertTrue(np.array_equal(grid, self.dem._griddata, equal_nan=True), "Grid data modified")
+
+        filled = np.where(np.isnan(grid), 0, grid)
+        self.dem._griddata = filled
+        true_del2z = self.dem._calculate_directional_laplacian(np.pi / 4)
+        true_del2z[np.isnan(grid)] = np.nan
+
+        self.assertTrue(del2z is out, "Output not written to buffer")
+        self.assertTrue(np.allclose(del2z, true_del2z, rtol=1e-4, atol=1e-6, equal_nan=True), "Laplacian incorrect with missing data")
+
+    def test_derivative_cache(self):
+
+        shape = self.dem._griddata.shape
+        version = self.dem._grid_version
+        del2z = self.dem._calculate_directional_laplacian(np.pi / 4)
+        d2z_dx2 = self.dem._get_derivative('d2z_dx2')
+
+        self.assertTrue(d2z_dx2 is self.dem._get_derivative('d2z_dx2'), "Derivative not cached")
+        self.assertFalse(d2z_dx2.flags.writeable, "Cached derivative is writeable")
+
+        self.dem._calculate_slope()
+        self.assertEqual(self.dem._griddata.shape, shape, "Grid data modified")
+        self.assertEqual(self.dem._grid_version, version, "Grid version changed")
+
+        self.dem._griddata = 2 * self.dem._griddata
+        self.assertTrue(self.dem._grid_version > version, "Grid version not incremented")
+        self.assertTrue(np.allclose(self.dem._calculate_directional_laplacian(np.pi / 4), 2 * del2z, equal_nan=True), "Cache not invalidated")
+
+    def test_get_pyramid_level(self):
+
+        from scipy import ndimage
+
+        self.dem._fill_nodata()
+        ny, nx = self.dem._griddata.shape
+        level = self.dem.get_pyramid_level(4)
+
+        self.assertTrue(level is self.dem.get_pyramid_level(4), "Pyramid level not cached")
+        self.assertTrue(self.dem.get_pyramid_level(1) is self.dem)
+        self.assertEqual(level._griddata.shape, (-(-(ny - 1) // 4), -(-(nx - 1) // 4)))
+        self.assertEqual(level._georef_info.dx, 4 * self.dem._georef_info.dx)
+        x, y = level._georef_info.pixel_to_xy(np.array([0, 3]), np.array([0, 5]))
+        true_x, true_y = self.dem._georef_info.pixel_to_xy(np.array([1, 13]), np.array([1, 21]))
+        self.assertTrue(np.allclose(x, true_x) and np.allclose(y, true_y), "Pyramid level georeferencing incorrect")
+        self.assertEqual(level.smoothing_age, 2 * self.dem._georef_info.dx ** 2)
+
+        true = ndimage.gaussian_filter(self.dem._griddata, 2, mode='reflect')[1::4, 1::4]
+        self.assertTrue(np.allclose(level._griddata, true), "Pyramid level incorrect")
+
+        self.dem._griddata = 2 * self.dem._griddata
+        self.assertFalse(level is self.dem.get_pyramid_level(4), "Cache not invalidated")
+
+    def test_estimate_curvature_noiselevel(self):
+
+        from scipy import ndimage
+
+        grid = self.dem._griddata.copy()
+        grid[10:12, 20:25] = np.nan
+        self.dem._griddata = grid
+
+        for sigma in [5, 20]:
+            angles, mean, sd = self.dem._estimate_curvature_noiselevel(num_angles=7, sigma=sigma)
+
+            for alpha, test_mean, test_sd in zip(angles, mean, sd):
+                del2z = self.dem._calculate_directional_laplacian(alpha)
+                highpass = del2z - ndimage.gaussian_filter(del2z, sigma)
+                self.assertTrue(np.isclose(test_mean, np.nanmean(highpass)), "Noise mean incorrect")
+                self.assertTrue(np.isclose(test_sd, np.nanstd(highpass)), "Noise standard deviation incorrect")
+
+    def test_fill_nodata(self):
+
+        grid = self.dem._griddata.copy()
+        mask = np.zeros(grid.shape, dtype=bool)
+        mask[10:20, 10:15] = True
+        mask[40:42, 60:90] = True
+        mask[:, :3] = True
+        grid[mask] = np.nan
+        self.dem._griddata = grid.copy()
+        self.dem.nodata_value = np.nan
+
+        self.dem._fill_nodata()
+
+        self.assertFalse(np.isnan(self.dem._griddata).any(), "Nodata values not filled")
+        self.assertTrue(np.array_equal(self.dem._griddata[~mask], grid[~mask]), "Valid values modified")
+        self.assertTrue(np.array_equal(self.dem.nodata_mask, mask), "Nodata mask incorrect")
+
+    def test_fill_nodata_with_edge_values(self):
+
+        grid = np.array([[np.nan, 1, 2, np.nan, np.nan, 5, np.nan],
+                         [np.nan] * 7,
+                         [3, np.nan, np.nan, np.nan, 4, np.nan, np.nan]])
+        true = {'first': [[1, 1, 2, 1, 1, 5, 1],
+                          [np.nan] * 7,
+                          [3, 3, 3, 3, 4, 3, 3]],
+                'nearest': [[1, 1, 2, 2, 5, 5, 5],
+                            [np.nan] * 7,
+                            [3, 3, 3, 4, 4, 4, 4]]}
+
+        for mode in ['first', 'nearest']:
+            for axis in [1, 0]:
+                self.dem._griddata = grid.copy() if axis == 1 else grid.T.copy()
+                self.dem.nodata_value = np.nan
+                self.dem._fill_nodata_with_edge_values(axis=axis, mode=mode)
+                test = self.dem._griddata if axis == 1 else self.dem._griddata.T
+                self.assertTrue(np.array_equal(test, true[mode], equal_nan=True), "Edge values filled incorrectly")
+
     def test_pad_boundary(self):
         
         dx = 5
@@ -55,3 +169,103 @@ class CalculationMethodsTestCase(unittest.TestCase):
         self.dem._pad_boundary(dx, dy)
         
         self.assertEqual(self.dem._griddata.all(), padded_grid.all(), "Grid padded incorrectly")
+
+
+class LazyLoadingTestCase(unittest.TestCase):
+
+
+    def setUp(self):
+
+        self.filename = os.path.join(TEST_DIR, 'data/faultzone.tif')
+        self.dem = dem.DEMGrid(self.filename)
+
+    def test_get_window(self):
+
+        lazy = dem.DEMGrid(self.filename, lazy=True)
+        self.assertEqual(lazy.shape, self.dem.shape, "Grid shape incorrect")
+
+        window = lazy.get_window(10, 20, 30, 40)
+        true = self.dem.get_window(10, 20, 30, 40)
+
+        self.assertIsNone(lazy._grid, "Grid data read for window")
+        self.assertTrue(np.array_equal(window._griddata, true._griddata, equal_nan=True), "Window data incorrect")
+        self.assertEqual(window._georef_info.geo_transform, true._georef_info.geo_transform, "Window georeferencing incorrect")
+        self.assertTrue(np.array_equal(window._griddata, self.dem._griddata[10:40, 20:60], equal_nan=True), "Window data incorrect")
+
+    def test_lazy_griddata(self):
+
+        lazy = dem.DEMGrid(self.filename, lazy=True)
+
+        self.assertTrue(np.allclose(lazy._griddata, self.dem._griddata, equal_nan=True), "Grid data incorrect")
+
+    def test_xy_to_pixel(self):
+
+        rows = np.array([0, 10, self.dem._georef_info.ny - 1])
+        cols = np.array([0, 20, self.dem._georef_info.nx - 1])
+        x, y = self.dem._georef_info.pixel_to_xy(rows, cols)
+
+        test_rows, test_cols = self.dem._georef_info.xy_to_pixel(x, y)
+        self.assertTrue(np.array_equal(test_rows, rows), "Rows incorrect")
+        self.assertTrue(np.array_equal(test_cols, cols), "Columns incorrect")
+
+
+class MosaicTestCase(unittest.TestCase):
+
+
+    def setUp(self):
+
+        import tempfile
+
+        self.filename = os.path.join(TEST_DIR, 'data/faultzone.tif')
+        self.dem = dem.DEMGrid(self.filename)
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+        ny, nx = self.dem.shape
+        self.tiles = []
+        for i, (col, ncols) in enumerate([(0, nx // 2), (nx // 2, nx - nx // 2)]):
+            tile = os.path.join(self.tmpdir.name, 'tile{}.tif'.format(i))
+            dem.gdal.Translate(tile, self.filename, srcWin=[col, 0, ncols, ny])
+            self.tiles.append(dem.DEMGrid(tile))
+
+    def tearDown(self):
+
+        self.tmpdir.cleanup()
+
+    def test_merge(self):
+
+        merged = self.tiles[0].merge(self.tiles[1])
+
+        self.assertEqual(merged.shape, self.dem.shape, "Mosaic shape incorrect")
+        self.assertEqual(merged._georef_info.geo_transform, self.dem._georef_info.geo_transform, "Mosaic georeferencing incorrect")
+
+        ny, nx = self.dem.shape
+        window = merged.read_window(10, nx // 2 - 20, 30, 40)
+        true = self.dem._griddata[10:40, nx // 2 - 20:nx // 2 + 20]
+        self.assertTrue(np.allclose(window, true, equal_nan=True), "Window across seam incorrect")
+
+    def test_mosaic_vsimem_cleanup(self):
+
+        merged = dem.mosaic(self.tiles, lazy=False)
+        self.assertIsNone(dem.gdal.VSIStatL(merged.filename), "In-memory mosaic not removed")
+
+        lazy = dem.mosaic(self.tiles)
+        filename = lazy.filename
+        self.assertIsNotNone(dem.gdal.VSIStatL(filename), "In-memory mosaic removed while in use")
+
+        del lazy
+        gc.collect()
+        self.assertIsNone(dem.gdal.VSIStatL(filename), "In-memory mosaic not removed")
+
+    def test_open_vsimem_grid(self):
+
+        filename = '/vsimem/scarplet_test_tile.tif'
+        dem.gdal.Translate(filename, self.tiles[0].filename)
+        try:
+            lazy = dem.DEMGrid(filename, lazy=True)
+            self.assertTrue(np.allclose(lazy._griddata, self.tiles[0]._griddata, equal_nan=True), "Grid data incorrect")
+
+            del lazy
+            gc.collect()
+            self.assertIsNotNone(dem.gdal.VSIStatL(filename), "Caller's in-memory file removed")
+        finally:
+            dem.gdal.Unlink(filename)
@@ -0,0 +1,131 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import unittest
+
+from functools import partial
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+
+import numpy as np
+
+from context import scarplet
+from scarplet.datasets import download
+from scarplet.datasets.download import TileDownloader, PARTIAL_SUFFIX
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """ Directory listing server supporting single byte range requests """
+
+    def send_head(self):
+
+        match = re.match(r'bytes=(\d+)-$', self.headers.get('Range', ''))
+        path = self.translate_path(self.path)
+        if match is None or os.path.isdir(path):
+            return SimpleHTTPRequestHandler.send_head(self)
+
+        f = open(path, 'rb')
+        size = os.fstat(f.fileno()).st_size
+        start = int(match.group(1))
+        if start >= size:
+            f.close()
+            self.send_error(416)
+            return None
+
+        f.seek(start)
+        self.send_response(206)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, size - 1, size))
+        self.send_header('Content-Length', str(size - start))
+        self.end_headers()
+        return f
+
+    def log_message(self, *args):
+
+        pass
+
+
+@unittest.skipIf(download.requests is None, "requests is not installed")
+class TileDownloaderTestCase(unittest.TestCase):
+
+
+    def setUp(self):
+
+        self.src_dir = tempfile.TemporaryDirectory()
+        self.dest_dir = tempfile.TemporaryDirectory()
+
+        np.random.seed(0)
+        self.tile_dir = os.path.join(self.src_dir.name, 'tile')
+        os.mkdir(self.tile_dir)
+        self.contents = {}
+        for i in range(5):
+            name = 'w00100{:d}.adf'.format(i)
+            data = np.random.bytes(1000 * (i + 1))
+            with open(os.path.join(self.tile_dir, name), 'wb') as f:
+                f.write(data)
+            self.contents[name] = data
+
+        handler = partial(RangeRequestHandler, directory=self.src_dir.name)
+        self.server = HTTPServer(('127.0.0.1', 0), handler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:{:d}/tile/'.format(self.server.server_port)
+
+    def tearDown(self):
+
+        self.server.shutdown()
+        self.server.server_close()
+        self.src_dir.cleanup()
+        self.dest_dir.cleanup()
+
+    def test_download_directory(self):
+
+        downloader = TileDownloader(self.dest_dir.name, max_workers=3)
+        paths = downloader.download_directory(self.url)
+
+        self.assertEqual(sorted(os.path.basename(p) for p in paths), sorted(self.contents))
+        for path in paths:
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), self.contents[os.path.basename(path)])
+
+        manifest = TileDownloader(self.dest_dir.name).manifest
+        self.assertEqual(len(manifest), len(self.contents))
+        for name, data in self.contents.items():
+            record = manifest[os.path.join('tile', name)]
+            self.assertEqual(record['size'], len(data))
+            self.assertEqual(record['sha256'], hashlib.sha256(data).hexdigest())
+
+    def test_resume(self):
+
+        name = 'w001004.adf'
+        data = self.contents[name]
+        path = os.path.join(self.dest_dir.name, 'tile', name)
+        os.mkdir(os.path.dirname(path))
+        with open(path + PARTIAL_SUFFIX, 'wb') as f:
+            f.write(data[:1234])
+
+        downloader = TileDownloader(self.dest_dir.name)
+        downloader.download([self.url + name], subdir='tile')
+
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), data, "Resumed download incorrect")
+        self.assertFalse(os.path.exists(path + PARTIAL_SUFFIX))
+
+    def test_checksum(self):
+
+        name = 'w001000.adf'
+        downloader = TileDownloader(self.dest_dir.name, retries=2)
+        with self.assertRaises(IOError):
+            downloader.download([self.url + name], checksums={name: '0' * 64})
+        self.assertNotIn(name, downloader.manifest)
+
+        checksum = hashlib.sha256(self.contents[name]).hexdigest()
+        path, = downloader.download([self.url + name], checksums={name: checksum})
+        self.assertIn(name, downloader.manifest)
+
+        mtime = os.path.getmtime(path)
+        os.utime(path, (mtime - 100, mtime - 100))
+        downloader.download([self.url + name], checksums={name: checksum})
+        self.assertEqual(os.path.getmtime(path), mtime - 100, "Completed file downloaded again")
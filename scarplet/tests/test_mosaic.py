@@ -0,0 +1,115 @@
+import os
+import tempfile
+import unittest
+
+from unittest import mock
+
+from context import scarplet
+from scarplet.datasets.catalog import TileCatalog, TileRecord
+from scarplet.datasets import mosaic
+from scarplet.datasets.mosaic import build_mosaics, is_up_to_date, mosaic_path, plan_mosaics
+
+
+TEST_DIR = os.path.dirname(__file__)
+
+
+def make_tile(x, y, size=1000, mtime=0):
+
+    return TileRecord('tile_{}_{}'.format(x, y), x, y, x + size, y + size,
+                      1, -1, size, size, 'float32', '', -9999, 0, mtime, 1, None)
+
+
+class PlanMosaicsTestCase(unittest.TestCase):
+
+
+    def setUp(self):
+
+        self.tiles = [make_tile(x, y) for x in range(0, 5000, 1000)
+                      for y in range(0, 3000, 1000)]
+
+    def test_plan(self):
+
+        jobs = plan_mosaics(self.tiles, 2000, 2000)
+        self.assertEqual(len(jobs), 6)
+
+        inputs = [path for job in jobs for path in job.inputs]
+        self.assertEqual(sorted(inputs), sorted(t.path for t in self.tiles),
+                         "Tiles missing or processed more than once")
+
+        job = [j for j in jobs if j.name == 'mosaic_0_0'][0]
+        self.assertEqual(job.bounds, (0, 0, 2000, 2000))
+        self.assertEqual(len(job.inputs), 4)
+
+    def test_plan_overlap(self):
+
+        jobs = plan_mosaics(self.tiles, 2000, 2000, overlap=1000)
+        job = [j for j in jobs if j.name == 'mosaic_0_0'][0]
+        self.assertEqual(job.bounds, (-1000, -1000, 3000, 3000))
+        self.assertEqual(len(job.inputs), 9)
+
+    def test_plan_reproducible(self):
+
+        jobs = plan_mosaics(self.tiles, 2000, 2000)
+        self.assertEqual(jobs, plan_mosaics(self.tiles[::-1], 2000, 2000))
+
+        changed = list(self.tiles)
+        changed[0] = make_tile(0, 0, mtime=1)
+        new_jobs = plan_mosaics(changed, 2000, 2000)
+        changed_jobs = [a.name for a, b in zip(jobs, new_jobs) if a.signature != b.signature]
+        self.assertEqual(changed_jobs, ['mosaic_0_0'])
+
+
+class BuildMosaicsTestCase(unittest.TestCase):
+
+
+    def setUp(self):
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        with TileCatalog(':memory:') as catalog:
+            catalog.update([os.path.join(TEST_DIR, 'data/synthetic.tif')])
+            self.tiles = catalog.tiles()
+
+    def tearDown(self):
+
+        self.tmp_dir.cleanup()
+
+    def test_build(self):
+
+        tile = self.tiles[0]
+        width = tile.xmax - tile.xmin
+        height = tile.ymax - tile.ymin
+        jobs = plan_mosaics(self.tiles, width, height, origin=(tile.xmin, tile.ymin))
+        self.assertEqual(len(jobs), 1)
+
+        built = build_mosaics(jobs, self.tmp_dir.name, max_workers=1)
+        self.assertEqual(len(built), 1)
+        self.assertTrue(is_up_to_date(jobs[0], self.tmp_dir.name))
+
+        built = build_mosaics(jobs, self.tmp_dir.name, max_workers=1)
+        self.assertEqual(built, [], "Unchanged mosaic was rebuilt")
+
+    def test_build_failure_cleanup(self):
+
+        tile = self.tiles[0]
+        job, = plan_mosaics(self.tiles, tile.xmax - tile.xmin, tile.ymax - tile.ymin, origin=(tile.xmin, tile.ymin))
+        vrt_filenames = []
+
+        def build_vrt(filename, *args, **kwargs):
+            vrt_filenames.append(filename)
+            return build_vrt.original(filename, *args, **kwargs)
+
+        def translate(filename, *args, **kwargs):
+            with open(filename, 'wb') as f:
+                f.write(b'partial')
+            return None
+
+        build_vrt.original = mosaic.gdal.BuildVRT
+        with mock.patch.object(mosaic.gdal, 'BuildVRT', build_vrt), \
+                mock.patch.object(mosaic.gdal, 'Translate', translate):
+            with self.assertRaises(IOError):
+                mosaic._build_mosaic(job, self.tmp_dir.name, -9999)
+
+        path = mosaic_path(job, self.tmp_dir.name)
+        self.assertFalse(os.path.exists(path + '.tmp.tif'), "Partial mosaic not removed")
+        self.assertFalse(os.path.exists(path))
+        self.assertIsNone(mosaic.gdal.VSIStatL(vrt_filenames[0]), "In-memory VRT not removed")
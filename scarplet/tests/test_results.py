@@ -0,0 +1,129 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from context import scarplet
+from scarplet import dem
+from scarplet import results
+from scarplet.results import PointTable, ResultStore, save_cog
+
+
+def has_cog_driver():
+    """ Check if GDAL can write cloud-optimized GeoTIFFs (GDAL >= 3.1) """
+
+    try:
+        from osgeo import gdal
+        return gdal.GetDriverByName(results.COG_DRIVER_NAME) is not None
+    except (ImportError, AttributeError):
+        return False
+
+
+class PointTableTestCase(unittest.TestCase):
+
+
+    def setUp(self):
+
+        np.random.seed(0)
+        self.results = np.random.rand(4, 20, 30)
+        self.georef_info = dem.GeorefInfo()
+        self.georef_info.geo_transform = (1000, 2, 0, 5000, 0, -2)
+        self.table = PointTable(snr_threshold=0.9)
+
+    def test_append(self):
+
+        self.table.append(self.results[:, :10], self.georef_info)
+        self.table.append(self.results[:, 10:], self.georef_info, row_offset=10)
+
+        snr = self.results[3]
+        rows, cols = np.nonzero(snr > 0.9)
+
+        self.assertEqual(len(self.table), len(rows))
+        self.assertTrue(np.array_equal(self.table['row'], rows), "Rows incorrect")
+        self.assertTrue(np.array_equal(self.table['col'], cols), "Columns incorrect")
+        self.assertTrue(np.allclose(self.table['x'], 1000 + 2 * (cols + 0.5)), "x coordinates incorrect")
+        self.assertTrue(np.allclose(self.table['y'], 5000 - 2 * (rows + 0.5)), "y coordinates incorrect")
+        self.assertTrue(np.allclose(self.table['amp'], self.results[0][rows, cols]), "Amplitudes incorrect")
+        self.assertTrue(np.allclose(self.table['snr'], snr[rows, cols]), "SNRs incorrect")
+
+    def test_save_load(self):
+
+        self.table.append(self.results, self.georef_info)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'table.npz')
+            self.table.save(filename)
+            loaded = PointTable.load(filename)
+
+        self.assertEqual(loaded.snr_threshold, 0.9)
+        for name in PointTable.columns:
+            self.assertTrue(np.array_equal(loaded[name], self.table[name]), "Column {} incorrect".format(name))
+
+
+@unittest.skipIf(results.zarr is None, "zarr is not installed")
+class ResultStoreTestCase(unittest.TestCase):
+
+
+    def setUp(self):
+
+        np.random.seed(0)
+        self.results = np.random.rand(4, 50, 70)
+        self.georef_info = dem.GeorefInfo()
+        self.georef_info.geo_transform = (1000, 2, 0, 5000, 0, -2)
+        self.georef_info.projection = ''
+        self.georef_info.ny, self.georef_info.nx = 50, 70
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'results.zarr')
+
+    def tearDown(self):
+
+        self.tmp_dir.cleanup()
+
+    def test_write_read_window(self):
+
+        store = ResultStore.create(self.path, self.georef_info, chunks=(16, 32), dtype=np.float64)
+        for row in range(0, 50, 16):
+            for col in range(0, 70, 32):
+                store.write_window(self.results[:, row:row + 16, col:col + 32], row, col)
+
+        store = ResultStore(self.path)
+        self.assertEqual(store.shape, (50, 70))
+        self.assertEqual(store.georef_info.geo_transform, self.georef_info.geo_transform)
+        self.assertTrue(np.allclose(store.read_window(), self.results), "Results incorrect")
+        self.assertTrue(np.allclose(store.read_window(10, 20, 5, 7), self.results[:, 10:15, 20:27]),
+                        "Window incorrect")
+
+
+@unittest.skipIf(not has_cog_driver(), "GDAL COG driver is not available")
+class SaveCOGTestCase(unittest.TestCase):
+
+
+    def setUp(self):
+
+        np.random.seed(0)
+        self.results = np.random.rand(4, 300, 400)
+        self.georef_info = dem.GeorefInfo()
+        self.georef_info.geo_transform = (1000, 2, 0, 5000, 0, -2)
+        self.georef_info.projection = ''
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp_dir.name, 'results.tif')
+
+    def tearDown(self):
+
+        self.tmp_dir.cleanup()
+
+    def test_save_cog(self):
+
+        from osgeo import gdal
+
+        save_cog(self.results, self.georef_info, self.filename, blocksize=128)
+
+        dataset = gdal.Open(self.filename)
+        self.assertEqual(dataset.RasterCount, 4)
+        self.assertEqual(dataset.GetGeoTransform(), self.georef_info.geo_transform, "Geotransform incorrect")
+        for i, band in enumerate(self.results):
+            test = dataset.GetRasterBand(i + 1).ReadAsArray()
+            self.assertTrue(np.allclose(test, band.astype(np.float32)), "Band {:d} incorrect".format(i + 1))
+            self.assertGreater(dataset.GetRasterBand(i + 1).GetOverviewCount(), 0, "Overviews missing")
+        dataset = None
@@ -0,0 +1,78 @@
+import hashlib
+import os
+import tempfile
+import numpy as np
+import unittest
+
+from context import scarplet
+from scarplet.utils import BoundingBox, BoundingBoxArray, TileIndex, file_checksum
+
+
+class BoundingBoxArrayTestCase(unittest.TestCase):
+
+
+    def test_intersects(self):
+
+        bboxes = BoundingBoxArray([0, 10, 0], [0, 0, 5], [10, 20, 30], [10, 10, 6])
+        other = BoundingBox((15, -5), (12, 20))
+
+        test = bboxes.intersects(other)[:, 0]
+        true = [False, True, True]
+        self.assertTrue(np.array_equal(test, true), "Intersections incorrect")
+
+        test = bboxes.intersects(bboxes)
+        self.assertTrue(test.all(), "Touching or crossing boxes do not intersect")
+
+
+class TileIndexTestCase(unittest.TestCase):
+
+
+    def setUp(self):
+
+        rng = np.random.RandomState(0)
+        x, y = rng.uniform(0, 1000, (2, 500))
+        width, height = rng.uniform(1, 20, (2, 500))
+        self.bboxes = BoundingBoxArray(x, y, x + width, y + height)
+        self.index = TileIndex(self.bboxes, node_capacity=8)
+
+    def test_query(self):
+
+        queries = BoundingBoxArray([0, 100, 500, -10], [0, 300, 500, -10], [50, 400, 500, -5], [1000, 350, 500, -5])
+
+        for query, test in zip(range(len(queries)), self.index.query_batch(queries)):
+            true = np.flatnonzero(self.bboxes.intersects(queries[query:query + 1])[:, 0])
+            self.assertTrue(np.array_equal(test, true), "Query results incorrect")
+
+    def test_neighbours(self):
+
+        test = self.index.neighbours(3)
+        true = np.flatnonzero(self.bboxes.intersects(self.bboxes[3:4])[:, 0])
+        true = true[true != 3]
+
+        self.assertTrue(np.array_equal(test, true), "Neighbours incorrect")
+
+    def test_connected_components(self):
+
+        bboxes = BoundingBoxArray([0, 10, 50, 55], [0, 0, 0, 0], [10, 20, 55, 60], [10, 10, 5, 5])
+        labels = TileIndex(bboxes).connected_components()
+
+        self.assertTrue(np.array_equal(labels, [0, 0, 1, 1]), "Connected components incorrect")
+
+
+class FileChecksumTestCase(unittest.TestCase):
+
+
+    def test_file_checksum(self):
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            os.mkdir(os.path.join(tmp_dir, 'grid'))
+            contents = [b'header', b'x' * 3000000]
+            for name, data in zip(['grid/hdr.adf', 'grid/w001000.adf'], contents):
+                with open(os.path.join(tmp_dir, name), 'wb') as f:
+                    f.write(data)
+
+            test = file_checksum(os.path.join(tmp_dir, 'grid/w001000.adf'))
+            self.assertEqual(test, hashlib.sha256(contents[1]).hexdigest(), "File checksum incorrect")
+
+            test = file_checksum(os.path.join(tmp_dir, 'grid'))
+            self.assertEqual(test, hashlib.sha256(b''.join(contents)).hexdigest(), "Directory checksum incorrect")
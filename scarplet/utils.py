@@ -1,6 +1,14 @@
 # -*- coding: utf-8
 """ Utility classes and funcitons for template matching framework. """
 
+import hashlib
+import os
+
+import numpy as np
+
+
+CHUNK_SIZE = 1 << 20
+
 
 class BoundingBox(object):
 
@@ -42,3 +50,372 @@ class BoundingBox(object):
                 return True
 
         return False
+
+
+class BoundingBoxArray(object):
+    """Array of axis-aligned bounding boxes with vectorized tests
+
+    Attributes
+    ----------
+    xmin : numpy array
+        Minimum x coordinates of boxes
+    ymin : numpy array
+        Minimum y coordinates of boxes
+    xmax : numpy array
+        Maximum x coordinates of boxes
+    ymax : numpy array
+        Maximum y coordinates of boxes
+
+    Methods
+    -------
+    from_bboxes(bboxes):
+        Create array from list of BoundingBox objects
+    contains(x, y):
+        Test whether boxes contain points
+    intersects(bboxes):
+        Test whether boxes intersect other boxes
+    union():
+        Return box enclosing all boxes
+    """
+
+    def __init__(self, xmin, ymin, xmax, ymax):
+
+        xmin, xmax = np.asarray(xmin, dtype=float), np.asarray(xmax, dtype=float)
+        ymin, ymax = np.asarray(ymin, dtype=float), np.asarray(ymax, dtype=float)
+
+        # Corners are normalized so that grids with positive y spacing work
+        self.xmin = np.atleast_1d(np.minimum(xmin, xmax))
+        self.xmax = np.atleast_1d(np.maximum(xmin, xmax))
+        self.ymin = np.atleast_1d(np.minimum(ymin, ymax))
+        self.ymax = np.atleast_1d(np.maximum(ymin, ymax))
+
+    @classmethod
+    def from_bboxes(cls, bboxes):
+        """Create array from list of BoundingBox objects
+
+        Parameters
+        ----------
+        bboxes : list
+            List of BoundingBox objects
+
+        Returns
+        -------
+        array : BoundingBoxArray
+            Array of bounding boxes
+        """
+
+        if isinstance(bboxes, BoundingBox):
+            bboxes = [bboxes]
+
+        ulx, uly, lrx, lry = np.array([(b.ulx, b.uly, b.lrx, b.lry)
+                                       for b in bboxes], dtype=float).reshape(-1, 4).T
+
+        return cls(ulx, lry, lrx, uly)
+
+    def __len__(self):
+
+        return len(self.xmin)
+
+    def __getitem__(self, index):
+
+        return BoundingBoxArray(self.xmin[index], self.ymin[index],
+                                self.xmax[index], self.ymax[index])
+
+    def contains(self, x, y):
+        """Test whether boxes contain points, including their edges
+
+        Parameters
+        ----------
+        x : float or numpy array
+            X coordinates of points
+        y : float or numpy array
+            Y coordinates of points
+
+        Returns
+        -------
+        result : numpy array
+            Boolean array with dimensions of (n, m) for n boxes and m points
+        """
+
+        x = np.atleast_1d(x)[np.newaxis, :]
+        y = np.atleast_1d(y)[np.newaxis, :]
+
+        return ((self.xmin[:, np.newaxis] <= x) & (x <= self.xmax[:, np.newaxis])
+                & (self.ymin[:, np.newaxis] <= y) & (y <= self.ymax[:, np.newaxis]))
+
+    def intersects(self, bboxes):
+        """Test whether boxes intersect or touch other boxes
+
+        Parameters
+        ----------
+        bboxes : BoundingBoxArray or BoundingBox
+            Boxes to test against
+
+        Returns
+        -------
+        result : numpy array
+            Boolean array with dimensions of (n, m) for n boxes in this array
+            and m other boxes
+        """
+
+        if not isinstance(bboxes, BoundingBoxArray):
+            bboxes = BoundingBoxArray.from_bboxes(bboxes)
+
+        return ((self.xmin[:, np.newaxis] <= bboxes.xmax[np.newaxis, :])
+                & (bboxes.xmin[np.newaxis, :] <= self.xmax[:, np.newaxis])
+                & (self.ymin[:, np.newaxis] <= bboxes.ymax[np.newaxis, :])
+                & (bboxes.ymin[np.newaxis, :] <= self.ymax[:, np.newaxis]))
+
+    def union(self):
+        """Return box enclosing all boxes
+
+        Returns
+        -------
+        bbox : BoundingBoxArray
+            Array containing one enclosing box
+        """
+
+        return BoundingBoxArray(self.xmin.min(), self.ymin.min(),
+                                self.xmax.max(), self.ymax.max())
+
+
+class TileIndex(object):
+    """R-tree spatial index over tile footprints, packed with the
+    Sort-Tile-Recursive (STR) algorithm
+
+    Each level of the tree is stored as a BoundingBoxArray. Packing keeps the
+    children of each node contiguous, so queries descend the tree with array
+    operations on one level at a time.
+
+    Attributes
+    ----------
+    bboxes : BoundingBoxArray
+        Footprints of indexed tiles
+    node_capacity : int
+        Maximum number of children of each node
+
+    Methods
+    -------
+    query(bbox):
+        Find tiles intersecting a box
+    query_batch(bboxes):
+        Find tiles intersecting each of several boxes
+    neighbours(index):
+        Find tiles intersecting or touching a tile
+
+    References
+    ----------
+    Leutenegger, S.T., Lopez, M.A. and Edgington, J., 1997. STR: A simple and
+    efficient algorithm for R-tree packing. Proceedings of the 13th
+    International Conference on Data Engineering, 497-506.
+    """
+
+    def __init__(self, bboxes, node_capacity=16):
+        """Build index
+
+        Parameters
+        ----------
+        bboxes : BoundingBoxArray or list
+            Footprints of tiles, as an array or list of BoundingBox objects
+        node_capacity : int, optional
+            Maximum number of children of each node, default 16
+        """
+
+        if not isinstance(bboxes, BoundingBoxArray):
+            bboxes = BoundingBoxArray.from_bboxes(bboxes)
+
+        self.bboxes = bboxes
+        self.node_capacity = node_capacity
+
+        # Leaf level holds tiles in packed order; each upper level holds node
+        # boxes with the start and stop of their children in the level below
+        order = self._pack(bboxes)
+        self._order = order
+        level = bboxes[order]
+        self._levels = [level]
+        self._children = []
+
+        while len(level) > 1:
+            starts = np.arange(0, len(level), node_capacity)
+            stops = np.minimum(starts + node_capacity, len(level))
+            level = BoundingBoxArray(np.minimum.reduceat(level.xmin, starts),
+                                     np.minimum.reduceat(level.ymin, starts),
+                                     np.maximum.reduceat(level.xmax, starts),
+                                     np.maximum.reduceat(level.ymax, starts))
+
+            order = self._pack(level)
+            level = level[order]
+            self._levels.append(level)
+            self._children.append((starts[order], stops[order]))
+
+    def __len__(self):
+
+        return len(self.bboxes)
+
+    def _pack(self, bboxes):
+        """Return STR packing order of boxes"""
+
+        n = len(bboxes)
+        if n <= self.node_capacity:
+            return np.arange(n)
+
+        x = (bboxes.xmin + bboxes.xmax) / 2
+        y = (bboxes.ymin + bboxes.ymax) / 2
+
+        num_nodes = int(np.ceil(n / self.node_capacity))
+        slice_size = self.node_capacity * int(np.ceil(np.sqrt(num_nodes)))
+
+        order = np.argsort(x, kind='stable')
+        slices = [order[i:i + slice_size] for i in range(0, n, slice_size)]
+
+        return np.concatenate([s[np.argsort(y[s], kind='stable')]
+                               for s in slices])
+
+    def query(self, bbox):
+        """Find tiles intersecting or touching a box
+
+        Parameters
+        ----------
+        bbox : BoundingBox or BoundingBoxArray
+            Box to query
+
+        Returns
+        -------
+        index : numpy array
+            Sorted indices of intersecting tiles
+        """
+
+        if not isinstance(bbox, BoundingBoxArray):
+            bbox = BoundingBoxArray.from_bboxes(bbox)
+
+        if len(self.bboxes) == 0:
+            return np.array([], dtype=int)
+
+        candidates = np.arange(len(self._levels[-1]))
+        for level, children in zip(self._levels[:0:-1], self._children[::-1]):
+            hits = candidates[level[candidates].intersects(bbox)[:, 0]]
+            starts, stops = children
+            candidates = _expand_ranges(starts[hits], stops[hits])
+
+        leaves = self._levels[0][candidates]
+        hits = candidates[leaves.intersects(bbox)[:, 0]]
+
+        return np.sort(self._order[hits])
+
+    def query_batch(self, bboxes):
+        """Find tiles intersecting or touching each of several boxes
+
+        Parameters
+        ----------
+        bboxes : BoundingBoxArray or list
+            Boxes to query
+
+        Returns
+        -------
+        indices : list
+            List of arrays of sorted tile indices, one per box
+        """
+
+        if not isinstance(bboxes, BoundingBoxArray):
+            bboxes = BoundingBoxArray.from_bboxes(bboxes)
+
+        return [self.query(bboxes[i:i + 1]) for i in range(len(bboxes))]
+
+    def neighbours(self, index):
+        """Find tiles intersecting or touching a tile
+
+        Parameters
+        ----------
+        index : int
+            Index of tile
+
+        Returns
+        -------
+        index : numpy array
+            Sorted indices of neighbouring tiles, excluding the tile itself
+        """
+
+        hits = self.query(self.bboxes[index:index + 1])
+        return hits[hits != index]
+
+    def connected_components(self):
+        """Label groups of tiles connected by intersecting or touching
+
+        Returns
+        -------
+        labels : numpy array
+            Label of group of each tile, numbered from 0
+        """
+
+        labels = np.full(len(self), -1, dtype=int)
+        label = 0
+        for seed in range(len(self)):
+            if labels[seed] >= 0:
+                continue
+
+            labels[seed] = label
+            stack = [seed]
+            while stack:
+                neighbours = self.neighbours(stack.pop())
+                neighbours = neighbours[labels[neighbours] < 0]
+                labels[neighbours] = label
+                stack.extend(neighbours)
+            label += 1
+
+        return labels
+
+
+def tile_files(path):
+    """List files making up a tile
+
+    Parameters
+    ----------
+    path : str
+        Path to file, or to directory holding a single raster (e.g. an
+        ArcInfo grid)
+
+    Returns
+    -------
+    filenames : list
+        Sorted paths of files
+    """
+
+    if not os.path.isdir(path):
+        return [path]
+
+    return sorted(os.path.join(root, name)
+                  for root, _, names in os.walk(path) for name in names)
+
+
+def file_checksum(path):
+    """Return SHA-256 checksum of a file or of all files in a directory
+
+    Parameters
+    ----------
+    path : str
+        Path to file or directory
+
+    Returns
+    -------
+    checksum : str
+        Hexadecimal digest
+    """
+
+    digest = hashlib.sha256()
+    for filename in tile_files(path):
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def _expand_ranges(starts, stops):
+    """Concatenate integer ranges given by vectors of starts and stops"""
+
+    lengths = stops - starts
+    if lengths.sum() == 0:
+        return np.array([], dtype=int)
+
+    offsets = np.repeat(stops - lengths.cumsum(), lengths)
+    return np.arange(lengths.sum()) + offsets
@@ -0,0 +1,66 @@
+"""
+Compare throughput of full template matching and the detection cascade on the
+Carrizo Plain example dataset
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+import scarplet as sl
+from scarplet.datasets import load_carrizo
+from scarplet.WindowedTemplate import Scarp
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--scale', type=float, default=50)
+    parser.add_argument('--age', type=float, default=10)
+    parser.add_argument('--screen', default='curvature', choices=['curvature', 'sweep'])
+    parser.add_argument('--quantile', type=float, default=0.95)
+    parser.add_argument('--block-size', type=int, default=64)
+    args = parser.parse_args()
+
+    data = load_carrizo()
+    ny, nx = data._griddata.shape
+    de = data._georef_info.dx
+    print("Grid: {:d} x {:d} cells, {:.1f} m spacing".format(ny, nx, de))
+
+    start = time.time()
+    full = sl.match(data, Scarp, scale=args.scale, age=args.age)
+    full_time = time.time() - start
+    print("Full match: {:.2f} s".format(full_time))
+
+    start = time.time()
+    screen = sl.screen_curvature if args.screen == 'curvature' else sl.screen_sweep
+    candidates = screen(data, Scarp, args.scale, quantile=args.quantile)
+    screen_time = time.time() - start
+
+    halo = sl.get_halo(Scarp, args.scale, args.age, de)
+    windows, mask = sl.get_candidate_windows(candidates, halo, args.block_size)
+    area = sum((r1 - r0) * (c1 - c0) for (r0, r1, c0, c1), _ in windows)
+
+    start = time.time()
+    cascade = sl.match_cascade(data, Scarp, candidates=candidates,
+                               block_size=args.block_size,
+                               scale=args.scale, age=args.age)
+    cascade_time = time.time() - start + screen_time
+
+    print("Cascade: {:.2f} s ({:.2f} s screening), {:d} windows".format(cascade_time, screen_time, len(windows)))
+    print("Candidate blocks: {:.1%} of grid, windows: {:.1%} of grid".format(mask.mean(), area / (nx * ny)))
+    print("Speedup: {:.2f}x".format(full_time / cascade_time))
+
+    snr = full[3]
+    strong = snr > np.percentile(snr[snr > 0], 99)
+    print("Strongest 1% of full-match SNRs in candidate blocks: {:.1%}".format(mask[strong].mean()))
+    # Near grid edges, circular convolution wraps full-grid results around
+    interior = mask.copy()
+    interior[:halo] = interior[-halo:] = False
+    interior[:, :halo] = interior[:, -halo:] = False
+    diff = np.abs(cascade[3, interior] - full[3, interior]).max() / snr.max()
+    print("Max relative SNR difference in candidate blocks away from grid edges: {:.3g}".format(diff))
+
+
+if __name__ == "__main__":
+    main()
@@ -15,8 +15,16 @@ from osgeo import gdal, ogr, osr
 
 from copy import copy
 
-sys.path.append('/usr/bin')
-import gdal_merge
+from scarplet.datasets.catalog import TileCatalog
+from scarplet.datasets.download import TileDownloader
+from scarplet.datasets.mosaic import build_mosaics, plan_mosaics
+from scarplet.utils import BoundingBoxArray, TileIndex
+
+# Tile metadata catalog kept alongside downloaded rasters
+CATALOG_NAME = 'catalog.sqlite'
+
+# Tolerance so that tiles touching a query region are not matched
+EDGE_TOLERANCE = 1e-6
 
 def combine_all_overlapping_grids(data_dir):
     # TODO: implement this
@@ -39,73 +47,84 @@ def download_datasets(base_url = 'https://cloud.sdsc.edu/v1/AUTH_opentopography/
     #for fn in dataset_names:
     #    download_directory(os.path.join(base_url, fn))
 
-    datasets = np.array([file_info(dest_dir + fn) for fn in dataset_names])
+    with TileCatalog(os.path.join(dest_dir, CATALOG_NAME)) as catalog:
+        catalog.update([dest_dir + fn for fn in dataset_names])
+        records = dict((r.path, r) for r in catalog.tiles())
+
+    datasets = np.array([file_info.from_record(records[os.path.abspath(dest_dir + fn)])
+                         for fn in dataset_names])
 
     return datasets
 
-def download_directory(url, working_dir='/media/rmsare/data/ot_data/'):
+def download_directory(url, working_dir='/media/rmsare/data/ot_data/', max_workers=8):
     """
     Download all files in a remote directory. Does not descend into 
-    subdirectories.
+    subdirectories. Partial downloads are resumed and completed files are 
+    recorded in a manifest in working_dir.
     """
-    s = url.split('/')
-    dir_name = working_dir + s[-1]
-
-    if not os.path.exists(dir_name):
-        os.mkdir(dir_name)
-    if not os.path.exists(dir_name + '/w001001.adf'): #TODO: Make this a chksum and loop until complete?
-        file_names = list_files_from_url(url)
-        for fn in file_names:
-            if not os.path.exists(os.path.join(dir_name, fn)):
-                urllib.urlretrieve(os.path.join(url, fn), os.path.join(dir_name, fn))
+    downloader = TileDownloader(working_dir, max_workers=max_workers)
+    return downloader.download_directory(url)
 
 def download_directory_recursive(utl, working_dir='/media/rmsare/data/arra_data/'):
     pass
 
-def find_matching_files(base_file, datasets, nx, ny, working_dir='/media/rmsare/data/ot_data/'):
+def build_tile_index(datasets):
+    """
+    Build spatial index over footprints of file_info objects.
     """
-    Find matching filenames by EarthScope survey naming conventions.
-    Survey data are named by the convention:
 
-    ccXXX_YYYY.fmt
+    bboxes = BoundingBoxArray([d.ulx for d in datasets],
+                              [d.lry for d in datasets],
+                              [d.lrx for d in datasets],
+                              [d.uly for d in datasets])
 
-    where:  - "cc" is a data code ('u' for unfiltered, 'fg' for filtered ground 
-              returns only, etc)
-            - "XXX" and "YYYY" are the most siginificant digits of the dataset's
-              lower left corner (XXX000, YYYY000) in UTM 10N coordinate system
+    return TileIndex(bboxes)
 
-    directories for gridded data use the convention "ccXXX_YYYY/"
+def query_region(index, datasets, xmin, ymin, xmax, ymax):
+    """
+    Find datasets whose footprints overlap a region, excluding those that
+    only touch its edges.
     """
-    s = base_file.filename.split('/')[-1].split('_')
-    llx = int(s[0][2:5])*1000
-    lly = int(s[1][0:4])*1000
 
-    code = 'fg'
-    names = [form_dataset_name(code, llx + dx*1000, lly + dy*1000) 
-                     for dx in range(-nx,nx) for dy in range(-ny,ny)]
-    
-    # TODO: find a Pythonic way to do this
-    matching_files = [f for f in datasets if f.filename in names]
+    region = BoundingBoxArray(xmin + EDGE_TOLERANCE, ymin + EDGE_TOLERANCE,
+                              xmax - EDGE_TOLERANCE, ymax - EDGE_TOLERANCE)
+
+    return [datasets[i] for i in index.query(region)]
 
-    return matching_files
+def find_matching_files(base_file, datasets, nx, ny, index=None):
+    """
+    Find files within nx, ny 1 km tiles of the lower left corner of a base
+    file, as for EarthScope survey tiles.
+
+    Uses a spatial index over file footprints rather than survey naming
+    conventions, so any tiling can be searched.
+    """
+
+    if index is None:
+        index = build_tile_index(datasets)
 
-def expand_to_contiguous_grids(base_file, nrows, ncols):
+    llx = base_file.ulx
+    lly = base_file.lry
+
+    return query_region(index, datasets, llx - nx*1000, lly - ny*1000,
+                        llx + nx*1000, lly + ny*1000)
+
+def expand_to_contiguous_grids(base_file, nrows, ncols, datasets, index=None):
     """
     Find all contiguous grids within nrows, cols of a central grid.
 
     Assumes grids are saved in a projection with bounding box information.
     """
 
-    contiguous_grids = []
-    for i in xrange(-nrows/2, nrows/2):
-        for j in xrange(-ncols/2, ncols/2):
-            this_llx = base_file.llx + 1000*j
-            this_lly = base_file.lly + 1000*i
-            this_file = [d for d in datasets if d.llx == this_llx and d.lly == this_lly] 
-            if len(this_file) != 0:
-                contiguous_grids.append(this_file[0])
-     
-    return contiguous_grids
+    if index is None:
+        index = build_tile_index(datasets)
+
+    llx = base_file.ulx
+    lly = base_file.lry
+
+    return query_region(index, datasets,
+                        llx - 1000*(ncols//2), lly - 1000*(nrows//2),
+                        llx + 1000*(ncols//2), lly + 1000*(nrows//2))
 
 def form_dataset_name(code, llx, lly, working_dir='/media/rmsare/data/ot_data/'):
     """
@@ -115,19 +134,6 @@ def form_dataset_name(code, llx, lly, working_dir='/media/rmsare/data/ot_data/')
 
     return working_dir + code + str(llx / 1000) + '_' + str(lly / 1000)
 
-def merge_grids(files, outfilename='merged.tif', nodata_value='-9999', working_dir='/media/rmsare/data/fixed_merged_data/'):
-    # TODO: fix gdal_merge argv
-    #sys.argv = ['-o', outfilename, '-init', nodata_value, '-a_nodata', nodata_value] + filenames
-    #print("Merging:")
-    #print([f.filename.split('/')[-1] for f in files])
-
-    # TODO: add file parameter, don't hard-code ArcInfo grid file
-    sys.argv = [f.filename + '/w001001.adf' for f in files]
-    gdal_merge.main()
-    
-    for f in files:
-        f.times_processed += 1
-
 def list_files_from_url(url):
     """
     List all files and folders from a remote directory. Ignores hidden files.
@@ -192,7 +198,6 @@ class file_info:
         f = gdal.Open(filename)
 
         self.filename = filename
-        self.times_processed = 0
 
         self.xsize = f.RasterXSize
         self.ysize = f.RasterYSize
@@ -206,40 +211,55 @@ class file_info:
         self.llx = self.lrx
         self.lly = self.uly
 
+    @classmethod
+    def from_record(cls, record):
+        """ Create from a tile catalog record without opening the file """
+        info = cls.__new__(cls)
+
+        info.filename = record.path
+
+        info.xsize = record.nx
+        info.ysize = record.ny
+        info.projection = record.projection
+        ulx = record.xmin if record.dx > 0 else record.xmax
+        uly = record.ymax if record.dy < 0 else record.ymin
+        info.geotransform = (ulx, record.dx, 0, uly, 0, record.dy)
+
+        info.ulx = info.geotransform[0]
+        info.uly = info.geotransform[3]
+        info.lrx = info.ulx + record.dx*record.nx
+        info.lry = info.uly + record.dy*record.ny
+        info.llx = info.lrx
+        info.lly = info.uly
+
+        return info
+
 def merge_datasets(datasets,
           nrows=10,
           ncols=8,
           dest_dir='/media/rmsare/data/ot_data/',
-          working_dir='/media/rmsare/data/fixed_merged_data/'):
-
-    #base_url = 'https://cloud.sdsc.edu/v1/AUTH_opentopography/Raster/SoCAL/SoCAL_be/'
-
-    base_file = datasets[0]
-    processed = np.array([x.times_processed >= 2 for x in datasets])
-
-    while not processed.all():
-        base_file = datasets[np.logical_not(processed)][0]
-        files_to_merge = expand_to_contiguous_grids(base_file, nrows, ncols)
-        files_to_merge = [f for f in files_to_merge if f.times_processed < 2]
-        
-        print("Merging rasters...")
-        print("Base raster: " + base_file.filename)
-                
-        merged_filename = working_dir + base_file.filename.split('/')[-1] + '_merged.tif'
-        if not os.path.exists(merged_filename) and len(files_to_merge) > 1:
-            print("Merging " + str(len(files_to_merge)) + " files")
-            merge_grids(files_to_merge)
-            print("Saving merged file...")
-            shutil.move('out.tif', merged_filename)
-        else:
-            for f in files_to_merge:
-                f.times_processed += 1
-            print("Merged file exists or no unprocessed files to merge. Moving on to next grid...")
-        
-        # XXX: bug here - what if base_filename alternates between two files?
-        base_file.times_processed += 1
-        processed = np.array([x.times_processed >= 2 for x in datasets])
-        #delete_files(files_to_merge)
+          working_dir='/media/rmsare/data/fixed_merged_data/',
+          max_workers=None):
+    """
+    Merge 1 km tiles into mosaics of nrows x ncols tiles, overlapping by one
+    tile on each side.
+
+    Mosaics are planned up front from the tile catalog and built in parallel.
+    Mosaics whose input tiles have not changed are skipped.
+    """
+
+    with TileCatalog(os.path.join(dest_dir, CATALOG_NAME)) as catalog:
+        catalog.update([f.filename for f in datasets])
+        records = dict((r.path, r) for r in catalog.tiles())
+    tiles = [records[os.path.abspath(f.filename)] for f in datasets]
+
+    jobs = plan_mosaics(tiles, 1000*ncols, 1000*nrows, overlap=1000)
+    print("Planned " + str(len(jobs)) + " mosaics")
+
+    built = build_mosaics(jobs, working_dir, max_workers=max_workers)
+    print("Built " + str(len(built)) + " mosaics, " + str(len(jobs) - len(built)) + " up to date")
+
+    return built
 
 if __name__ == "__main__":
     datasets = download_datasets()
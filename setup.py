@@ -32,5 +32,9 @@ setuptools.setup(
         "pyfftw",
         "rasterio",
         "scipy"
-    ]
+    ],
+    extras_require={
+        "zarr": ["zarr"],
+        "download": ["requests"]
+    }
 )